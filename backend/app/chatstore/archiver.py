@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import time
+
+from redis.exceptions import RedisError, WatchError
+
+from app.langgraph.memory import checkpointer
+from app.utils.config import (
+    SESSION_ACTIVITY_KEY,
+    ARCHIVE_AFTER_SECONDS,
+    ARCHIVE_INTERVAL_SECONDS,
+    ARCHIVE_BATCH_SIZE,
+)
+from app.utils.metrics import Counter
+from .cold_store import cold_store
+from .cursor import chat_cursor
+from .connection import redis_manager
+from .sharding import index_router
+
+logger = logging.getLogger(__name__)
+
+SESSIONS_ARCHIVED = Counter(
+    "sessions_archived_total",
+    "Idle chat sessions by archive outcome (archived, gone, touched)",
+    ["outcome"],
+)
+
+LOCK_KEY = f"{SESSION_ACTIVITY_KEY}:archiver_lock"
+
+# KEYS[1]: activity index; ARGV: document key, last active -> 1 removed, 0 touched since
+_FORGET = """
+local score = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if score and tonumber(score) <= tonumber(ARGV[2]) then
+  return redis.call('ZREM', KEYS[1], ARGV[1])
+end
+return 0
+"""
+_forget_script = None
+
+
+async def backfill_activity():
+    """Give documents saved before activity tracking a last-active time of now."""
+    client = redis_manager.aio(decode=False)
+    now = time.time()
+    added = 0
+    batch = {}
+    for pattern in index_router.key_patterns:
+        async for key in client.scan_iter(match=pattern, count=500, _type="hash"):
+            batch[key] = now
+            if len(batch) >= 500:
+                added += await client.zadd(SESSION_ACTIVITY_KEY, batch, nx=True)
+                batch = {}
+    if batch:
+        added += await client.zadd(SESSION_ACTIVITY_KEY, batch, nx=True)
+    if added:
+        logger.info("Tracking activity for %d pre-existing chat sessions", added)
+
+
+async def archive_session(key: bytes, last_active: float) -> str:
+    """Copy one idle document to the cold store, then drop it (and its checkpoint) from Redis.
+
+    The delete is a WATCHed transaction: a session written to while being
+    archived stays in Redis, and the cold copy is discarded.
+    """
+    client = redis_manager.aio(decode=False)
+    name = key.decode()
+    async with client.pipeline(transaction=True) as pipe:
+        try:
+            # Every save/rehydration writes the document itself, so watching it is enough.
+            # The transaction holds only the document: on a cluster the activity index is
+            # in another slot, so it is read and cleaned up outside of it.
+            await pipe.watch(key)
+            doc = await pipe.hgetall(key)
+            if doc and await client.zscore(SESSION_ACTIVITY_KEY, key) != last_active:
+                return "touched"
+            if doc:
+                await asyncio.to_thread(cold_store.put, name, doc, last_active)
+                pipe.multi()
+                pipe.delete(key)
+                await pipe.execute()
+        except WatchError:
+            await asyncio.to_thread(cold_store.delete, name)
+            return "touched"
+
+    global _forget_script
+    if _forget_script is None:
+        _forget_script = client.register_script(_FORGET)
+    # Left in place if a save touched the session after the document was dropped
+    await _forget_script(keys=[SESSION_ACTIVITY_KEY], args=[key, last_active])
+    if not doc:
+        return "gone"  # expired by SESSION_IDLE_TTL_SECONDS or deleted
+
+    # Chat documents and checkpoint threads share the "agent:user:session" id
+    thread_id = index_router.thread_id(name)
+    if thread_id:
+        await checkpointer.adelete_thread(thread_id)
+        # The cursor counts the checkpoint's messages: a rehydrated session starts over at 0
+        await chat_cursor.delete(thread_id)
+    return "archived"
+
+
+async def archive_idle_sessions(idle_seconds: float = ARCHIVE_AFTER_SECONDS, limit: int = ARCHIVE_BATCH_SIZE) -> int:
+    client = redis_manager.aio(decode=False)
+    cutoff = time.time() - idle_seconds
+    idle = await client.zrangebyscore(SESSION_ACTIVITY_KEY, "-inf", cutoff, start=0, num=limit, withscores=True)
+    archived = 0
+    for key, last_active in idle:
+        outcome = await archive_session(key, last_active)
+        SESSIONS_ARCHIVED.labels(outcome=outcome).inc()
+        archived += outcome == "archived"
+    return archived
+
+
+async def run_archiver(interval: float = ARCHIVE_INTERVAL_SECONDS):
+    """Background loop started from the app lifespan; one worker archives at a time."""
+    client = redis_manager.aio()
+    backfilled = False
+    while True:
+        try:
+            # Lock for one interval: whichever worker gets it does this round
+            if await client.set(LOCK_KEY, "1", nx=True, ex=max(1, int(interval))):
+                if not backfilled:
+                    await backfill_activity()
+                    backfilled = True
+                while (archived := await archive_idle_sessions()) >= ARCHIVE_BATCH_SIZE:
+                    logger.info("Archived %d idle sessions, continuing", archived)
+                if archived:
+                    logger.info("Archived %d idle sessions", archived)
+        except RedisError as e:
+            logger.warning("Session archiver round failed: %s", e)
+        await asyncio.sleep(interval)
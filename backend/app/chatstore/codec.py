@@ -0,0 +1,167 @@
+"""Storage encoding for chat transcripts.
+
+Transcripts used to be stored as verbose JSON in the ``text`` hash field. The
+compact format goes in the ``transcript`` field instead: a small versioned
+header followed by msgpack rows, zstd-compressed above a size threshold.
+Readers accept both, so documents written before the switch stay readable.
+A compact value is a sequence of frames, so a turn is stored by appending its
+own frame instead of re-encoding the whole transcript.
+"""
+import json
+import struct
+from typing import Any, Mapping, Union
+
+import ormsgpack
+
+from app.utils.config import TRANSCRIPT_FORMAT, TRANSCRIPT_ZSTD_MIN_BYTES, TRANSCRIPT_ZSTD_LEVEL
+
+try:
+    import zstandard
+except ImportError:  # compact transcripts are then written uncompressed
+    zstandard = None
+
+TRANSCRIPT_FIELD = "transcript"  # compact documents
+TEXT_FIELD = "text"  # JSON documents
+TRANSCRIPT_FIELDS = (TRANSCRIPT_FIELD, TEXT_FIELD)
+
+# ─── Wire format ────────────────────────────────────────
+# Frame: MAGIC (2 bytes) | version (1 byte) | flags (1 byte) | payload length
+# (4 bytes, big-endian) | msgpack payload. A value is one or more frames,
+# their rows concatenated; version 1 values are a single frame without the
+# length, whose payload runs to the end.
+# 0xC1 is never emitted by msgpack and cannot start UTF-8 text, so a compact
+# value can't be mistaken for a JSON one.
+MAGIC = b"\xc1T"
+VERSION = 2
+FLAG_ZSTD = 0x01
+_HEADER_SIZE = len(MAGIC) + 2
+_LENGTH = struct.Struct(">I")
+# What a value must start with for a frame to be appended to it
+APPENDABLE_PREFIX = MAGIC + bytes((VERSION,))
+
+# Version 1 payload: a list of rows. The two shapes messages_to_entries writes
+# become [kind, text] (plus a dict of extra fields, e.g. cancelled); anything
+# else is kept as-is in a RAW row.
+RAW, USER, ASSISTANT = 0, 1, 2
+
+Value = Union[bytes, str, None]
+
+
+def _single_text_part(text: Any) -> bool:
+    return (
+        isinstance(text, list)
+        and len(text) == 1
+        and isinstance(text[0], dict)
+        and text[0].keys() == {"type", "text"}
+        and text[0]["type"] == "text"
+        and isinstance(text[0]["text"], str)
+    )
+
+
+def _compact(entry: dict) -> list:
+    text = entry.get("text")
+    if entry.get("type") == "text" and entry.get("role") == "user" and isinstance(text, str):
+        row = [USER, text]
+    elif entry.get("type") == "text" and entry.get("role") == "assistant" and _single_text_part(text):
+        row = [ASSISTANT, text[0]["text"]]
+    else:
+        return [RAW, entry]
+    extra = {k: v for k, v in entry.items() if k not in ("role", "type", "text")}
+    if extra:
+        row.append(extra)
+    return row
+
+
+def _expand(row: list) -> dict:
+    kind = row[0]
+    if kind == RAW:
+        return row[1]
+    if kind == USER:
+        entry = {"role": "user", "type": "text", "text": row[1]}
+    elif kind == ASSISTANT:
+        entry = {"role": "assistant", "type": "text", "text": [{"type": "text", "text": row[1]}]}
+    else:
+        raise ValueError(f"unknown transcript row kind {kind}")
+    if len(row) > 2:
+        entry.update(row[2])
+    return entry
+
+
+def encode_transcript(
+    entries: list[dict],
+    zstd_min_bytes: int = TRANSCRIPT_ZSTD_MIN_BYTES,
+    zstd_level: int = TRANSCRIPT_ZSTD_LEVEL,
+) -> bytes:
+    payload = ormsgpack.packb([_compact(e) for e in entries])
+    flags = 0
+    if zstandard is not None and zstd_min_bytes and len(payload) >= zstd_min_bytes:
+        payload = zstandard.ZstdCompressor(level=zstd_level).compress(payload)
+        flags |= FLAG_ZSTD
+    return MAGIC + bytes((VERSION, flags)) + _LENGTH.pack(len(payload)) + payload
+
+
+def is_compact(value: Value) -> bool:
+    return isinstance(value, (bytes, bytearray, memoryview)) and bytes(value[:2]) == MAGIC
+
+
+def decode_transcript(value: Value) -> list[dict]:
+    """Entries of a stored transcript in either format ([] when empty)."""
+    if not value:
+        return []
+    if not is_compact(value):
+        return json.loads(value)
+    value = bytes(value)
+    entries, position = [], 0
+    while position < len(value):
+        if value[position:position + len(MAGIC)] != MAGIC:
+            raise ValueError(f"corrupt transcript frame at byte {position}")
+        version, flags = value[position + 2], value[position + 3]
+        start = position + _HEADER_SIZE
+        if version == 1 and position == 0:
+            end = len(value)
+        elif version == VERSION:
+            (length,) = _LENGTH.unpack_from(value, start)
+            start += _LENGTH.size
+            end = start + length
+        else:
+            raise ValueError(f"unsupported transcript version {version}")
+        payload = value[start:end]
+        if flags & FLAG_ZSTD:
+            if zstandard is None:
+                raise RuntimeError("transcript is zstd-compressed but zstandard is not installed")
+            payload = zstandard.ZstdDecompressor().decompress(payload)
+        entries += [_expand(row) for row in ormsgpack.unpackb(payload)]
+        position = end
+    return entries
+
+
+def transcript_json(value: Value) -> str:
+    """JSON text of a stored transcript; JSON values are returned without re-encoding."""
+    if not value:
+        return "[]"
+    if is_compact(value):
+        return json.dumps(decode_transcript(value), ensure_ascii=False)
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def transcript_fields(entries: list[dict], fmt: str = TRANSCRIPT_FORMAT) -> dict[str, Union[bytes, str]]:
+    """Hash mapping that stores ``entries`` in the configured format."""
+    if fmt == "json":
+        return {TEXT_FIELD: json.dumps(entries, ensure_ascii=False)}
+    return {TRANSCRIPT_FIELD: encode_transcript(entries)}
+
+
+def write_transcript(pipe, key: str, entries: list[dict], fmt: str = TRANSCRIPT_FORMAT):
+    """Queue the HSET of ``entries`` on ``pipe``, dropping the field of the other format."""
+    fields = transcript_fields(entries, fmt)
+    pipe.hset(key, mapping=fields)
+    pipe.hdel(key, *(f for f in TRANSCRIPT_FIELDS if f not in fields))
+
+
+def document_transcript(doc: Mapping) -> Value:
+    """Stored transcript value of a chat hash (HGETALL result with str or bytes keys)."""
+    for field in TRANSCRIPT_FIELDS:
+        value = doc.get(field) or doc.get(field.encode())
+        if value:
+            return value
+    return None
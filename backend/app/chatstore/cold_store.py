@@ -0,0 +1,167 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Optional
+
+from app.utils.config import COLD_STORE_PATH, SESSION_ACTIVITY_KEY, SESSION_IDLE_TTL_SECONDS
+from app.utils.metrics import Counter
+from .codec import TRANSCRIPT_FIELDS, decode_transcript, document_transcript, transcript_fields, transcript_json
+from .connection import redis_manager
+
+logger = logging.getLogger(__name__)
+
+SESSION_REHYDRATIONS = Counter(
+    "session_rehydrations_total",
+    "Chat sessions restored from the cold store into Redis",
+)
+
+# ─── SQLite cold store ──────────────────────────────────
+# One row per archived chat document. The transcript is kept as zlib-compressed
+# JSON whatever its Redis encoding, so the archive never depends on the codec
+# version; the vector is kept as raw float32 bytes so a restored session is
+# searchable again.
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    key          TEXT PRIMARY KEY,
+    agent        TEXT,
+    user_id      TEXT,
+    session_id   TEXT,
+    last_active  REAL,
+    archived_at  REAL,
+    text_z       BLOB,
+    embedding    BLOB,
+    fields       TEXT
+)
+"""
+
+
+class ColdStore:
+    def __init__(self, path: str = COLD_STORE_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Opened on first use so importing never touches the disk
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def put(self, key: str, doc: dict[bytes, bytes], last_active: float):
+        """Store a raw HGETALL result."""
+        skip = {f.encode() for f in TRANSCRIPT_FIELDS} | {b"embedding"}
+        fields = {k.decode(): v.decode() for k, v in doc.items() if k not in skip}
+        row = (
+            key,
+            fields.get("agent"),
+            fields.get("user_id"),
+            fields.get("session_id"),
+            last_active,
+            time.time(),
+            zlib.compress(transcript_json(document_transcript(doc)).encode(), 6),
+            doc.get(b"embedding"),
+            json.dumps(fields, ensure_ascii=False),
+        )
+        with self._lock:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+            conn.commit()
+
+    def get(self, key: str) -> Optional[dict]:
+        """The stored document as a Redis mapping, or None."""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT text_z, embedding, fields FROM sessions WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        text_z, embedding, fields = row
+        doc = json.loads(fields)
+        doc["text"] = zlib.decompress(text_z).decode()
+        if embedding is not None:
+            doc["embedding"] = embedding
+        return doc
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            conn = self._connect()
+            deleted = conn.execute("DELETE FROM sessions WHERE key = ?", (key,)).rowcount
+            conn.commit()
+        return deleted > 0
+
+    def rekey(self, key_fn) -> int:
+        """Re-key rows with ``key_fn(agent, user_id, session_id)``; returns the rows changed."""
+        changed = 0
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute("SELECT key, agent, user_id, session_id FROM sessions").fetchall()
+            for key, agent, user_id, session_id in rows:
+                new_key = key_fn(agent, user_id, session_id)
+                if session_id is not None and new_key != key:
+                    changed += conn.execute("UPDATE OR IGNORE sessions SET key = ? WHERE key = ?", (new_key, key)).rowcount
+            conn.commit()
+        return changed
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+cold_store = ColdStore()
+
+
+# ─── Activity ───────────────────────────────────────────
+def touch_session(pipe, key: str):
+    """Queue the bookkeeping for an active chat document on ``pipe``.
+
+    Records the access in the activity index the archiver scans and, when
+    SESSION_IDLE_TTL_SECONDS is set, pushes back the document's expiry.
+    """
+    pipe.zadd(SESSION_ACTIVITY_KEY, {key: time.time()})
+    if SESSION_IDLE_TTL_SECONDS:
+        pipe.expire(key, SESSION_IDLE_TTL_SECONDS)
+
+
+async def rehydrate(key: str) -> Optional[str]:
+    """Move an archived session back into Redis; returns its transcript, or None if unknown."""
+    doc = await asyncio.to_thread(cold_store.get, key)
+    if doc is None:
+        return None
+    text = doc.pop("text")
+    doc.update(transcript_fields(decode_transcript(text)))
+    client = redis_manager.aio(decode=False)
+    # Not a transaction: the activity index is in another slot on a cluster
+    async with client.pipeline(transaction=False) as pipe:
+        pipe.hset(key, mapping=doc)
+        touch_session(pipe, key)
+        await pipe.execute()
+    await asyncio.to_thread(cold_store.delete, key)
+    SESSION_REHYDRATIONS.inc()
+    logger.info("Rehydrated archived session %s", key)
+    return text
+
+
+async def forget_sessions(keys: list[str]) -> list[str]:
+    """Drop the archived copies and activity entries of deleted chat documents.
+
+    Otherwise the next read would rehydrate the archived copy, and the archiver
+    would keep finding the key in the activity index. Returns the keys that
+    had an archived copy.
+    """
+    await redis_manager.aio().zrem(SESSION_ACTIVITY_KEY, *keys)
+    archived = []
+    for key in keys:
+        if await asyncio.to_thread(cold_store.delete, key):
+            archived.append(key)
+    return archived
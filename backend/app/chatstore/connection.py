@@ -0,0 +1,241 @@
+import time
+import threading
+from collections import defaultdict
+from typing import Iterable, Union
+
+from redis import Redis, BlockingConnectionPool
+from redis.asyncio import Redis as AsyncRedis, BlockingConnectionPool as AsyncBlockingConnectionPool
+from redis.asyncio.cluster import RedisCluster as AsyncRedisCluster
+from redis.asyncio.retry import Retry as AsyncRetry
+from redis.backoff import ExponentialBackoff
+from redis.cluster import RedisCluster
+from redis.crc import key_slot
+from redis.exceptions import ConnectionError, TimeoutError
+from redis.retry import Retry
+
+from app.utils.config import (
+    REDIS_URL,
+    REDIS_CLUSTER,
+    REDIS_MAX_CONNECTIONS,
+    REDIS_POOL_TIMEOUT,
+    REDIS_SOCKET_TIMEOUT,
+    REDIS_SOCKET_CONNECT_TIMEOUT,
+    REDIS_HEALTH_CHECK_INTERVAL,
+    REDIS_RETRY_ATTEMPTS,
+    REDIS_RETRY_BACKOFF_BASE,
+    REDIS_RETRY_BACKOFF_CAP,
+)
+from app.utils.metrics import Gauge, Histogram
+
+REDIS_POOL_WAIT = Histogram(
+    "redis_pool_wait_seconds",
+    "Time spent waiting for a pooled Redis connection",
+    ["pool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+REDIS_POOL_IN_USE = Gauge("redis_pool_connections_in_use", "Checked-out Redis connections", ["pool"])
+REDIS_POOL_MAX = Gauge("redis_pool_connections_max", "Configured Redis pool size", ["pool"])
+
+
+# ─── Instrumented pools ─────────────────────────────────
+class _InstrumentedPool(BlockingConnectionPool):
+    pool_name = "sync"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.in_use = 0
+        self._count_lock = threading.Lock()
+
+    def get_connection(self, *args, **kwargs):
+        start = time.perf_counter()
+        connection = super().get_connection(*args, **kwargs)
+        REDIS_POOL_WAIT.labels(pool=self.pool_name).observe(time.perf_counter() - start)
+        with self._count_lock:
+            self.in_use += 1
+        return connection
+
+    def release(self, connection):
+        with self._count_lock:
+            self.in_use = max(0, self.in_use - 1)
+        super().release(connection)
+
+
+class _AsyncInstrumentedPool(AsyncBlockingConnectionPool):
+    pool_name = "async"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.in_use = 0
+
+    async def get_connection(self, *args, **kwargs):
+        start = time.perf_counter()
+        connection = await super().get_connection(*args, **kwargs)
+        REDIS_POOL_WAIT.labels(pool=self.pool_name).observe(time.perf_counter() - start)
+        self.in_use += 1
+        return connection
+
+    async def release(self, connection):
+        self.in_use = max(0, self.in_use - 1)
+        await super().release(connection)
+
+
+# ─── Manager ────────────────────────────────────────────
+class RedisConnectionManager:
+    """One set of Redis pools per process, shared by every module.
+
+    Four views are exposed: sync/async x decoded/raw. decode_responses is a
+    per-connection setting in redis-py, so each view owns exactly one pool and
+    every caller of that view shares it. Pools are created lazily, so importing
+    this module never touches the network.
+
+    With ``cluster`` the views are RedisCluster clients instead: REDIS_URL is
+    any node, every node gets its own pool of ``max_connections``, and commands
+    are routed by key slot (see ``hash_tag`` for keys that must share one).
+    """
+
+    def __init__(
+        self,
+        url: str = REDIS_URL,
+        *,
+        max_connections: int = REDIS_MAX_CONNECTIONS,
+        pool_timeout: float = REDIS_POOL_TIMEOUT,
+        cluster: bool = REDIS_CLUSTER,
+        name: str = "",
+    ):
+        self.url = url
+        self.cluster = cluster
+        self.name = name  # prefixes the pool metric labels (e.g. of a replica)
+        self.max_connections = max_connections
+        self.pool_timeout = pool_timeout
+        self._clients: dict[tuple[str, bool], object] = {}
+        self._lock = threading.Lock()
+
+    def _connection_kwargs(self, retry) -> dict:
+        return {
+            "socket_timeout": REDIS_SOCKET_TIMEOUT,
+            "socket_connect_timeout": REDIS_SOCKET_CONNECT_TIMEOUT,
+            "socket_keepalive": True,
+            "health_check_interval": REDIS_HEALTH_CHECK_INTERVAL,
+            "retry": retry,
+            "retry_on_error": [ConnectionError, TimeoutError],
+        }
+
+    def _backoff(self) -> ExponentialBackoff:
+        return ExponentialBackoff(cap=REDIS_RETRY_BACKOFF_CAP, base=REDIS_RETRY_BACKOFF_BASE)
+
+    def _register(self, name: str, pool):
+        name = f"{self.name}_{name}" if self.name else name
+        pool.pool_name = name
+        REDIS_POOL_IN_USE.labels(pool=name).set_function(lambda: pool.in_use)
+        REDIS_POOL_MAX.labels(pool=name).set(self.max_connections)
+
+    def _cluster_client(self, cls, decode: bool, retry):
+        # Node pools are created by the cluster client; only their size is reported
+        REDIS_POOL_MAX.labels(pool=f"cluster_{'decoded' if decode else 'raw'}").set(self.max_connections)
+        return cls.from_url(
+            self.url,
+            max_connections=self.max_connections,
+            decode_responses=decode,
+            **self._connection_kwargs(retry),
+        )
+
+    def sync(self, decode: bool = True) -> Union[Redis, RedisCluster]:
+        key = ("sync", decode)
+        if key not in self._clients:
+            with self._lock:
+                if key not in self._clients and self.cluster:
+                    self._clients[key] = self._cluster_client(
+                        RedisCluster, decode, Retry(self._backoff(), REDIS_RETRY_ATTEMPTS)
+                    )
+                if key not in self._clients:
+                    pool = _InstrumentedPool.from_url(
+                        self.url,
+                        max_connections=self.max_connections,
+                        timeout=self.pool_timeout,
+                        decode_responses=decode,
+                        **self._connection_kwargs(Retry(self._backoff(), REDIS_RETRY_ATTEMPTS)),
+                    )
+                    self._register(f"sync_{'decoded' if decode else 'raw'}", pool)
+                    self._clients[key] = Redis(connection_pool=pool)
+        return self._clients[key]
+
+    def aio(self, decode: bool = True) -> Union[AsyncRedis, AsyncRedisCluster]:
+        key = ("async", decode)
+        if key not in self._clients:
+            with self._lock:
+                if key not in self._clients and self.cluster:
+                    self._clients[key] = self._cluster_client(
+                        AsyncRedisCluster, decode, AsyncRetry(self._backoff(), REDIS_RETRY_ATTEMPTS)
+                    )
+                if key not in self._clients:
+                    pool = _AsyncInstrumentedPool.from_url(
+                        self.url,
+                        max_connections=self.max_connections,
+                        timeout=self.pool_timeout,
+                        decode_responses=decode,
+                        **self._connection_kwargs(AsyncRetry(self._backoff(), REDIS_RETRY_ATTEMPTS)),
+                    )
+                    self._register(f"async_{'decoded' if decode else 'raw'}", pool)
+                    self._clients[key] = AsyncRedis(connection_pool=pool)
+        return self._clients[key]
+
+    async def ping(self) -> bool:
+        return bool(await self.aio().ping())
+
+    async def aclose(self):
+        # Pools stay registered (modules keep their client objects); they reconnect on demand
+        for (flavor, _), client in list(self._clients.items()):
+            if isinstance(client, AsyncRedisCluster):
+                await client.aclose()  # re-initialized by its next command
+            elif isinstance(client, RedisCluster):
+                client.disconnect_connection_pools()
+            elif flavor == "async":
+                await client.connection_pool.disconnect()
+            else:
+                client.connection_pool.disconnect()
+
+
+redis_manager = RedisConnectionManager()
+
+
+# ─── Cluster helpers ────────────────────────────────────
+def hash_tag(value) -> str:
+    """``{value}`` in cluster mode, so every key built around it lands in one slot.
+
+    Used for the ids that several keys are built from (a chat session, the
+    admission prefix); single-node deployments keep their untagged keys.
+    """
+    return f"{{{value}}}" if redis_manager.cluster else str(value)
+
+
+def untag(value: str) -> str:
+    """Inverse of ``hash_tag``."""
+    return value[1:-1] if value.startswith("{") and value.endswith("}") else value
+
+
+def slot_groups(keys: Iterable[Union[str, bytes]]) -> list[list]:
+    """Keys grouped by cluster slot (one group when not clustered)."""
+    keys = list(keys)
+    if not redis_manager.cluster:
+        return [keys] if keys else []
+    groups = defaultdict(list)
+    for key in keys:
+        groups[key_slot(key.encode() if isinstance(key, str) else key)].append(key)
+    return list(groups.values())
+
+
+async def unlink_keys(client, keys: Iterable[Union[str, bytes]], batch: int = 500) -> int:
+    """UNLINK any number of keys: one command per slot and batch, pipelined per node."""
+    removed = 0
+    async with client.pipeline(transaction=False) as pipe:
+        queued = 0
+        for group in slot_groups(keys):
+            for i in range(0, len(group), batch):
+                pipe.unlink(*group[i:i + batch])
+                queued += 1
+                if queued >= batch:
+                    removed += sum(await pipe.execute())
+                    queued = 0
+        if queued:
+            removed += sum(await pipe.execute())
+    return removed
@@ -0,0 +1,153 @@
+import logging
+
+from app.utils.config import CHAT_CURSOR_PREFIX, CHAT_CURSOR_RECENT_IDS, CHECKPOINT_TTL_SECONDS
+from app.utils.metrics import Counter
+from .connection import hash_tag, redis_manager, unlink_keys
+
+logger = logging.getLogger(__name__)
+
+CHAT_DELTA_MESSAGES = Counter(
+    "chat_delta_messages_total",
+    "Messages of delta chat requests by outcome (accepted, duplicate, rewound)",
+    ["outcome"],
+)
+CHAT_DELTA_CONFLICTS = Counter(
+    "chat_delta_conflicts_total",
+    "Delta chat requests rejected because their base version was not the session's",
+)
+
+# ─── Lua ────────────────────────────────────────────────
+# A session's cursor is its version (messages accepted so far) plus the ids of
+# the most recent ones, scored by their position. Checking the base version and
+# advancing it is one script, so two tabs posting to the same session can't
+# both build on the same version.
+
+# KEYS: cursor hash, recent id set; ARGV: base version, ttl s, ids kept, message ids...
+# -> {1, version, accepted positions...} or {0, version} on a base mismatch
+_ADVANCE = """
+local version = tonumber(redis.call('HGET', KEYS[1], 'version') or '0')
+local fresh, seen, known = {}, {}, 0
+for i = 4, #ARGV do
+  local id = ARGV[i]
+  if redis.call('ZSCORE', KEYS[2], id) then
+    known = known + 1
+  elseif not seen[id] then
+    seen[id] = true
+    table.insert(fresh, i - 4)
+  end
+end
+if tonumber(ARGV[1]) + known ~= version then
+  return {0, version}
+end
+local result = {1, 0}
+for _, pos in ipairs(fresh) do
+  version = version + 1
+  redis.call('ZADD', KEYS[2], version, ARGV[pos + 4])
+  table.insert(result, pos)
+end
+result[2] = version
+if #fresh > 0 then
+  redis.call('HSET', KEYS[1], 'version', version)
+  redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -tonumber(ARGV[3]) - 1)
+end
+local ttl = tonumber(ARGV[2])
+if ttl > 0 then
+  redis.call('EXPIRE', KEYS[1], ttl)
+  redis.call('EXPIRE', KEYS[2], ttl)
+end
+return result
+"""
+
+# KEYS: cursor hash, recent id set; ARGV: version to undo, version before it, message ids...
+# -> 1 rewound, 0 the session has moved on since (the later delta was built on this one)
+_REWIND = """
+local version = tonumber(redis.call('HGET', KEYS[1], 'version') or '0')
+if version ~= tonumber(ARGV[1]) then
+  return 0
+end
+for i = 3, #ARGV do
+  redis.call('ZREM', KEYS[2], ARGV[i])
+end
+redis.call('HSET', KEYS[1], 'version', ARGV[2])
+return 1
+"""
+
+
+class CursorConflict(Exception):
+    """The request was built on another version of the session than the stored one."""
+
+    def __init__(self, version: int):
+        self.version = version
+        super().__init__(f"base version does not match the session (current version {version})")
+
+
+class ChatCursor:
+    """Per-session cursor of the delta request protocol.
+
+    In delta mode the client sends only the messages it added since
+    ``base_version``, each with a stable id. Messages whose id the session
+    already holds (a retried request, or an overlap) are dropped; the base
+    version plus those duplicates must equal the stored version, otherwise the
+    client is out of sync and gets the current version back. The cursor
+    expires with the graph checkpoint (CHECKPOINT_TTL_SECONDS), whose messages
+    it counts.
+    """
+
+    def __init__(self, prefix: str = CHAT_CURSOR_PREFIX, recent_ids: int = CHAT_CURSOR_RECENT_IDS,
+                 ttl: int = CHECKPOINT_TTL_SECONDS):
+        self.prefix = prefix
+        self.recent_ids = max(1, recent_ids)
+        self.ttl = ttl
+        self._script = None
+        self._rewind_script = None
+
+    def _keys(self, thread_id: str) -> list[str]:
+        tag = hash_tag(thread_id)  # the script needs both keys in one slot
+        return [f"{self.prefix}:{tag}", f"{self.prefix}:{tag}:ids"]
+
+    async def advance(self, thread_id: str, base_version: int, message_ids: list[str]) -> tuple[int, list[int]]:
+        """Accept a delta; returns the new version and the positions of the messages to run.
+
+        Raises CursorConflict when ``base_version`` is not the session's.
+        """
+        if self._script is None:
+            self._script = redis_manager.aio().register_script(_ADVANCE)
+        ok, version, *accepted = await self._script(
+            keys=self._keys(thread_id),
+            args=[base_version, self.ttl, self.recent_ids, *message_ids],
+        )
+        if not ok:
+            CHAT_DELTA_CONFLICTS.inc()
+            raise CursorConflict(int(version))
+        CHAT_DELTA_MESSAGES.labels(outcome="accepted").inc(len(accepted))
+        CHAT_DELTA_MESSAGES.labels(outcome="duplicate").inc(len(message_ids) - len(accepted))
+        return int(version), [int(pos) for pos in accepted]
+
+    async def rewind(self, thread_id: str, version: int, message_ids: list[str]) -> bool:
+        """Undo the ``advance`` that accepted ``message_ids`` and reached ``version``.
+
+        Used when the turn is not persisted (the run failed or was cancelled),
+        so its retry is accepted instead of dropped as a duplicate. Ids trimmed
+        out of the recent set by that advance are not restored.
+        """
+        if self._rewind_script is None:
+            self._rewind_script = redis_manager.aio().register_script(_REWIND)
+        rewound = await self._rewind_script(
+            keys=self._keys(thread_id),
+            args=[version, version - len(message_ids), *message_ids],
+        )
+        if rewound:
+            CHAT_DELTA_MESSAGES.labels(outcome="rewound").inc(len(message_ids))
+        return bool(rewound)
+
+    async def delete(self, thread_id: str):
+        """Forget a session, along with its checkpoint (deleted or archived)."""
+        await redis_manager.aio().delete(*self._keys(thread_id))
+
+    async def clear(self) -> int:
+        client = redis_manager.aio()
+        keys = [key async for key in client.scan_iter(match=f"{self.prefix}:*", count=500)]
+        return await unlink_keys(client, keys)
+
+
+chat_cursor = ChatCursor()
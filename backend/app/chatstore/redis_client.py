@@ -1,108 +1,222 @@
 import os
 import json
+import logging
 import numpy as np
-import asyncio
-from redis import Redis
-from redis.asyncio import Redis as AsyncRedis
-from redisvl.index import SearchIndex, AsyncSearchIndex
+from typing import Optional
 from redisvl.query import VectorQuery
 from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
-from sentence_transformers import SentenceTransformer
-import redisvl
-
-# Debug version
-print(f"[Debug] redisvl version: {redisvl.__version__}")
-
-# Environment config
-os.environ["TOKENIZERS_PARALLELISM"] = "false"
-
-# Redis + Embedding config
-AGENT_NAME = os.getenv("AGENT_NAME", "core_agent")
-REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
-EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "384"))
-INDEX_NAME = os.getenv("INDEX_NAME", f"{AGENT_NAME}_index")
-KEY_PREFIX = os.getenv("KEY_PREFIX", f"{AGENT_NAME}_docs")
-EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
-TOOL_KEY_PREFIX = os.getenv("TOOL_KEY_PREFIX", "core_agent:data:tool:")
-_model = SentenceTransformer(EMBEDDING_MODEL)
-
-# RedisVL schema definition
-schema = {
-    "index": {"name": INDEX_NAME, "prefix": KEY_PREFIX},
-    "fields": [
-        {"name": "id", "type": "text"},
-        {"name": "text", "type": "text"},
-        {"name": "agent", "type": "tag"},
-        {"name": "user_id", "type": "tag"},
-        {"name": "session_id", "type": "tag"},
-        {
-            "name": "embedding",
-            "type": "vector",
-            "attrs": {
-                "dims": EMBEDDING_DIM,
-                "distance_metric": "cosine",
-                "algorithm": "flat",
-                "datatype": "float32"
-            }
-        }
-    ]
-}
+from app.utils.config import (
+    INDEX_NAME,
+    KEY_PREFIX,
+    TOOL_KEY_PREFIX,
+    INVENTORY_VERSION_KEY,
+    TRANSCRIPT_FORMAT,
+)
+from app.langgraph.memory import checkpointer, session_thread_id
+from app.utils.embedding import embedding_fn
+from .codec import (
+    APPENDABLE_PREFIX,
+    TRANSCRIPT_FIELDS,
+    TRANSCRIPT_FIELD,
+    decode_transcript,
+    encode_transcript,
+    transcript_json,
+    write_transcript,
+)
+from .cold_store import forget_sessions, rehydrate, touch_session
+from .connection import RedisConnectionManager, redis_manager
+from .cursor import chat_cursor
+from .replicas import read_router
+from .sharding import BASE_SHARD, chat_schema, index_router
+
+logger = logging.getLogger(__name__)
+
+# RedisVL schema of the unsharded index (shards use the same fields, see sharding.py)
+schema = chat_schema(INDEX_NAME, KEY_PREFIX)
+
+# Redis clients (shared pools)
+def get_redis_client():
+    return redis_manager.sync()
+
+def get_async_redis_client():
+    return redis_manager.aio()
 
-# Redis clients
-get_redis_client = lambda: Redis.from_url(REDIS_URL, decode_responses=True)
-get_async_redis_client = lambda: AsyncRedis.from_url(REDIS_URL, decode_responses=True)
 redis_client = get_redis_client()
 async_redis_client = get_async_redis_client()
-search_index = SearchIndex.from_dict(schema, redis_client=redis_client)
-async_search_index = AsyncSearchIndex.from_dict(schema, redis_client=async_redis_client)
 
 async def ensure_index_exists():
-    if not await async_search_index.exists():
-        await async_search_index.create(overwrite=True)
+    # Shards of the agent/hash layouts are created when first written to
+    if index_router.layout == "none":
+        await index_router.ensure(BASE_SHARD)
+
+def messages_to_entries(messages) -> list[dict]:
+    entries = []
+    for m in messages:
+        if isinstance(m, HumanMessage):
+            entries.append({"role": "user", "type": "text", "text": m.content})
+        elif isinstance(m, AIMessage):
+            entries.append({"role": "assistant", "type": "text", "text": [{"type": "text", "text": m.content}]})
+    return entries
 
-# Embedding
-embedding_fn_sync = lambda text: _model.encode(text).tolist()
-async def embedding_fn(text):
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, embedding_fn_sync, text)
+def entries_to_messages(entries) -> list[BaseMessage]:
+    """Inverse of messages_to_entries, for replaying a stored transcript into the graph."""
+    messages: list[BaseMessage] = []
+    for item in entries or []:
+        try:
+            if item["role"] == "user":
+                messages.append(HumanMessage(content=item["text"]))
+            elif item["role"] == "assistant":
+                text = item["text"]
+                if isinstance(text, list):
+                    text = "".join(part.get("text", "") for part in text if part.get("type") == "text")
+                messages.append(AIMessage(content=text))
+        except (KeyError, TypeError, AttributeError) as e:
+            logger.warning("Skipping unreadable history entry: %s", e)
+    return messages
 
 # Save chat
-async def save_chat_to_vector(agent, user_id, session_id, messages, embedding_fn=embedding_fn):
-    await ensure_index_exists()
+# The document vector is the running mean of its turns' vectors, so every
+# turn of the session stays searchable while only the new turn is embedded.
+# EMBEDDING_TURNS_FIELD counts the turns averaged (cosine ignores the scale).
+EMBEDDING_TURNS_FIELD = "embedding_turns"
 
-    doc_id = f"{agent}:{user_id}:{session_id}"
-    custom_key = f"{KEY_PREFIX}:{doc_id}"
+# KEYS: chat document; ARGV: transcript frame, APPENDABLE_PREFIX, transcript field[,
+#       new mean vector, its turn count, turn count the mean was computed from ("" if none)]
+# -> 1 appended, 0 no compact transcript of the current version to append to, or
+#    another save moved the vector since it was read
+_APPEND = """
+local transcript = redis.call('HGET', KEYS[1], ARGV[3])
+if not transcript or string.sub(transcript, 1, #ARGV[2]) ~= ARGV[2] then
+  return 0
+end
+if ARGV[4] and (redis.call('HGET', KEYS[1], 'embedding_turns') or '') ~= ARGV[6] then
+  return 0
+end
+redis.call('HSET', KEYS[1], ARGV[3], transcript .. ARGV[1])
+if ARGV[4] then
+  redis.call('HSET', KEYS[1], 'embedding', ARGV[4], 'embedding_turns', ARGV[5])
+end
+return 1
+"""
+_append_script = None
 
-    # 1️⃣ Không đọc lại Redis, chỉ ghi đè bằng messages hiện tại
-    new_message_texts = []
-    for m in messages:
-        if isinstance(m, HumanMessage):
-            new_message_texts.append({"role": "user", "type": "text", "text": m.content})
-        elif isinstance(m, AIMessage):
-            new_message_texts.append({"role": "assistant", "type": "text", "text": [{"type": "text", "text": m.content}]})
+async def _embed(entries: list[dict], embedding_fn=embedding_fn) -> bytes:
+    embedding = await embedding_fn(json.dumps(entries, ensure_ascii=False))
+    return np.array(embedding, dtype=np.float32).tobytes()
 
-    full_text = json.dumps(new_message_texts, ensure_ascii=False)
+def _user_turns(entries: list[dict]) -> int:
+    return max(1, sum(1 for entry in entries if entry.get("role") == "user"))
 
-    # 2️⃣ Ghi đè Redis (full đoạn hội thoại hiện tại)
-    embedding = await embedding_fn(full_text)
-    embedding_bytes = np.array(embedding, dtype=np.float32).tobytes()
+def mean_embedding(session: Optional[bytes], turns: int, turn: bytes) -> bytes:
+    """Session vector averaged over ``turns`` turns, updated with one more turn."""
+    new = np.frombuffer(turn, dtype=np.float32)
+    old = np.frombuffer(session, dtype=np.float32) if session else None
+    if old is None or turns <= 0 or old.shape != new.shape:
+        return turn
+    return ((old * turns + new) / (turns + 1)).astype(np.float32).tobytes()
+
+async def _append_entries(agent, user_id, session_id, entries: list[dict], turn_embedding: Optional[bytes] = None) -> bool:
+    """Append ``entries`` to the stored transcript in Redis, without reading it back.
+
+    With ``turn_embedding`` the document vector is moved to the new mean. False
+    when the document can't take a frame: it is missing (new, archived or in
+    another index layout) or stored as JSON or in an older codec version.
+    """
+    global _append_script
+    if TRANSCRIPT_FORMAT != "compact":
+        return False
+    client = redis_manager.aio(decode=False)
+    if _append_script is None:
+        _append_script = client.register_script(_APPEND)
+    custom_key = index_router.key(agent, user_id, session_id)
+    args = [encode_transcript(entries), APPENDABLE_PREFIX, TRANSCRIPT_FIELD]
+    if turn_embedding is not None:
+        # Only the vector is read back, not the transcript
+        session, counted = await client.hmget(custom_key, ["embedding", EMBEDDING_TURNS_FIELD])
+        # Documents saved before the mean carry one vector of their whole transcript
+        turns = int(counted) if counted else int(bool(session))
+        args += [mean_embedding(session, turns, turn_embedding), turns + 1, counted or b""]
+    if not await _append_script(keys=[custom_key], args=args):
+        return False
+    async with client.pipeline(transaction=False) as pipe:
+        touch_session(pipe, custom_key)
+        await pipe.execute()
+    await read_router.pin(f"{agent}:{user_id}:{session_id}")
+    return True
+
+async def _write_document(agent, user_id, session_id, entries: list[dict], embedding_fn=embedding_fn,
+                          embedding: Optional[bytes] = None):
+    """Write the whole document: index fields, the vector of the whole transcript and the transcript.
+
+    ``embedding``, when given, is that vector already computed.
+    """
+    shard = index_router.shard_for(agent, user_id)
+    await index_router.ensure(shard)
+
+    doc_id = f"{agent}:{user_id}:{session_id}"
+    custom_key = shard.key(agent, user_id, session_id)
 
     def clean_redis_doc(doc: dict) -> dict:
         return {k: ("" if v is None else v) for k, v in doc.items()}
 
     clean_data = [clean_redis_doc({
         "id": doc_id,
-        "text": full_text,
         "agent": agent,
         "user_id": user_id,
         "session_id": session_id,
-        "embedding": embedding_bytes
+        "embedding": embedding or await _embed(entries, embedding_fn)
     })]
 
-    await async_search_index.load(clean_data, keys=[custom_key])
-    await async_redis_client.hset(custom_key, mapping={"text": full_text})
+    await index_router.index(shard).load(clean_data, keys=[custom_key])
+    async with async_redis_client.pipeline(transaction=False) as pipe:
+        write_transcript(pipe, custom_key, entries)
+        # The vector stands for every turn so far: later turns are averaged in with that weight
+        pipe.hset(custom_key, EMBEDDING_TURNS_FIELD, _user_turns(entries))
+        touch_session(pipe, custom_key)
+        await pipe.execute()
+    await read_router.pin(doc_id)
+
+async def save_chat_to_vector(agent, user_id, session_id, messages, embedding_fn=embedding_fn, history_entries=None):
+    # 1️⃣ Không đọc lại Redis, chỉ ghi đè bằng messages hiện tại (nối sau history_entries nếu có)
+    # 2️⃣ Ghi đè Redis (full đoạn hội thoại hiện tại)
+    entries = list(history_entries or []) + messages_to_entries(messages)
+    await _write_document(agent, user_id, session_id, entries, embedding_fn)
+    return {"status": "ok", "session_id": session_id}
+
+async def append_chat_to_vector(agent, user_id, session_id, messages, embedding_fn=embedding_fn):
+    """Append one turn to the stored transcript (the graph itself resumes from its checkpoint).
+
+    Only the turn is encoded, sent and embedded; its frame is appended to the
+    stored transcript by a script and its vector averaged into the document's.
+    A document that can't take it is loaded (moved or rehydrated as needed)
+    and rewritten once.
+    """
+    entries = messages_to_entries(messages)
+    turn_embedding = await _embed(entries, embedding_fn)
+    if not await _append_entries(agent, user_id, session_id, entries, turn_embedding):
+        history_entries = await load_chat_entries(agent, user_id, session_id)
+        # A new session's transcript is just this turn: its vector is already known
+        await _write_document(agent, user_id, session_id, history_entries + entries, embedding_fn,
+                              None if history_entries else turn_embedding)
     return {"status": "ok", "session_id": session_id}
 
+async def append_chat_text(agent, user_id, session_id, messages, **entry_fields):
+    """Append a turn to the transcript only: no embedding, no index write.
+
+    Used for cancelled runs; the document keeps the vector of its last full save.
+    ``entry_fields`` are added to every appended entry (e.g. ``cancelled=True``).
+    """
+    entries = [{**entry, **entry_fields} for entry in messages_to_entries(messages)]
+    if await _append_entries(agent, user_id, session_id, entries):
+        return
+    custom_key = index_router.key(agent, user_id, session_id)
+    history_entries = await load_chat_entries(agent, user_id, session_id)
+    async with async_redis_client.pipeline(transaction=False) as pipe:
+        write_transcript(pipe, custom_key, history_entries + entries)
+        touch_session(pipe, custom_key)
+        await pipe.execute()
+    await read_router.pin(f"{agent}:{user_id}:{session_id}")
+
 # Search
 async def search_chat_history(query_text, agent=None, user_id=None, session_id=None, k=3):
     embedding = await embedding_fn(query_text)
@@ -119,34 +233,68 @@ async def search_chat_history(query_text, agent=None, user_id=None, session_id=N
     )
     if filters:
         query = query.filter(" ".join(filters))
-    await ensure_index_exists()
-    return await async_search_index.query(query)
+    source = await read_router.source("retrieval", f"{agent}:{user_id}:{session_id}")
+    return await fill_transcripts(await index_router.search(query, agent, user_id, source=source), source)
+
+async def fill_transcripts(results: list[dict], source: RedisConnectionManager = redis_manager) -> list[dict]:
+    """Fill in ``text`` for results whose document stores a compact transcript.
+
+    The binary field is fetched by key with the raw client; the search client decodes replies.
+    Read from ``source``, the connections the search itself used.
+    """
+    missing = [r for r in results if not r.get("text") and r.get("agent") is not None]
+    if missing:
+        raw_client = source.aio(decode=False)
+        # A fanned-out search can hit documents not yet moved to this layout
+        candidates = [index_router.candidate_keys(r["agent"], r["user_id"], r["session_id"]) for r in missing]
+        async with raw_client.pipeline(transaction=False) as pipe:
+            for keys in candidates:
+                for key in keys:
+                    pipe.hget(key, TRANSCRIPT_FIELD)
+            values = iter(await pipe.execute())
+        for r, keys in zip(missing, candidates):
+            found = [next(values) for _ in keys]
+            r["text"] = transcript_json(next((v for v in found if v), None))
+    return results
 
 # Delete
 async def delete_chat_document(agent, user_id, session_id):
-    results = await search_chat_history("", agent, user_id, session_id, k=10)
-    deleted = 0
-    for r in results:
-        redis_key = r.get("id")
-        if redis_key:
-            await async_redis_client.delete(redis_key)
-            deleted += 1
+    # The key is known from the ids, in whichever layout the document was written
+    keys = index_router.candidate_keys(agent, user_id, session_id)
+    deleted = await async_redis_client.delete(*keys)
+    deleted += len(await forget_sessions(keys))
+    # The graph resumes from its checkpoint, not from the document: drop it too
+    thread_id = session_thread_id(agent, user_id, session_id)
+    await checkpointer.adelete_thread(thread_id)
+    await chat_cursor.delete(thread_id)
     return deleted
 
 # Clear all
 async def clear_chat_data():
-    await ensure_index_exists()
-    return await async_search_index.clear()
+    cleared = 0
+    for shard in await index_router.list_shards(refresh=True):
+        cleared += await index_router.index(shard).clear()
+    await checkpointer.aclear()
+    await chat_cursor.clear()
+    return cleared
 
 # Delete index
 async def delete_chat_index():
-    if await async_search_index.exists():
-        await async_search_index.delete()
+    for shard in await index_router.list_shards(refresh=True):
+        await index_router.index(shard).delete()
+    index_router.forget()
 
 # Stats
 async def get_index_stats():
     await ensure_index_exists()
-    return {"exists": await async_search_index.exists(), "name": INDEX_NAME, "prefix": KEY_PREFIX}
+    shards = await index_router.list_shards(refresh=True)
+    return {
+        "exists": bool(shards),
+        "name": INDEX_NAME,
+        "prefix": KEY_PREFIX,
+        "layout": index_router.layout,
+        "shards": [shard.index_name for shard in shards],
+    }
 
 
 async def load_chat_history_vecter(agent: str, user_id: str, session_id: str) -> str:
@@ -164,36 +312,96 @@ async def load_chat_history_vecter(agent: str, user_id: str, session_id: str) ->
     )
     query.filter.expression = " ".join(filters)
 
-    results = await async_search_index.query(query)
+    results = await index_router.search(query, agent, user_id)
     if results and "text" in results[0]:
         return results[0]["text"]
     return "[]"
 
-async def load_chat_history(agent: str, user_id: str, session_id: str) -> str:
-    redis_key = f"{KEY_PREFIX}:{agent}:{user_id}:{session_id}"
+async def _load_transcript(agent: str, user_id: str, session_id: str, purpose: Optional[str] = None):
+    keys = index_router.candidate_keys(agent, user_id, session_id)
+    redis_key = keys[0]
+    # Read-modify-write callers read the primary; hot reads (a ``purpose``) may go to a replica
+    source = await read_router.source(purpose, f"{agent}:{user_id}:{session_id}") if purpose else redis_manager
     try:
-        value = await async_redis_client.hget(redis_key, "text")
+        # Raw client: compact transcripts are binary. Keys of the other layouts are
+        # read in the same round trip; a document found there is moved into place.
+        async with source.aio(decode=False).pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.hmget(key, TRANSCRIPT_FIELDS)
+            found = await pipe.execute()
+        located = next(((key, v) for key, values in zip(keys, found) for v in values if v), None)
+        value = located[1] if located else None
+        if located and located[0] != redis_key:
+            await index_router.ensure(index_router.shard_for(agent, user_id))
+            await index_router.move(located[0], redis_key)
+            await read_router.pin(f"{agent}:{user_id}:{session_id}")
+        if not value:
+            # Archived for inactivity: restore it into Redis before the turn continues
+            value = await rehydrate(redis_key)
+            if value:
+                await read_router.pin(f"{agent}:{user_id}:{session_id}")
         if value:
-            print(f"[Redis] ✅ Loaded history from key: {redis_key}")
+            logger.debug("Loaded history from key: %s", redis_key)
         else:
-            print(f"[Redis] ⚠️ No history found for key: {redis_key}")
-        return value or "[]"
+            logger.debug("No history found for key: %s", redis_key)
+        return value
     except Exception as e:
-        print(f"[Redis] ❌ Failed to load chat history: {e}")
-        return "[]"
+        logger.warning("Failed to load chat history from %s: %s", redis_key, e)
+        return None
+
+async def load_chat_entries(agent: str, user_id: str, session_id: str, purpose: Optional[str] = None) -> list[dict]:
+    """Stored transcript entries; pass a ``purpose`` to let read_router serve it from a replica."""
+    value = await _load_transcript(agent, user_id, session_id, purpose)
+    try:
+        return decode_transcript(value)
+    except ValueError as e:
+        logger.warning("Unreadable transcript for %s:%s:%s: %s", agent, user_id, session_id, e)
+        return []
 
-def load_uploaded_tools_from_redis() -> dict:
+async def load_chat_history(agent: str, user_id: str, session_id: str) -> str:
+    """Stored transcript as JSON text ("[]" if none)."""
+    return transcript_json(await _load_transcript(agent, user_id, session_id, purpose="history"))
+
+def parse_tool_doc(doc: dict) -> dict:
+    """Item dict (as the tools use it) from the decoded fields of one tool document."""
+    return {
+        "id": doc["id"],
+        "name": doc.get("name"),
+        "type": doc.get("type"),
+        "status": doc.get("status"),
+        "location": doc.get("location"),
+        "quantity": float(doc.get("quantity", 0)),
+        "unit": doc.get("unit"),
+        "weight": float(doc.get("weight", 0)),
+        "dimensions": {
+            "length": float(doc.get("dim_length", 0)),
+            "width": float(doc.get("dim_width", 0)),
+            "height": float(doc.get("dim_height", 0)),
+        },
+        "created_at": doc.get("created_at"),
+        "updated_at": doc.get("updated_at"),
+        "tags": doc.get("tags", "").split(",") if doc.get("tags") else [],
+        "metadata": json.loads(doc.get("metadata", "{}")),
+        "images": json.loads(doc.get("images", "[]")),
+    }
+
+def load_uploaded_tools_from_redis(min_version: int = 0) -> dict:
     """
     Load all RedisVL documents with prefix 'core_agent:data:tool:' and convert them into structured Python dict.
-    Avoid decoding binary fields by using a temporary Redis connection with decode_responses=False.
+    Avoid decoding binary fields by using the raw (decode_responses=False) view of the shared pool.
+    A read replica is used only if it already holds inventory version ``min_version``.
     """
-    raw_client = Redis.from_url(REDIS_URL, decode_responses=False)
-    keys = raw_client.keys(f"{TOOL_KEY_PREFIX}*")
-    print("kjdahsdjklashdlkashdlkashdlkashdlkashdlkashdlkashdlkashdlkashdklashdlkashdlkashdlkashdlksahdlksahdlksahdlkas")
+    raw_client = read_router.source_at("inventory", INVENTORY_VERSION_KEY, min_version).sync(decode=False)
+    keys = list(raw_client.scan_iter(match=f"{TOOL_KEY_PREFIX}*", count=500))
     result = {}
 
+    # One round trip for all documents instead of one HGETALL per key
+    pipe = raw_client.pipeline(transaction=False)
     for key in keys:
-        doc_raw = raw_client.hgetall(key)
+        pipe.hgetall(key)
+    docs_raw = pipe.execute() if keys else []
+
+    for key, doc_raw in zip(keys, docs_raw):
         if not doc_raw:
             continue
 
@@ -206,31 +414,17 @@ def load_uploaded_tools_from_redis() -> dict:
                 v = v.decode() if isinstance(v, bytes) else v
                 doc[k] = v
             except Exception:
-                print(f"❌ Failed decoding field {k}")
+                logger.warning("Failed decoding field %s of %s", k, key)
                 continue
 
         try:
-            result[doc["id"]] = {
-                "id": doc["id"],
-                "name": doc.get("name"),
-                "type": doc.get("type"),
-                "status": doc.get("status"),
-                "location": doc.get("location"),
-                "quantity": float(doc.get("quantity", 0)),
-                "unit": doc.get("unit"),
-                "weight": float(doc.get("weight", 0)),
-                "dimensions": {
-                    "length": float(doc.get("dim_length", 0)),
-                    "width": float(doc.get("dim_width", 0)),
-                    "height": float(doc.get("dim_height", 0)),
-                },
-                "created_at": doc.get("created_at"),
-                "updated_at": doc.get("updated_at"),
-                "tags": doc.get("tags", "").split(",") if doc.get("tags") else [],
-                "metadata": json.loads(doc.get("metadata", "{}")),
-                "images": json.loads(doc.get("images", "[]")),
-            }
+            result[doc["id"]] = parse_tool_doc(doc)
         except Exception as e:
-            print(f"❌ Failed to parse key {key}: {e}")
+            logger.warning("Failed to parse key %s: %s", key, e)
+
+    return result
 
-    return result
\ No newline at end of file
+def get_inventory_version() -> int:
+    """Current inventory version, bumped by every Excel upload (0 if never uploaded)."""
+    value = redis_client.get(INVENTORY_VERSION_KEY)
+    return int(value) if value else 0
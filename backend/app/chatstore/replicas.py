@@ -0,0 +1,194 @@
+import asyncio
+import itertools
+import logging
+import time
+from typing import Optional
+from urllib.parse import urlparse
+
+from redis.exceptions import RedisError
+
+from app.utils.config import (
+    AGENT_NAME,
+    REDIS_REPLICA_URLS,
+    REDIS_REPLICA_MAX_STALENESS_SECONDS,
+    REDIS_REPLICA_PIN_SECONDS,
+    REDIS_REPLICA_CHECK_SECONDS,
+)
+from app.utils.metrics import Counter, Gauge
+from .connection import RedisConnectionManager, redis_manager
+
+logger = logging.getLogger(__name__)
+
+REDIS_REPLICA_LAG = Gauge(
+    "redis_replica_lag_seconds",
+    "Age of the newest heartbeat seen on a replica when last checked (-1 when unreachable)",
+    ["replica"],
+)
+REDIS_READ_ROUTES = Counter(
+    "redis_read_routes_total",
+    "Hot reads by purpose, target (primary, replica) and reason for the choice",
+    ["purpose", "target", "reason"],
+)
+
+HEARTBEAT_KEY = f"{AGENT_NAME}:replica_heartbeat"
+PIN_KEY_PREFIX = f"{AGENT_NAME}:replica_pin"
+_MAX_PINS = 10_000
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = url
+        parsed = urlparse(url)
+        self.name = f"{parsed.hostname}:{parsed.port or 6379}"
+        self.manager = RedisConnectionManager(url, cluster=False, name=f"replica_{self.name}")
+        self.heartbeat: Optional[float] = None  # newest primary time this replica is known to hold
+
+    def staleness(self, now: float) -> float:
+        """Upper bound on how far this replica is behind the primary."""
+        return float("inf") if self.heartbeat is None else max(0.0, now - self.heartbeat)
+
+
+class ReadRouter:
+    """Sends hot reads to replicas that are fresh enough, everything else to the primary.
+
+    Freshness comes from a heartbeat: every worker writes the current time to
+    HEARTBEAT_KEY on the primary every REDIS_REPLICA_CHECK_SECONDS and reads it
+    back from each replica. ``now - heartbeat`` on a replica bounds its lag
+    from above (by at most one check period), so a replica is only used while
+    that bound is within REDIS_REPLICA_MAX_STALENESS_SECONDS; an unreachable or
+    stalled replica drops out by itself.
+
+    Read-your-writes: a written session reads the primary for
+    REDIS_REPLICA_PIN_SECONDS afterwards, on every worker. The pin is a key
+    with that expiry on the primary, checked before a read of the session goes
+    to a replica; the writing worker also remembers its own pins, sparing it
+    the check. Disabled without REDIS_REPLICA_URLS, and on a Redis Cluster
+    (whose replicas belong to the cluster client).
+    """
+
+    def __init__(
+        self,
+        urls: list[str] = REDIS_REPLICA_URLS,
+        *,
+        max_staleness: float = REDIS_REPLICA_MAX_STALENESS_SECONDS,
+        pin_seconds: float = REDIS_REPLICA_PIN_SECONDS,
+        check_interval: float = REDIS_REPLICA_CHECK_SECONDS,
+    ):
+        if urls and redis_manager.cluster:
+            logger.warning("REDIS_REPLICA_URLS is ignored with REDIS_CLUSTER; reads stay on the primaries")
+            urls = []
+        self.replicas = [Replica(url) for url in urls]
+        self.max_staleness = max_staleness
+        self.pin_seconds = pin_seconds
+        self.check_interval = check_interval
+        self._pins: dict[str, float] = {}  # pins set by this worker: session -> monotonic time they end
+        self._turn = itertools.count()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    # ── Read-your-writes ──
+    @staticmethod
+    def _pin_key(session: str) -> str:
+        return f"{PIN_KEY_PREFIX}:{session}"
+
+    async def pin(self, session: str):
+        """Route reads of ``session`` to the primary for the pin window, on every worker."""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        if len(self._pins) >= _MAX_PINS:
+            self._pins = {s: until for s, until in self._pins.items() if until > now}
+        self._pins[session] = now + self.pin_seconds
+        try:
+            await redis_manager.aio().set(self._pin_key(session), "1", px=max(1, int(self.pin_seconds * 1000)))
+        except RedisError as e:
+            # Other workers then only have the staleness bound
+            logger.warning("Could not share the read pin of %s: %s", session, e)
+
+    def _pinned_here(self, session: str) -> bool:
+        until = self._pins.get(session)
+        if until is None:
+            return False
+        if until <= time.monotonic():
+            self._pins.pop(session, None)
+            return False
+        return True
+
+    async def _pinned(self, session: str) -> bool:
+        if self._pinned_here(session):
+            return True
+        try:
+            return bool(await redis_manager.aio().exists(self._pin_key(session)))
+        except RedisError as e:
+            logger.warning("Could not check the read pin of %s, reading the primary: %s", session, e)
+            return True
+
+    # ── Routing ──
+    def _fresh(self) -> tuple[Optional[Replica], str]:
+        if not self.enabled:
+            return None, "disabled"
+        now = time.time()
+        fresh = [r for r in self.replicas if r.staleness(now) <= self.max_staleness]
+        if not fresh:
+            return None, "stale"
+        return fresh[next(self._turn) % len(fresh)], "fresh"
+
+    @staticmethod
+    def _record(purpose: str, replica: Optional[Replica], reason: str) -> RedisConnectionManager:
+        REDIS_READ_ROUTES.labels(purpose=purpose, target="replica" if replica else "primary", reason=reason).inc()
+        return replica.manager if replica else redis_manager
+
+    async def source(self, purpose: str, session: Optional[str] = None) -> RedisConnectionManager:
+        """Connections to read from: a fresh replica's, or the primary's while ``session`` is pinned."""
+        replica, reason = self._fresh()
+        # Checked only when a replica would be used: the pin costs a round trip to the primary
+        if replica is not None and session is not None and await self._pinned(session):
+            replica, reason = None, "pinned"
+        return self._record(purpose, replica, reason)
+
+    def source_at(self, purpose: str, key: str, version: int) -> RedisConnectionManager:
+        """``source`` for data vouched for by a version counter in ``key`` (sync).
+
+        The counter has to be bumped after the data is written: a replica that
+        holds ``version`` then holds the data too, since replication keeps the
+        primary's order. A replica behind it is skipped.
+        """
+        replica, reason = self._fresh()
+        if replica is not None:
+            try:
+                if int(replica.manager.sync().get(key) or 0) < version:
+                    replica, reason = None, "behind"
+            except RedisError as e:
+                logger.warning("Replica %s unreadable, reading the primary: %s", replica.name, e)
+                replica, reason = None, "behind"
+        return self._record(purpose, replica, reason)
+
+    # ── Heartbeat ──
+    async def check(self):
+        await redis_manager.aio().set(HEARTBEAT_KEY, repr(time.time()), ex=max(60, int(self.check_interval * 10)))
+        for replica in self.replicas:
+            try:
+                value = await replica.manager.aio().get(HEARTBEAT_KEY)
+            except RedisError as e:
+                logger.debug("Replica %s heartbeat failed: %s", replica.name, e)
+                value = None
+            replica.heartbeat = float(value) if value else None
+            lag = replica.staleness(time.time())
+            REDIS_REPLICA_LAG.labels(replica=replica.name).set(-1 if lag == float("inf") else lag)
+
+    async def run(self):
+        while True:
+            try:
+                await self.check()
+            except RedisError as e:
+                logger.warning("Replica heartbeat could not be written: %s", e)
+            await asyncio.sleep(self.check_interval)
+
+    async def aclose(self):
+        for replica in self.replicas:
+            await replica.manager.aclose()
+
+
+read_router = ReadRouter()
@@ -0,0 +1,314 @@
+import asyncio
+import logging
+import re
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Optional
+
+from redisvl.index import AsyncSearchIndex
+
+from app.utils.config import (
+    INDEX_NAME,
+    KEY_PREFIX,
+    EMBEDDING_DIM,
+    CHAT_SHARDING,
+    CHAT_SHARD_COUNT,
+    CHAT_SHARD_PREFIX,
+    CHAT_SHARD_LIST_TTL_SECONDS,
+    SESSION_ACTIVITY_KEY,
+)
+from app.utils.metrics import Counter
+from .cold_store import cold_store
+from .connection import RedisConnectionManager, hash_tag, redis_manager, untag
+
+logger = logging.getLogger(__name__)
+
+LAYOUTS = ("none", "agent", "hash")
+
+CHAT_SHARD_QUERIES = Counter(
+    "chat_shard_queries_total",
+    "Chat index queries by routing (routed to one shard, or fanned out to all)",
+    ["routing"],
+)
+
+
+def chat_schema(index_name: str = INDEX_NAME, prefix: str = KEY_PREFIX) -> dict:
+    """RedisVL schema of a chat document index."""
+    return {
+        "index": {"name": index_name, "prefix": prefix},
+        "fields": [
+            {"name": "id", "type": "text"},
+            {"name": "text", "type": "text"},
+            {"name": "agent", "type": "tag"},
+            {"name": "user_id", "type": "tag"},
+            {"name": "session_id", "type": "tag"},
+            {
+                "name": "embedding",
+                "type": "vector",
+                "attrs": {
+                    "dims": EMBEDDING_DIM,
+                    "distance_metric": "cosine",
+                    "algorithm": "flat",
+                    "datatype": "float32"
+                }
+            }
+        ]
+    }
+
+
+# ─── Shards ─────────────────────────────────────────────
+@dataclass(frozen=True)
+class Shard:
+    name: str  # "" is the unsharded INDEX_NAME index
+    index_name: str
+    key_prefix: str
+
+    @property
+    def index_prefix(self) -> str:
+        # Trailing ":" so shard "a" never indexes the keys of shard "a_b"
+        return f"{self.key_prefix}:" if self.name else self.key_prefix
+
+    def key(self, agent, user_id, session_id) -> str:
+        return f"{self.key_prefix}:{hash_tag(f'{agent}:{user_id}:{session_id}')}"
+
+
+BASE_SHARD = Shard("", INDEX_NAME, KEY_PREFIX)
+_SHARD_INDEX_PREFIX = f"{INDEX_NAME}_shard_"
+_HASH_SHARD = re.compile(r"h(\d{3})")
+
+
+def _shard(name: str) -> Shard:
+    if not name:
+        return BASE_SHARD
+    return Shard(name, f"{_SHARD_INDEX_PREFIX}{name}", f"{CHAT_SHARD_PREFIX}:{name}")
+
+
+def _shard_name(value) -> str:
+    return re.sub(r"[^0-9A-Za-z_.-]", "_", str(value)) or "_"
+
+
+# KEYS: source, destination[, activity index] -> 1 moved, 0 destination exists, -1 no source
+# On a cluster the activity index lives in another slot and is updated by the caller.
+_MOVE = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  return -1
+end
+if redis.call('RENAMENX', KEYS[1], KEYS[2]) == 0 then
+  return 0
+end
+if KEYS[3] then
+  local score = redis.call('ZSCORE', KEYS[3], KEYS[1])
+  if score then
+    redis.call('ZREM', KEYS[3], KEYS[1])
+    redis.call('ZADD', KEYS[3], score, KEYS[2])
+  end
+end
+return 1
+"""
+
+
+class IndexRouter:
+    """Places chat documents in index shards and routes queries to them.
+
+    Layouts: ``none`` keeps everything in INDEX_NAME; ``agent`` gives every
+    agent its own index and key prefix; ``hash`` spreads agent:user tenants
+    over CHAT_SHARD_COUNT indexes. Shard indexes are created on first use. A
+    query whose filters pin its shard reads only that index; otherwise it is
+    fanned out to every existing shard and the hits are merged.
+    """
+
+    def __init__(self, layout: str = CHAT_SHARDING, shard_count: int = CHAT_SHARD_COUNT):
+        if layout not in LAYOUTS:
+            raise ValueError(f"CHAT_SHARDING must be one of {LAYOUTS}, got {layout!r}")
+        self.layout = layout
+        self.shard_count = shard_count
+        self._indexes: dict[tuple[str, bool, str], AsyncSearchIndex] = {}
+        self._ready: set[str] = set()
+        self._listed: tuple[float, list[Shard]] = (0.0, [])
+        self._move_script = None
+
+    # ── Placement ──
+    def shard_for(self, agent, user_id, layout: Optional[str] = None) -> Shard:
+        layout = layout or self.layout
+        if layout == "agent":
+            return _shard(_shard_name(agent))
+        if layout == "hash":
+            return _shard(f"h{zlib.crc32(f'{agent}:{user_id}'.encode()) % self.shard_count:03d}")
+        return BASE_SHARD
+
+    def key(self, agent, user_id, session_id) -> str:
+        return self.shard_for(agent, user_id).key(agent, user_id, session_id)
+
+    def candidate_keys(self, agent, user_id, session_id) -> list[str]:
+        """The document's key in this layout first, then where the other layouts put it."""
+        keys = [self.key(agent, user_id, session_id)]
+        for layout in LAYOUTS:
+            key = self.shard_for(agent, user_id, layout).key(agent, user_id, session_id)
+            if key not in keys:
+                keys.append(key)
+        return keys
+
+    def owns(self, shard: Shard) -> bool:
+        """Whether this layout can place documents in ``shard``."""
+        match = _HASH_SHARD.fullmatch(shard.name)
+        if self.layout == "hash":
+            return bool(match) and int(match.group(1)) < self.shard_count
+        if self.layout == "agent":
+            return bool(shard.name) and not match
+        return not shard.name
+
+    key_patterns = (f"{KEY_PREFIX}:*", f"{CHAT_SHARD_PREFIX}:*")
+
+    @staticmethod
+    def thread_id(key: str) -> Optional[str]:
+        """``agent:user:session`` of a chat document key in any layout."""
+        if key.startswith(f"{KEY_PREFIX}:"):
+            return untag(key[len(KEY_PREFIX) + 1:])
+        if key.startswith(f"{CHAT_SHARD_PREFIX}:"):
+            return untag(key[len(CHAT_SHARD_PREFIX) + 1:].partition(":")[2]) or None
+        return None
+
+    # ── Indexes ──
+    def index(self, shard: Shard, decode: bool = True, source: RedisConnectionManager = redis_manager) -> AsyncSearchIndex:
+        """Index object of ``shard`` on the primary, or on ``source`` (a read replica)."""
+        key = (shard.name, decode, source.name)
+        if key not in self._indexes:
+            self._indexes[key] = AsyncSearchIndex.from_dict(
+                chat_schema(shard.index_name, shard.index_prefix), redis_client=source.aio(decode=decode)
+            )
+        return self._indexes[key]
+
+    async def ensure(self, shard: Shard):
+        # Checked once per process and shard; FT.INFO on every save/search is a wasted round trip
+        if shard.name in self._ready:
+            return
+        index = self.index(shard)
+        if not await index.exists():
+            await index.create(overwrite=False)
+            self._listed = (0.0, [])
+            if shard.name:
+                logger.info("Created chat index shard %s", shard.index_name)
+        self._ready.add(shard.name)
+
+    def forget(self):
+        """Drop cached index state after indexes were deleted."""
+        self._ready.clear()
+        self._listed = (0.0, [])
+
+    async def list_shards(self, refresh: bool = False) -> list[Shard]:
+        """Existing chat indexes of any layout (cached for CHAT_SHARD_LIST_TTL_SECONDS)."""
+        listed_at, shards = self._listed
+        if refresh or time.monotonic() - listed_at > CHAT_SHARD_LIST_TTL_SECONDS:
+            names = await redis_manager.aio().execute_command("FT._LIST")
+            shards = [
+                BASE_SHARD if name == INDEX_NAME else _shard(name[len(_SHARD_INDEX_PREFIX):])
+                for name in sorted(names)
+                if name == INDEX_NAME or name.startswith(_SHARD_INDEX_PREFIX)
+            ]
+            self._listed = (time.monotonic(), shards)
+        return shards
+
+    async def query_shards(self, agent=None, user_id=None) -> list[Shard]:
+        """Shards a query filtered on ``agent`` / ``user_id`` has to read."""
+        pinned = self.layout == "none" or (agent is not None and (self.layout == "agent" or user_id is not None))
+        if pinned:
+            CHAT_SHARD_QUERIES.labels(routing="routed").inc()
+            shard = self.shard_for(agent, user_id)
+            await self.ensure(shard)
+            return [shard]
+        CHAT_SHARD_QUERIES.labels(routing="fanout").inc()
+        return await self.list_shards()
+
+    async def search(self, query, agent=None, user_id=None, decode: bool = True,
+                     source: RedisConnectionManager = redis_manager) -> list[dict]:
+        shards = await self.query_shards(agent, user_id)
+        if len(shards) == 1:
+            return await self.index(shards[0], decode, source).query(query)
+        batches = await asyncio.gather(*(self.index(shard, decode, source).query(query) for shard in shards))
+        results = [r for batch in batches for r in batch]
+        if any("vector_distance" in r for r in results):
+            results.sort(key=lambda r: float(r.get("vector_distance", 0)))
+        return results[:getattr(query, "_num_results", len(results))]
+
+    # ── Moving documents ──
+    async def move(self, src: str, dst: str) -> int:
+        """Rename a document (and its activity entry); 1 moved, 0 ``dst`` exists, -1 no ``src``."""
+        client = redis_manager.aio(decode=False)
+        if self._move_script is None:
+            self._move_script = client.register_script(_MOVE)
+        if not redis_manager.cluster:
+            return await self._move_script(keys=[src, dst, SESSION_ACTIVITY_KEY])
+        # src and dst share the session's hash tag; the activity index does not
+        moved = await self._move_script(keys=[src, dst])
+        if moved == 1:
+            score = await client.zscore(SESSION_ACTIVITY_KEY, src)
+            if score is not None:
+                async with client.pipeline(transaction=True) as pipe:
+                    pipe.zrem(SESSION_ACTIVITY_KEY, src)
+                    pipe.zadd(SESSION_ACTIVITY_KEY, {dst: score})
+                    await pipe.execute()
+        return moved
+
+    async def migrate(self, dry_run: bool = False, drop_empty: bool = False, batch: int = 500) -> dict:
+        """Move every chat document to its place in the current layout.
+
+        Also used to rebalance after changing CHAT_SHARD_COUNT. Documents whose
+        destination already exists are left in place and counted as conflicts.
+        With ``drop_empty``, indexes this layout no longer uses are dropped once
+        empty (documents are never deleted).
+        """
+        client = redis_manager.aio(decode=False)
+        stats = {"layout": self.layout, "dry_run": dry_run, "scanned": 0, "moved": 0, "in_place": 0, "conflicts": 0}
+        for pattern in self.key_patterns:
+            async for key in client.scan_iter(match=pattern, count=batch, _type="hash"):
+                stats["scanned"] += 1
+                name = key.decode()
+                agent, user_id, session_id = (
+                    v.decode() if v is not None else None
+                    for v in await client.hmget(key, "agent", "user_id", "session_id")
+                )
+                if session_id is None:
+                    continue
+                shard = self.shard_for(agent, user_id)
+                target = shard.key(agent, user_id, session_id)
+                if target == name:
+                    stats["in_place"] += 1
+                elif dry_run:
+                    stats["moved"] += 1
+                else:
+                    await self.ensure(shard)
+                    moved = await self.move(name, target)
+                    if moved == 1:
+                        stats["moved"] += 1
+                    elif moved == 0:
+                        stats["conflicts"] += 1
+
+        if not dry_run:
+            stats["cold_rekeyed"] = await asyncio.to_thread(cold_store.rekey, self.key)
+            stats["dropped_indexes"] = []
+            if drop_empty:
+                for shard in await self.list_shards(refresh=True):
+                    if self.owns(shard):
+                        continue
+                    if int((await self.index(shard).info()).get("num_docs", 0)) == 0:
+                        await self.index(shard).delete(drop=False)
+                        stats["dropped_indexes"].append(shard.index_name)
+                self.forget()
+        logger.info("Chat index migration: %s", stats)
+        return stats
+
+    async def describe(self) -> dict:
+        shards = []
+        for shard in await self.list_shards(refresh=True):
+            info = await self.index(shard).info()
+            shards.append({
+                "index": shard.index_name,
+                "prefix": shard.index_prefix,
+                "num_docs": int(info.get("num_docs", 0)),
+                "in_layout": self.owns(shard),
+            })
+        return {"layout": self.layout, "shard_count": self.shard_count, "shards": shards}
+
+
+index_router = IndexRouter()
@@ -1,21 +1,24 @@
-from langchain_openai import ChatOpenAI
-from langgraph.graph import StateGraph, END
-from langgraph.prebuilt import ToolNode
-from langchain_core.messages import SystemMessage, HumanMessage
+from langgraph.graph import StateGraph, START, END
+from langchain_core.messages import SystemMessage, HumanMessage, RemoveMessage
 from langgraph.errors import NodeInterrupt
 from langchain_core.tools import BaseTool
 from pydantic import BaseModel
 from .tools import tools
+from .tool_executor import BoundedToolNode
+from .llm import ainvoke_with_fallback
 from .state import AgentState
-from app.chatstore.redis_client import search_chat_history, save_chat_to_vector
-import os, json
+from .memory import checkpointer, compact_messages, drop_unanswered_tool_calls
+from app.chatstore.redis_client import entries_to_messages, load_chat_entries, search_chat_history
+from app.utils.tracing import traced_stage
+import os, json, logging
+
+logger = logging.getLogger(__name__)
 
 # === CONFIG ===
 DEFAULT_SYSTEM_PROMPT = os.getenv(
     "CORE_AGENT_SYSTEM_PROMPT",
     "Bạn là trợ lý AI chính xác, ngắn gọn, lịch sự, không bịa đặt."
 )
-model = ChatOpenAI()
 
 # === DYNAMIC TOOL WRAPPER ===
 class AnyArgsSchema(BaseModel):
@@ -47,7 +50,26 @@ def get_tools(config):
     return tools + frontend_tools
 
 # === NODES ===
+# "history" and "retrieval" both start from START and run concurrently; each
+# writes its own state key and "join" folds the results into the messages.
+async def load_history(state, config):
+    # Only a session without a checkpoint needs its stored transcript replayed.
+    # The route passes the number of messages it sent; more in state means the
+    # checkpoint already holds the conversation.
+    turn_size = config["configurable"].get("turn_size")
+    if turn_size is None or len(state["messages"]) > turn_size:
+        return {"prefetched_history": None}
+    entries = await load_chat_entries(
+        config["configurable"].get("agent"),
+        config["configurable"].get("user_id"),
+        config["configurable"].get("session_id"),
+        purpose="history",
+    )
+    return {"prefetched_history": entries_to_messages(entries)}
+
 async def retrieve_context(state, config):
+    # Runs for every turn so the KNN overlaps the history load; "join" drops
+    # the context when the classifier says the question does not need it
     messages = state["messages"]
     query = messages[-1].content if messages else ""
 
@@ -59,11 +81,34 @@ async def retrieve_context(state, config):
     )
     context = "\n".join([d["text"] for d in docs]) if docs else ""
 
-    print("[RAG] Injected context:", context[:200])
+    logger.debug("Injected RAG context: %s", context[:200])
 
-    return {
-        "messages": [SystemMessage(content=f"Ngữ cảnh: {context}")] + messages
-    }
+    return {"retrieved_context": context}
+
+async def join_prefetch(state, config):
+    messages = state["messages"]
+    history = state.get("prefetched_history")
+    context = state.get("retrieved_context")
+    if classify_query(messages) != "retrieval":
+        context = None
+
+    # The replayed transcript goes before this turn and the context right before
+    # the latest user message: remove what follows and re-add it in that order
+    last_human = next(
+        (i for i in reversed(range(len(messages))) if isinstance(messages[i], HumanMessage)),
+        len(messages),
+    )
+    update = []
+    if history or context is not None:
+        start = 0 if history else last_human
+        update += [RemoveMessage(id=m.id) for m in messages[start:]]
+        update += history or []
+        update += [m.model_copy(update={"id": None}) for m in messages[start:last_human]]
+        if context is not None:
+            update.append(SystemMessage(content=f"Ngữ cảnh: {context}"))
+        update += [m.model_copy(update={"id": None}) for m in messages[last_human:]]
+    # Clear the prefetch keys so they are not carried in the checkpoint
+    return {"messages": update, "prefetched_history": None, "retrieved_context": None}
 
 async def call_model(state, config):
     def sanitize_prompt(fe_prompt: str, fallback: str) -> str:
@@ -72,26 +117,17 @@ async def call_model(state, config):
         return fallback
 
     system = sanitize_prompt(config["configurable"].get("system", ""), DEFAULT_SYSTEM_PROMPT)
-    messages = [SystemMessage(content=system)] + state["messages"]
-    model_with_tools = model.bind_tools(get_tool_defs(config))
-    response = await model_with_tools.ainvoke(messages)
+    messages = [SystemMessage(content=system)] + drop_unanswered_tool_calls(state["messages"])
+    response = await ainvoke_with_fallback(messages, get_tool_defs(config), config)
     return {"messages": response}
 
 async def run_tools(input, config, **kwargs):
-    tool_node = ToolNode(get_tools(config))
+    tool_node = BoundedToolNode(get_tools(config))
     return await tool_node.ainvoke(input, config, **kwargs)
 
-async def save_history(state, config):
-    try:
-        await save_chat_to_vector(
-            agent=config["configurable"].get("agent"),
-            user_id=config["configurable"].get("user_id"),
-            session_id=config["configurable"].get("session_id"),
-            messages=state["messages"]
-        )
-    except Exception as e:
-        print(f"[SAVE] Failed: {e}")
-    return state
+async def compact_history(state, config):
+    # The transcript document is persisted by the route; here we only keep the checkpoint small
+    return {"messages": compact_messages(state["messages"])}
 
 def should_continue(state):
     last = state["messages"][-1]
@@ -100,10 +136,11 @@ def should_continue(state):
     else:
         return "tools"
 
-async def classify_query(state, config):
-    user_messages = [m for m in reversed(state["messages"]) if isinstance(m, HumanMessage)]
+def classify_query(messages) -> str:
+    """Keyword routing: "retrieval" when the question needs stored context, else "agent"."""
+    user_messages = [m for m in reversed(messages) if isinstance(m, HumanMessage)]
     if not user_messages:
-        return {"next": "agent"}
+        return "agent"
 
     last_user_message = user_messages[0]
     query_text = last_user_message.content
@@ -115,28 +152,27 @@ async def classify_query(state, config):
         query = str(query_text).lower()
 
     if any(keyword in query for keyword in ["trạng thái", "mã đơn", "sản phẩm"]):
-        return {"next": "agent"}
+        return "agent"
     elif any(keyword in query for keyword in ["chính sách", "quy trình", "hướng dẫn"]):
-        return {"next": "retrieval"}
+        return "retrieval"
     else:
-        return {"next": "agent"}
-
-def route_from_classifier(state):
-    return state["next"]
+        return "agent"
 
 # === BUILD GRAPH ===
 workflow = StateGraph(AgentState)
-workflow.add_node("classifier", classify_query)
-workflow.add_node("retrieval", retrieve_context)
-workflow.add_node("agent", call_model)
-workflow.add_node("tools", run_tools)
-workflow.add_node("save", save_history)
-
-workflow.set_entry_point("classifier")
-workflow.add_conditional_edges("classifier", route_from_classifier, ["retrieval", "agent"])
-workflow.add_edge("retrieval", "agent")
+workflow.add_node("history", traced_stage("history")(load_history))
+workflow.add_node("retrieval", traced_stage("retrieval")(retrieve_context))
+workflow.add_node("join", traced_stage("join")(join_prefetch))
+workflow.add_node("agent", traced_stage("agent")(call_model))
+workflow.add_node("tools", traced_stage("tools")(run_tools))
+workflow.add_node("save", traced_stage("save")(compact_history))
+
+workflow.add_edge(START, "history")
+workflow.add_edge(START, "retrieval")
+workflow.add_edge(["history", "retrieval"], "join")
+workflow.add_edge("join", "agent")
 workflow.add_conditional_edges("agent", should_continue, ["tools", "save"])
 workflow.add_edge("tools", "agent")
 workflow.add_edge("save", END)
 
-assistant_ui_graph = workflow.compile()
+assistant_ui_graph = workflow.compile(checkpointer=checkpointer)
@@ -0,0 +1,94 @@
+import logging
+import threading
+import time
+
+from app.chatstore.redis_client import load_uploaded_tools_from_redis, get_inventory_version
+from app.utils.config import INVENTORY_VERSION_CHECK_SECONDS, INVENTORY_SNAPSHOT_PATH
+from .inventory_snapshot import InventorySnapshot, SnapshotFile, encode_snapshot
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------
+# Versioned inventory snapshot
+# -----------------------------
+# The inventory is reloaded only when the upload route bumps
+# INVENTORY_VERSION_KEY. The version is polled at most once every
+# INVENTORY_VERSION_CHECK_SECONDS so tool calls do not pay a round trip each.
+# Items live in the columnar snapshot file at INVENTORY_SNAPSHOT_PATH, shared
+# by the workers of a host; the first worker to see a new version builds it.
+
+_lock = threading.Lock()
+_snapshot: tuple[int, InventorySnapshot] | None = None  # (version, items), swapped atomically
+_checked_at = 0.0
+_polled = (0.0, 0)  # (monotonic time, version) of the last check made by version()
+_listeners: list = []
+
+
+def on_reload(callback):
+    """Register ``callback(version)`` to run whenever a new inventory version is loaded."""
+    _listeners.append(callback)
+    return callback
+
+
+snapshot_file = SnapshotFile(INVENTORY_SNAPSHOT_PATH) if INVENTORY_SNAPSHOT_PATH else None
+
+
+def _load(version: int) -> InventorySnapshot:
+    fetch = lambda: load_uploaded_tools_from_redis(min_version=version)
+    if snapshot_file is not None:
+        try:
+            return snapshot_file.load(version, fetch)
+        except OSError as e:
+            logger.warning("Inventory snapshot file unusable, keeping a private copy: %s", e)
+    return InventorySnapshot(encode_snapshot(version, fetch()))
+
+
+def _is_fresh(now: float) -> bool:
+    return _snapshot is not None and now - _checked_at < INVENTORY_VERSION_CHECK_SECONDS
+
+
+def refresh(force: bool = False) -> tuple[int, InventorySnapshot]:
+    """Reload the inventory if Redis reports a newer version."""
+    global _snapshot, _checked_at
+    now = time.monotonic()
+    if not force and _is_fresh(now):
+        return _snapshot
+
+    with _lock:
+        if not force and _is_fresh(now):
+            return _snapshot
+        # Read the version before the data: a concurrent upload then shows up as
+        # a newer version on the next check instead of being masked.
+        version = get_inventory_version()
+        if force or _snapshot is None or version != _snapshot[0]:
+            _snapshot = (version, _load(version))
+            for callback in _listeners:
+                callback(version)
+        _checked_at = now
+        return _snapshot
+
+
+def current() -> tuple[int, InventorySnapshot]:
+    """(version, items) of the up-to-date inventory snapshot."""
+    return refresh()
+
+
+def items() -> InventorySnapshot:
+    return refresh()[1]
+
+
+def version() -> int:
+    """Current inventory version without loading the items.
+
+    For tools that query the index in Redis instead of the snapshot; polled at
+    the same rate as ``refresh``.
+    """
+    global _polled
+    now = time.monotonic()
+    if _is_fresh(now):
+        return _snapshot[0]
+    checked_at, value = _polled
+    if now - checked_at >= INVENTORY_VERSION_CHECK_SECONDS:
+        value = get_inventory_version()
+        _polled = (now, value)
+    return value
@@ -0,0 +1,97 @@
+from typing import Optional
+
+import numpy as np
+
+from .inventory_snapshot import CATEGORICAL, InventorySnapshot
+
+# -----------------------------
+# Vectorized aggregation over the snapshot columns
+# -----------------------------
+# Filters become boolean masks over the category codes, group-by is a
+# bincount over the codes: no item dict is built, whatever the inventory size.
+
+METRICS = ("count", "sum", "avg", "min", "max")
+VALUE_FIELDS = ("quantity", "weight", "volume")
+GROUP_FIELDS = CATEGORICAL
+
+
+def values(snapshot: InventorySnapshot, field: str) -> np.ndarray:
+    return snapshot.volume() if field == "volume" else snapshot.column(field)
+
+
+def _codes_where(snapshot: InventorySnapshot, field: str, predicate) -> np.ndarray:
+    # Filters are evaluated on the (few) categories, then broadcast through the codes
+    wanted = [code for code, category in enumerate(snapshot.categories(field)) if predicate(category.lower())]
+    return np.isin(snapshot.codes(field), wanted)
+
+
+def filter_mask(
+    snapshot: InventorySnapshot,
+    *,
+    status: Optional[str] = None,
+    item_type: Optional[str] = None,
+    location: Optional[str] = None,
+) -> np.ndarray:
+    """Rows matching every given filter: exact status/type, location substring (case-insensitive)."""
+    mask = np.ones(len(snapshot), dtype=bool)
+    if status:
+        mask &= _codes_where(snapshot, "status", lambda c: c == status.strip().lower())
+    if item_type:
+        mask &= _codes_where(snapshot, "type", lambda c: c == item_type.strip().lower())
+    if location:
+        mask &= _codes_where(snapshot, "location", lambda c: location.strip().lower() in c)
+    return mask
+
+
+def _reduce(metric: str, data: np.ndarray) -> float:
+    if metric == "count":
+        return float(len(data))
+    if not len(data):
+        return float("nan")
+    return float({"sum": np.sum, "avg": np.mean, "min": np.min, "max": np.max}[metric](data))
+
+
+def aggregate(
+    snapshot: InventorySnapshot,
+    metric: str,
+    field: str = "quantity",
+    group_by: Optional[str] = None,
+    mask: Optional[np.ndarray] = None,
+) -> list[tuple[str, float, int]]:
+    """(group, value, items) rows of ``metric`` over ``field``, largest value first (smallest for min).
+
+    Without ``group_by`` there is a single row named "". Groups without
+    matching items are left out.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"metric must be one of {METRICS}, not {metric!r}")
+    if field not in VALUE_FIELDS:
+        raise ValueError(f"field must be one of {VALUE_FIELDS}, not {field!r}")
+    if group_by is not None and group_by not in GROUP_FIELDS:
+        raise ValueError(f"group_by must be one of {GROUP_FIELDS}, not {group_by!r}")
+
+    data = values(snapshot, field)
+    if mask is not None:
+        data = data[mask]
+    if group_by is None:
+        return [("", _reduce(metric, data), len(data))]
+
+    codes = snapshot.codes(group_by)
+    if mask is not None:
+        codes = codes[mask]
+    groups = len(snapshot.categories(group_by))
+    counts = np.bincount(codes, minlength=groups)
+    if metric == "count":
+        result = counts.astype(np.float64)
+    elif metric in ("sum", "avg"):
+        result = np.bincount(codes, weights=data, minlength=groups)
+        if metric == "avg":
+            result = np.divide(result, counts, out=np.full(groups, np.nan), where=counts > 0)
+    else:
+        result = np.full(groups, np.inf if metric == "min" else -np.inf)
+        (np.minimum if metric == "min" else np.maximum).at(result, codes, data)
+
+    present = np.flatnonzero(counts)
+    order = present[np.argsort(result[present] if metric == "min" else -result[present], kind="stable")]
+    categories = snapshot.categories(group_by)
+    return [(categories[code], float(result[code]), int(counts[code])) for code in order]
@@ -0,0 +1,225 @@
+import re
+import threading
+from collections import Counter as Tally
+from typing import Optional
+
+from redis.commands.search import reducers
+from redis.commands.search.aggregation import AggregateRequest
+from redisvl.index import SearchIndex
+from redisvl.query import FilterQuery, VectorQuery
+from redisvl.query.filter import FilterExpression, Num, Tag, Text
+
+from app.chatstore.redis_client import parse_tool_doc
+from app.chatstore.replicas import read_router
+from app.utils.config import (
+    INVENTORY_VERSION_KEY,
+    TOOL_KEY_PREFIX,
+    TOOL_QUERY_DEFAULT_LIMIT,
+    TOOL_QUERY_MAX_RESULTS,
+    TOOL_SEMANTIC_MAX_DISTANCE,
+    QUERY_EMBEDDING_CACHE_SIZE,
+)
+from app.utils.embedding import embed_texts_sync
+from app.utils.metrics import Counter, Histogram
+from .tool_cache import LRUCache, normalize_arg
+from .tool_index import schema as tool_schema
+
+# -----------------------------
+# Queries on the tool index
+# -----------------------------
+# Tool arguments are compiled into a RediSearch filter (optionally under a KNN
+# clause on the item embeddings) and run as one FT.SEARCH with LIMIT/SORTBY,
+# so only the requested page of items leaves Redis.
+
+INVENTORY_QUERIES = Counter(
+    "inventory_queries_total",
+    "Filter and vector queries run on the tool index, by tool",
+    ["tool"],
+)
+QUERY_EMBEDDING_LOOKUPS = Counter(
+    "query_embedding_cache_lookups_total",
+    "Query embedding cache lookups by result (hit, miss)",
+    ["result"],
+)
+INVENTORY_QUERY_MATCHES = Histogram(
+    "inventory_query_matches",
+    "Items matched by one filter query (before the limit)",
+    buckets=(0, 1, 5, 10, 50, 100, 500, 1000, 5000),
+)
+
+SORT_FIELDS = ("quantity", "weight")  # SORTABLE numeric fields of the tool schema
+RETURN_FIELDS = [f["name"] for f in tool_schema["fields"] if f["type"] != "vector"]
+VECTOR_FIELD = next(f["name"] for f in tool_schema["fields"] if f["type"] == "vector")
+
+# Query text -> embedding bytes. Item embeddings change with uploads, query
+# embeddings do not, so this cache outlives inventory versions.
+query_embedding_cache = LRUCache(QUERY_EMBEDDING_CACHE_SIZE)
+
+_indexes: dict[str, SearchIndex] = {}
+_lock = threading.Lock()
+
+
+def _index(source) -> SearchIndex:
+    with _lock:
+        index = _indexes.get(source.name)
+        if index is None:
+            index = _indexes[source.name] = SearchIndex.from_dict(tool_schema, redis_client=source.sync())
+        return index
+
+
+def _phrase(value: str) -> str:
+    # Text phrases are quoted by redisvl but not escaped; keep words only
+    return " ".join(re.sub(r"[^\w\s]", " ", value).split())
+
+
+def _num_range(field: str, low: Optional[float], high: Optional[float]) -> Optional[FilterExpression]:
+    if low is not None and high is not None:
+        return Num(field).between(low, high)
+    if low is not None:
+        return Num(field) >= low
+    if high is not None:
+        return Num(field) <= high
+    return None
+
+
+def build_filter(
+    *,
+    status: Optional[str] = None,
+    item_type: Optional[str] = None,
+    location: Optional[str] = None,
+    tags: Optional[list[str]] = None,
+    min_weight: Optional[float] = None,
+    max_weight: Optional[float] = None,
+    min_quantity: Optional[float] = None,
+    max_quantity: Optional[float] = None,
+) -> Optional[FilterExpression]:
+    """AND of the given conditions (None when there are none, i.e. match everything).
+
+    Tags match case-insensitively and ``tags`` matches items carrying any of
+    them; ``location`` is a phrase match on the location text; ranges are
+    inclusive.
+    """
+    terms = []
+    if status and status.strip():
+        terms.append(Tag("status") == status.strip())
+    if item_type and item_type.strip():
+        terms.append(Tag("type") == item_type.strip())
+    if location and _phrase(location):
+        terms.append(Text("location") == _phrase(location))
+    tags = [t.strip() for t in tags or [] if t.strip()]
+    if tags:
+        terms.append(Tag("tags") == tags)
+    terms.append(_num_range("weight", min_weight, max_weight))
+    terms.append(_num_range("quantity", min_quantity, max_quantity))
+
+    expression = None
+    for term in terms:
+        if term is not None:
+            expression = term if expression is None else expression & term
+    return expression
+
+
+def query_embedding(text: str) -> bytes:
+    key = normalize_arg(text)
+    vector = query_embedding_cache.get(key)
+    QUERY_EMBEDDING_LOOKUPS.labels(result="miss" if vector is None else "hit").inc()
+    if vector is None:
+        vector = embed_texts_sync([text])[0].tobytes()
+        query_embedding_cache.put(key, vector)
+    return vector
+
+
+def _source_index(version: int) -> SearchIndex:
+    return _index(read_router.source_at("inventory_query", INVENTORY_VERSION_KEY, version))
+
+
+def _run(tool: str, query, version: int):
+    result = _source_index(version).search(query, query_params=query.params)
+    INVENTORY_QUERIES.labels(tool=tool).inc()
+    return result
+
+
+def _item(doc) -> dict:
+    # redis-py moves the document key into ``id``, dropping the stored id field
+    fields = {k: v for k, v in doc.__dict__.items() if k not in ("id", "payload")}
+    fields["id"] = doc.id[len(TOOL_KEY_PREFIX):] if doc.id.startswith(TOOL_KEY_PREFIX) else doc.id
+    return parse_tool_doc(fields)
+
+
+def search_items(
+    tool: str,
+    expression: Optional[FilterExpression],
+    *,
+    sort_by: Optional[str] = None,
+    descending: bool = False,
+    limit: int = TOOL_QUERY_DEFAULT_LIMIT,
+    offset: int = 0,
+    version: int = 0,
+) -> tuple[int, list[dict]]:
+    """(total matches, ``limit`` items from ``offset``) of ``expression`` on the tool index.
+
+    ``limit`` is capped by TOOL_QUERY_MAX_RESULTS. A read replica is used only
+    if it already holds inventory ``version``.
+    """
+    if sort_by is not None and sort_by not in SORT_FIELDS:
+        raise ValueError(f"sort_by must be one of {SORT_FIELDS}, not {sort_by!r}")
+    query = FilterQuery(
+        filter_expression=expression if expression is not None else "*",
+        return_fields=RETURN_FIELDS,
+        num_results=max(1, min(limit, TOOL_QUERY_MAX_RESULTS)),
+    )
+    query.paging(max(0, offset), max(1, min(limit, TOOL_QUERY_MAX_RESULTS)))
+    if sort_by:
+        query.sort_by(sort_by, asc=not descending)
+
+    result = _run(tool, query, version)
+    INVENTORY_QUERY_MATCHES.observe(result.total)
+    return result.total, [_item(doc) for doc in result.docs]
+
+
+def count_by(
+    tool: str,
+    expression: Optional[FilterExpression],
+    fields: tuple[str, ...],
+    *,
+    version: int = 0,
+) -> dict[str, Tally]:
+    """Match counts per value of each tag field in ``fields``, from one FT.AGGREGATE."""
+    request = AggregateRequest(str(expression) if expression is not None else "*").group_by(
+        [f"@{field}" for field in fields], reducers.count().alias("count")
+    ).dialect(2)
+    result = _source_index(version).aggregate(request)
+    INVENTORY_QUERIES.labels(tool=tool).inc()
+
+    counts = {field: Tally() for field in fields}
+    for row in result.rows:
+        values = dict(zip(row[::2], row[1::2]))
+        for field in fields:
+            counts[field][values.get(field) or "?"] += int(values["count"])
+    return counts
+
+
+def semantic_search(
+    tool: str,
+    text: str,
+    expression: Optional[FilterExpression] = None,
+    *,
+    limit: int = TOOL_QUERY_DEFAULT_LIMIT,
+    max_distance: float = TOOL_SEMANTIC_MAX_DISTANCE,
+    version: int = 0,
+) -> list[tuple[dict, float]]:
+    """(item, cosine distance) of the items nearest to ``text``, nearest first.
+
+    KNN over the upload embeddings, restricted to ``expression`` inside the
+    same query; hits farther than ``max_distance`` are dropped.
+    """
+    query = VectorQuery(
+        vector=query_embedding(text),
+        vector_field_name=VECTOR_FIELD,
+        return_fields=RETURN_FIELDS,
+        filter_expression=expression if expression is not None else "*",
+        num_results=max(1, min(limit, TOOL_QUERY_MAX_RESULTS)),
+    )
+    result = _run(tool, query, version)
+    hits = [(_item(doc), float(doc.vector_distance)) for doc in result.docs]
+    return [(item, distance) for item, distance in hits if distance <= max_distance]
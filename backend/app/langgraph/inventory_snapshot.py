@@ -0,0 +1,304 @@
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+from collections.abc import Mapping
+from typing import Callable, Iterator, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------
+# Columnar inventory snapshot
+# -----------------------------
+# One file per host holds the whole inventory: numeric fields as float64
+# columns, low-cardinality fields as int32 codes into a category table, and
+# free text as an offsets array + UTF-8 blob. Every worker maps it read-only,
+# so the pages are shared through the page cache instead of each process
+# holding its own dict of dicts. Rows are sorted by id.
+#
+# Layout: header | TOC (JSON) | 8-byte aligned sections. The TOC maps each
+# section name to [offset, dtype, count].
+
+MAGIC = b"INVSNAP1"
+_HEADER = struct.Struct("<8sQQQ")  # magic, inventory version, rows, TOC length
+
+NUMERIC = ("quantity", "weight", "dim_length", "dim_width", "dim_height")
+CATEGORICAL = ("type", "status", "location", "unit")
+TEXT = ("id", "name", "created_at", "updated_at", "tags", "metadata", "images")
+# Lower-cased copies searched by substring; fields in ``haystack`` are separated by \x1f
+SEARCH = ("name_lc", "haystack")
+
+_DIMENSIONS = {"dim_length": "length", "dim_width": "width", "dim_height": "height"}
+
+
+def _haystack(item: dict) -> str:
+    # The fields get_inventory_info matches on
+    parts = [item["id"], item.get("name") or "", item.get("location") or "", item.get("type") or ""]
+    parts += item.get("tags", [])
+    parts += [str(v) for v in item.get("metadata", {}).values()]
+    return "\x1f".join(p.lower() for p in parts)
+
+
+def encode_snapshot(version: int, items: dict) -> bytes:
+    """Serialize ``items`` (id -> item dict, as parse_tool_doc builds them)."""
+    rows = [items[key] for key in sorted(items)]
+    sections: dict[str, np.ndarray] = {}
+
+    def strings(name: str, values: list[str]):
+        encoded = [v.encode() for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+        offsets[1:] = np.cumsum([len(b) for b in encoded], dtype=np.uint64)
+        sections[f"{name}.offsets"] = offsets
+        sections[f"{name}.blob"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+    for field in NUMERIC:
+        key = _DIMENSIONS.get(field)
+        sections[field] = np.array(
+            [float(item["dimensions"][key] if key else item.get(field) or 0) for item in rows], dtype=np.float64
+        )
+    for field in CATEGORICAL:
+        values = [item.get(field) or "" for item in rows]
+        categories = sorted(set(values))
+        lookup = {value: code for code, value in enumerate(categories)}
+        sections[f"{field}.codes"] = np.array([lookup[v] for v in values], dtype=np.int32)
+        strings(f"{field}.categories", categories)
+    strings("id", [item["id"] for item in rows])
+    strings("name", [item.get("name") or "" for item in rows])
+    strings("created_at", [item.get("created_at") or "" for item in rows])
+    strings("updated_at", [item.get("updated_at") or "" for item in rows])
+    strings("tags", [",".join(item.get("tags", [])) for item in rows])
+    strings("metadata", [json.dumps(item.get("metadata", {}), ensure_ascii=False) for item in rows])
+    strings("images", [json.dumps(item.get("images", []), ensure_ascii=False) for item in rows])
+    strings("name_lc", [(item.get("name") or "").lower() for item in rows])
+    strings("haystack", [_haystack(item) for item in rows])
+
+    # Offsets depend on the TOC length, which depends on the offsets: size the
+    # TOC with placeholder offsets first, then pad it to that size.
+    toc = {name: [0, array.dtype.str, len(array)] for name, array in sections.items()}
+    toc_size = len(json.dumps(toc)) + 16 * len(toc)
+    position = _HEADER.size + toc_size
+    for name, array in sections.items():
+        position += -position % 8
+        toc[name][0] = position
+        position += array.nbytes
+    toc_bytes = json.dumps(toc).encode().ljust(toc_size)
+
+    out = bytearray(_HEADER.pack(MAGIC, version, len(rows), toc_size) + toc_bytes)
+    for name, array in sections.items():
+        out += b"\0" * (toc[name][0] - len(out))
+        out += array.tobytes()
+    return bytes(out)
+
+
+class InventorySnapshot(Mapping):
+    """Read-only view of an encoded snapshot (mmap or bytes), usable as ``{id: item}``.
+
+    Item dicts are built on access; the ``search``/``rows_where``/``column``
+    methods work on the columns directly.
+    """
+
+    def __init__(self, buffer):
+        self._buf = buffer
+        magic, self.version, self.rows, toc_size = _HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError("not an inventory snapshot")
+        self._toc = json.loads(bytes(buffer[_HEADER.size:_HEADER.size + toc_size]))
+        self._arrays: dict[str, np.ndarray] = {}
+        self._categories = {field: self._strings(f"{field}.categories") for field in CATEGORICAL}
+
+    def _array(self, name: str) -> np.ndarray:
+        array = self._arrays.get(name)
+        if array is None:
+            offset, dtype, count = self._toc[name]
+            array = self._arrays[name] = np.frombuffer(self._buf, dtype=dtype, count=count, offset=offset)
+        return array
+
+    def _strings(self, name: str) -> list[str]:
+        return [self._text(name, i) for i in range(len(self._array(f"{name}.offsets")) - 1)]
+
+    def _text(self, name: str, row: int) -> str:
+        offsets = self._array(f"{name}.offsets")
+        base = self._toc[f"{name}.blob"][0]
+        return bytes(self._buf[base + int(offsets[row]):base + int(offsets[row + 1])]).decode()
+
+    # ── Columns ──
+    def column(self, field: str) -> np.ndarray:
+        """float64 column of a NUMERIC field (read-only, shared)."""
+        return self._array(field)
+
+    def volume(self) -> np.ndarray:
+        """Per-item volume in m³ (dimensions are in cm), computed once per snapshot."""
+        array = self._arrays.get("volume")
+        if array is None:
+            dims = [self.column(field) for field in _DIMENSIONS]
+            array = self._arrays["volume"] = dims[0] * dims[1] * dims[2] / 1e6
+        return array
+
+    def codes(self, field: str) -> np.ndarray:
+        """int32 codes of a CATEGORICAL field, indexing ``categories(field)``."""
+        return self._array(f"{field}.codes")
+
+    def categories(self, field: str) -> list[str]:
+        return self._categories[field]
+
+    def rows_where(self, field: str, value: str) -> np.ndarray:
+        """Rows whose CATEGORICAL ``field`` equals ``value``, ignoring case."""
+        value = value.lower()
+        matching = [code for code, category in enumerate(self._categories[field]) if category.lower() == value]
+        return np.flatnonzero(np.isin(self.codes(field), matching))
+
+    def search(self, field: str, needle: str, limit: Optional[int] = None) -> list[int]:
+        """Rows whose SEARCH ``field`` contains ``needle`` (already lower-cased), in row order.
+
+        Runs ``find`` over the blob, so nothing is decoded until a row matches.
+        """
+        if not self.rows:
+            return []
+        needle_bytes = needle.encode()
+        offsets = self._array(f"{field}.offsets")
+        base = self._toc[f"{field}.blob"][0]
+        end = base + int(offsets[-1])
+        rows, position = [], base
+        while limit is None or len(rows) < limit:
+            found = self._buf.find(needle_bytes, position, end)
+            if found < 0:
+                break
+            row = int(np.searchsorted(offsets, found - base, side="right")) - 1
+            # A match must not run past the end of its row
+            if found - base + len(needle_bytes) <= int(offsets[row + 1]):
+                rows.append(row)
+                position = base + int(offsets[row + 1])
+            else:
+                position = found + 1
+        return rows
+
+    # ── Items ──
+    def item(self, row: int) -> dict:
+        """The item dict at ``row``, in the shape ``parse_tool_doc`` returns."""
+        numbers = {field: float(self._array(field)[row]) for field in NUMERIC}
+        labels = {field: self._categories[field][self.codes(field)[row]] for field in CATEGORICAL}
+        tags = self._text("tags", row)
+        return {
+            "id": self._text("id", row),
+            "name": self._text("name", row),
+            "type": labels["type"],
+            "status": labels["status"],
+            "location": labels["location"],
+            "quantity": numbers["quantity"],
+            "unit": labels["unit"],
+            "weight": numbers["weight"],
+            "dimensions": {key: numbers[field] for field, key in _DIMENSIONS.items()},
+            "created_at": self._text("created_at", row),
+            "updated_at": self._text("updated_at", row),
+            "tags": tags.split(",") if tags else [],
+            "metadata": json.loads(self._text("metadata", row)),
+            "images": json.loads(self._text("images", row)),
+        }
+
+    def items_at(self, rows) -> list[dict]:
+        return [self.item(int(row)) for row in rows]
+
+    def row_of(self, item_id: str) -> Optional[int]:
+        """Binary search of the sorted id column."""
+        low, high = 0, self.rows
+        while low < high:
+            middle = (low + high) // 2
+            if self._text("id", middle) < item_id:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < self.rows and self._text("id", low) == item_id else None
+
+    def __getitem__(self, item_id: str) -> dict:
+        row = self.row_of(item_id)
+        if row is None:
+            raise KeyError(item_id)
+        return self.item(row)
+
+    def __iter__(self) -> Iterator[str]:
+        return (self._text("id", row) for row in range(self.rows))
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def values(self):
+        return (self.item(row) for row in range(self.rows))
+
+
+# -----------------------------
+# Shared snapshot file
+# -----------------------------
+def open_snapshot(path: str) -> Optional[InventorySnapshot]:
+    try:
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):  # ValueError: empty file
+        return None
+    return InventorySnapshot(buffer)
+
+
+def _write_atomically(path: str, data: bytes):
+    directory = os.path.dirname(path) or "."
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".inventory-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, 0o644)  # mkstemp creates it private
+        # Readers keep the old inode mapped until they reopen
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+class SnapshotFile:
+    """The snapshot file shared by the workers of one host.
+
+    Whoever first needs a version it does not hold builds it, under an
+    exclusive lock so the other workers wait and map the result instead of
+    loading from Redis themselves.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _locked(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        lock = open(f"{self.path}.lock", "a")
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    def publish(self, version: int, items: dict):
+        """Replace the file with ``items`` unless it already holds ``version``."""
+        with self._locked():
+            current = open_snapshot(self.path)
+            if current is not None and current.version == version:
+                return
+            _write_atomically(self.path, encode_snapshot(version, items))
+            logger.info("Published inventory snapshot v%d (%d items) to %s", version, len(items), self.path)
+
+    def load(self, version: int, fetch: Callable[[], dict]) -> InventorySnapshot:
+        """Mapped snapshot of ``version``, rebuilt from ``fetch()`` if the file holds another one.
+
+        Versions must match exactly: a file newer than Redis is left from a
+        Redis that was reset, not a sign of newer data.
+        """
+        snapshot = open_snapshot(self.path)
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        with self._locked():
+            snapshot = open_snapshot(self.path)
+            if snapshot is None or snapshot.version != version:
+                items = fetch()
+                _write_atomically(self.path, encode_snapshot(version, items))
+                logger.info("Built inventory snapshot v%d (%d items) in %s", version, len(items), self.path)
+                snapshot = open_snapshot(self.path)
+        return snapshot
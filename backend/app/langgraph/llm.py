@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+import httpx
+from langchain_core.messages import AIMessage, message_chunk_to_message
+from langchain_openai import ChatOpenAI
+
+from app.utils.config import (
+    LLM_MODEL,
+    LLM_BASE_URL,
+    LLM_FALLBACKS,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_KEEPALIVE_CONNECTIONS,
+    LLM_KEEPALIVE_EXPIRY,
+    LLM_CONNECT_TIMEOUT,
+    LLM_FIRST_TOKEN_TIMEOUT,
+    LLM_TIMEOUT,
+    LLM_MAX_RETRIES,
+)
+from app.utils.metrics import Counter, Histogram
+from app.utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+LLM_TTFT = Histogram(
+    "llm_time_to_first_token_seconds",
+    "Time from request to the first streamed text or tool call chunk",
+    ["model"],
+)
+LLM_LATENCY = Histogram(
+    "llm_request_seconds",
+    "Total time of a streamed LLM call",
+    ["model"],
+)
+LLM_FALLBACKS_TOTAL = Counter(
+    "llm_fallbacks_total",
+    "Endpoints abandoned because the first token missed its deadline",
+    ["model"],
+)
+
+
+class FirstTokenTimeout(TimeoutError):
+    pass
+
+
+@dataclass(frozen=True)
+class LLMEndpoint:
+    model: str
+    base_url: Optional[str] = None
+
+    @classmethod
+    def parse(cls, spec: str, default_base_url: Optional[str] = None) -> "LLMEndpoint":
+        """``"gpt-4o-mini"`` (same endpoint as the primary) or ``"gpt-4o-mini@http://host:port/v1"``."""
+        model, _, base_url = spec.strip().partition("@")
+        return cls(model=model, base_url=base_url or default_base_url)
+
+
+def configured_endpoints() -> list[LLMEndpoint]:
+    endpoints = [LLMEndpoint(LLM_MODEL, LLM_BASE_URL)]
+    endpoints += [LLMEndpoint.parse(s, LLM_BASE_URL) for s in LLM_FALLBACKS.split(",") if s.strip()]
+    return endpoints
+
+
+# === HTTP POOL ===
+@lru_cache()
+def get_http_client() -> httpx.AsyncClient:
+    """Keep-alive pool shared by every endpoint so TLS/TCP setup is paid once per connection."""
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=request_timeout(),
+    )
+
+
+async def aclose_http_client():
+    if get_http_client.cache_info().currsize:
+        await get_http_client().aclose()
+        get_http_client.cache_clear()
+        build_chat_model.cache_clear()
+
+
+def request_timeout() -> httpx.Timeout:
+    # read bounds the gap between chunks; the whole call is capped by LLM_TIMEOUT in ainvoke_with_fallback
+    return httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+
+
+# === FACTORY ===
+@lru_cache()
+def build_chat_model(endpoint: LLMEndpoint) -> ChatOpenAI:
+    return ChatOpenAI(
+        model=endpoint.model,
+        base_url=endpoint.base_url,
+        http_async_client=get_http_client(),
+        timeout=request_timeout(),
+        max_retries=LLM_MAX_RETRIES,
+        streaming=True,
+    )
+
+
+def get_chat_models() -> list[tuple[LLMEndpoint, ChatOpenAI]]:
+    return [(e, build_chat_model(e)) for e in configured_endpoints()]
+
+
+async def _stream_once(runnable, messages, config, endpoint: LLMEndpoint, first_token_timeout: Optional[float]) -> AIMessage:
+    start = time.perf_counter()
+    deadline = None if first_token_timeout is None else start + first_token_timeout
+    stream = runnable.astream(messages, config).__aiter__()
+    response = None
+    try:
+        # The first chunk is usually a role-only delta: only text or a tool call counts as the first token
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.perf_counter())
+            try:
+                chunk = await asyncio.wait_for(stream.__anext__(), remaining)
+            except asyncio.TimeoutError:
+                raise FirstTokenTimeout(f"{endpoint.model}: no token within {first_token_timeout}s")
+            except StopAsyncIteration:
+                break
+            response = chunk if response is None else response + chunk
+            if chunk.content or chunk.tool_call_chunks:
+                LLM_TTFT.labels(model=endpoint.model).observe(time.perf_counter() - start)
+                break
+        if response is None:
+            raise RuntimeError(f"{endpoint.model}: empty response stream")
+
+        async for chunk in stream:
+            response += chunk
+    finally:
+        await stream.aclose()
+
+    LLM_LATENCY.labels(model=endpoint.model).observe(time.perf_counter() - start)
+    return message_chunk_to_message(response)
+
+
+async def ainvoke_with_fallback(messages, tools=None, config=None, first_token_timeout: float = LLM_FIRST_TOKEN_TIMEOUT) -> AIMessage:
+    """Stream a completion, moving to the next endpoint when the first token is late.
+
+    Every endpoint, the last one included, gets the first-token deadline
+    (0 disables it); FirstTokenTimeout is raised when all of them miss it.
+    The whole call is capped by LLM_TIMEOUT per endpoint.
+    """
+    models = get_chat_models()
+    last_error = None
+    for i, (endpoint, model) in enumerate(models):
+        runnable = model.bind_tools(tools) if tools else model
+        try:
+            with span("llm", model=endpoint.model, attempt=i):
+                return await asyncio.wait_for(
+                    _stream_once(runnable, messages, config, endpoint, first_token_timeout or None),
+                    LLM_TIMEOUT,
+                )
+        except FirstTokenTimeout as e:
+            LLM_FALLBACKS_TOTAL.labels(model=endpoint.model).inc()
+            logger.warning("%s, %s", e, "falling back" if i < len(models) - 1 else "no endpoint left")
+            last_error = e
+    raise last_error
@@ -1,18 +1,243 @@
 # app/langgraph/memory.py
-from langchain_community.chat_message_histories import RedisChatMessageHistory
-from langchain_core.runnables.history import RunnableWithMessageHistory
-
-def get_message_history(session_id: str):
-    return RedisChatMessageHistory(
-        session_id=session_id,
-        url="redis://localhost:6379",  # tùy chỉnh theo server Redis
-        ttl=None  # hoặc TTL (giây) nếu cần tự xoá
-    )
-
-def wrap_with_memory(graph):
-    return RunnableWithMessageHistory(
-        graph,
-        get_message_history,
-        input_messages_key="messages",
-        history_messages_key="messages"
-    )
\ No newline at end of file
+from typing import Any, AsyncIterator, Optional, Sequence
+
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from redis.asyncio import Redis as AsyncRedis
+
+from app.chatstore.connection import hash_tag, redis_manager, unlink_keys
+from app.utils.config import CHECKPOINT_PREFIX, CHECKPOINT_TTL_SECONDS, CHECKPOINT_MAX_MESSAGES
+from app.utils.tracing import stage
+
+
+def session_thread_id(agent: Optional[str], user_id: Optional[str], session_id: str) -> str:
+    """Checkpoint thread for a chat session; mirrors the chat document id."""
+    return f"{agent}:{user_id}:{session_id}"
+
+
+class RedisCheckpointSaver(BaseCheckpointSaver):
+    """Async LangGraph checkpointer that keeps only the latest checkpoint per thread.
+
+    Chat sessions never time-travel, so each ``put`` overwrites the previous
+    checkpoint and drops its pending writes. A turn therefore reads one hash
+    (plus the writes of that checkpoint) in a single round trip, whatever the
+    length of the conversation.
+
+    Layout (binary values, serialized with the graph's serde):
+      ``{prefix}:{thread_id}:{ns}``         id, parent_id, checkpoint, metadata
+      ``{prefix}:{thread_id}:{ns}:writes``  "{checkpoint_id}|{task_id}|{idx}" -> write
+    On a Redis Cluster the thread id is wrapped in a hash tag, keeping both in one slot.
+    """
+
+    def __init__(self, client: Optional[AsyncRedis] = None, *, prefix: str = CHECKPOINT_PREFIX, ttl: int = CHECKPOINT_TTL_SECONDS):
+        super().__init__()
+        self._client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    @property
+    def client(self) -> AsyncRedis:
+        if self._client is None:
+            self._client = redis_manager.aio(decode=False)
+        return self._client
+
+    # --- keys / encoding ---
+    def _key(self, thread_id: str, checkpoint_ns: str = "") -> str:
+        # Tagged on a cluster: the checkpoint and its writes are used in one transaction
+        return f"{self.prefix}:{hash_tag(thread_id)}:{checkpoint_ns}"
+
+    def _dump(self, value: Any) -> bytes:
+        type_, data = self.serde.dumps_typed(value)
+        return type_.encode() + b"\x00" + data
+
+    def _load(self, raw: bytes) -> Any:
+        type_, _, data = raw.partition(b"\x00")
+        return self.serde.loads_typed((type_.decode(), data))
+
+    # --- reads ---
+    async def ahas_thread(self, thread_id: str) -> bool:
+        return bool(await self.client.exists(self._key(thread_id)))
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        key = self._key(thread_id, checkpoint_ns)
+
+        with stage("checkpoint_load"):
+            async with self.client.pipeline(transaction=False) as pipe:
+                pipe.hgetall(key)
+                pipe.hgetall(f"{key}:writes")
+                saved, writes = await pipe.execute()
+        if not saved:
+            return None
+
+        checkpoint_id = saved[b"id"].decode()
+        requested_id = get_checkpoint_id(config)
+        if requested_id and requested_id != checkpoint_id:
+            return None  # history is not kept
+
+        parent_id = saved.get(b"parent_id", b"").decode()
+        current = []
+        for field, raw in writes.items():
+            write_checkpoint_id, task_id, idx = field.decode().split("|")
+            if write_checkpoint_id == checkpoint_id:
+                current.append(((task_id, int(idx)), raw))
+        pending_writes = [tuple(self._load(raw)) for _, raw in sorted(current)]
+
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint=self._load(saved[b"checkpoint"]),
+            metadata=self._load(saved[b"metadata"]),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_id,
+                    }
+                }
+                if parent_id
+                else None
+            ),
+            pending_writes=pending_writes,
+        )
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        if config is None or limit == 0:
+            return
+        latest = await self.aget_tuple(config)
+        if latest is None:
+            return
+        if before and get_checkpoint_id(before) and latest.checkpoint["id"] >= get_checkpoint_id(before):
+            return
+        if filter and any(latest.metadata.get(k) != v for k, v in filter.items()):
+            return
+        yield latest
+
+    # --- writes ---
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        key = self._key(thread_id, checkpoint_ns)
+
+        with stage("checkpoint_save"):
+            await self._put(key, config, checkpoint, metadata)
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    async def _put(self, key: str, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata):
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping={
+                "id": checkpoint["id"],
+                "parent_id": config["configurable"].get("checkpoint_id") or "",
+                "checkpoint": self._dump(checkpoint),
+                "metadata": self._dump(get_checkpoint_metadata(config, metadata)),
+            })
+            # Writes belong to the checkpoint being replaced
+            pipe.delete(f"{key}:writes")
+            if self.ttl:
+                pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        writes_key = f"{self._key(thread_id, checkpoint_ns)}:writes"
+
+        async with self.client.pipeline(transaction=True) as pipe:
+            for idx, (channel, value) in enumerate(writes):
+                write_idx = WRITES_IDX_MAP.get(channel, idx)
+                field = f"{checkpoint_id}|{task_id}|{write_idx}"
+                raw = self._dump((task_id, channel, value))
+                # Regular writes are idempotent per (task, idx); special channels overwrite
+                if write_idx >= 0:
+                    pipe.hsetnx(writes_key, field, raw)
+                else:
+                    pipe.hset(writes_key, field, raw)
+            if self.ttl:
+                pipe.expire(writes_key, self.ttl)
+            await pipe.execute()
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        key = self._key(thread_id)
+        await self.client.delete(key, f"{key}:writes")
+
+    async def aclear(self) -> int:
+        """Drop every thread; used when all chat data is cleared."""
+        keys = [key async for key in self.client.scan_iter(match=f"{self.prefix}:*", count=500)]
+        return await unlink_keys(self.client, keys)
+
+
+checkpointer = RedisCheckpointSaver()
+
+
+def drop_unanswered_tool_calls(messages: list) -> list:
+    """Skip AI tool calls that never got their ToolMessages.
+
+    A run cancelled between the model's tool call and the tool results leaves
+    such a message in the checkpoint, and the chat API rejects it on the next turn.
+    """
+    answered = {m.tool_call_id for m in messages if isinstance(m, ToolMessage)}
+    return [
+        m for m in messages
+        if not (isinstance(m, AIMessage) and m.tool_calls and any(c["id"] not in answered for c in m.tool_calls))
+    ]
+
+
+def compact_messages(messages: list, max_messages: int = CHECKPOINT_MAX_MESSAGES) -> list:
+    """RemoveMessage updates that keep the stored thread small.
+
+    Injected system context is dropped (the system prompt is rebuilt on every
+    call) and only the last ``max_messages`` are kept, cut at a user turn so no
+    ToolMessage is left without its tool call.
+    """
+    keep = [m for m in messages if not isinstance(m, SystemMessage)]
+    if max_messages and len(keep) > max_messages:
+        cut = len(keep) - max_messages
+        while cut < len(keep) and not isinstance(keep[cut], HumanMessage):
+            cut += 1
+        keep = keep[cut:]
+    kept_ids = {m.id for m in keep}
+    return [RemoveMessage(id=m.id) for m in messages if m.id not in kept_ids]
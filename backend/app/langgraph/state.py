@@ -1,7 +1,10 @@
-from typing import Annotated
+from typing import Annotated, Optional
 from typing_extensions import TypedDict
 from langgraph.graph.message import add_messages
 
 
 class AgentState(TypedDict):
     messages: Annotated[list, add_messages]
+    # Written by the parallel prefetch nodes, consumed and cleared by "join"
+    prefetched_history: Optional[list]
+    retrieved_context: Optional[str]
@@ -0,0 +1,103 @@
+import functools
+import json
+import threading
+from collections import OrderedDict
+
+from app.utils.config import TOOL_CACHE_SIZE
+from app.utils.metrics import Counter
+from . import inventory
+
+TOOL_CACHE_LOOKUPS = Counter(
+    "tool_cache_lookups_total",
+    "Tool result cache lookups by tool and result (hit, miss)",
+    ["tool", "result"],
+)
+
+
+class LRUCache:
+    """Thread-safe LRU map; tools may run in executor threads."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+tool_result_cache = LRUCache(TOOL_CACHE_SIZE)
+
+# Entries are keyed by version already; dropping them on reload just frees memory early.
+inventory.on_reload(lambda version: tool_result_cache.clear())
+
+
+def normalize_arg(value):
+    # Lookups are case-insensitive, so "OBJ-001 " and "obj-001" share an entry.
+    if isinstance(value, str):
+        return " ".join(value.split()).casefold()
+    return value
+
+
+def cache_key(tool_name: str, kwargs: dict, version: int) -> tuple:
+    args = json.dumps(
+        {k: normalize_arg(v) for k, v in kwargs.items()},
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return tool_name, args, version
+
+
+def _snapshot_version() -> int:
+    return inventory.current()[0]
+
+
+def memoize_tool(func=None, *, version=_snapshot_version):
+    """Memoize a tool function by (name, normalized args, inventory version).
+
+    Apply it under ``@tool`` so the schema still comes from ``func``'s signature.
+    Cached results are shared, callers must not mutate them. Tools that do not
+    read the in-memory snapshot pass ``version=inventory.version`` so a lookup
+    does not load it.
+    """
+    if func is None:
+        return functools.partial(memoize_tool, version=version)
+
+    @functools.wraps(func)
+    def wrapper(**kwargs):
+        if tool_result_cache.maxsize <= 0:
+            return func(**kwargs)
+
+        key = cache_key(func.__name__, kwargs, version())
+        result = tool_result_cache.get(key)
+        if result is not None:
+            TOOL_CACHE_LOOKUPS.labels(tool=func.__name__, result="hit").inc()
+            return result
+
+        TOOL_CACHE_LOOKUPS.labels(tool=func.__name__, result="miss").inc()
+        result = func(**kwargs)
+        tool_result_cache.put(key, result)
+        return result
+
+    return wrapper
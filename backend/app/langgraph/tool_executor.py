@@ -0,0 +1,117 @@
+import asyncio
+import json
+import time
+from typing import Literal
+
+from langchain_core.messages import ToolMessage
+from langchain_core.messages.tool import ToolCall
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.runnables import RunnableConfig
+from langgraph.constants import CONF, CONFIG_KEY_STREAM_WRITER
+from langgraph.prebuilt import ToolNode
+
+from app.utils.config import TOOL_MAX_CONCURRENCY, TOOL_TIMEOUT_SECONDS, TOOL_TIMEOUTS
+from app.utils.metrics import Counter, Histogram
+from app.utils.tracing import span
+
+TOOL_LATENCY = Histogram(
+    "tool_latency_seconds",
+    "Wall-clock time of a single tool call",
+    ["tool", "outcome"],
+)
+TOOL_CALLS = Counter(
+    "tool_calls_total",
+    "Tool calls by outcome (ok, error, timeout)",
+    ["tool", "outcome"],
+)
+TOOL_OUTPUT_TOKENS = Histogram(
+    "tool_output_tokens",
+    "Approximate tokens of a tool message sent back to the model (4 chars per token)",
+    ["tool"],
+    buckets=(50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000),
+)
+
+
+def tool_timeout(name: str) -> float:
+    return TOOL_TIMEOUTS.get(name, TOOL_TIMEOUT_SECONDS)
+
+
+def timeout_message(call: ToolCall, timeout: float) -> ToolMessage:
+    """Structured result handed back to the model when a tool misses its deadline."""
+    text = f"⏱️ Công cụ '{call['name']}' không phản hồi trong {timeout:g}s."
+    payload = {
+        "result": "timeout",
+        "error": f"Tool '{call['name']}' did not finish within {timeout:g}s",
+        "content": [{"type": "text", "text": text}],
+    }
+    return ToolMessage(
+        content=json.dumps(payload, ensure_ascii=False),
+        name=call["name"],
+        tool_call_id=call["id"],
+        status="error",
+    )
+
+
+def emit_tool_event(config: RunnableConfig, event: dict):
+    """Write a ``custom`` stream event; dropped unless the caller streams that mode."""
+    writer = config.get(CONF, {}).get(CONFIG_KEY_STREAM_WRITER)
+    if writer is not None:
+        writer(event)
+
+
+class BoundedToolNode(ToolNode):
+    """ToolNode that fans tool calls out concurrently under a shared cap.
+
+    Each call gets its own deadline (``TOOL_TIMEOUTS`` overrides the default
+    ``TOOL_TIMEOUT_SECONDS``) and its latency is recorded per tool name.
+    Tools with a native coroutine are awaited directly; sync-only tools run
+    in the default executor via ``BaseTool.ainvoke``.
+
+    The deadline cancels the await, not the work: a coroutine tool is
+    cancelled, but a sync tool's executor thread cannot be interrupted and
+    runs to completion after the timeout message is returned, its result
+    discarded. Its slot under the cap is released at the deadline, so a
+    slow sync tool can keep executor threads busy beyond
+    ``max_concurrency``; give such tools a native coroutine, or bound
+    their own I/O (e.g. socket timeouts) below their deadline.
+
+    Every call is bracketed by ``tool_start`` / ``tool_end`` custom stream
+    events, so a caller streaming ``"custom"`` sees each result as soon as
+    that tool finishes rather than when the whole node does.
+    """
+
+    def __init__(self, tools, *, max_concurrency: int = TOOL_MAX_CONCURRENCY, **kwargs):
+        super().__init__(tools, **kwargs)
+        self.max_concurrency = max(1, max_concurrency)
+        self._semaphore: asyncio.Semaphore | None = None
+
+    async def _arun_one(
+        self,
+        call: ToolCall,
+        input_type: Literal["list", "dict", "tool_calls"],
+        config: RunnableConfig,
+    ) -> ToolMessage:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        timeout = tool_timeout(call["name"])
+        emit_tool_event(config, {"event": "tool_start", "id": call["id"], "name": call["name"], "args": call["args"]})
+        async with self._semaphore:
+            start = time.perf_counter()
+            try:
+                with span("tool", tool=call["name"]):
+                    response = await asyncio.wait_for(
+                        super()._arun_one(call, input_type, config), timeout
+                    )
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                response = timeout_message(call, timeout)
+            else:
+                outcome = "error" if getattr(response, "status", None) == "error" else "ok"
+            elapsed = time.perf_counter() - start
+
+        TOOL_LATENCY.labels(tool=call["name"], outcome=outcome).observe(elapsed)
+        TOOL_CALLS.labels(tool=call["name"], outcome=outcome).inc()
+        TOOL_OUTPUT_TOKENS.labels(tool=call["name"]).observe(count_tokens_approximately([response]))
+        emit_tool_event(config, {"event": "tool_end", "id": call["id"], "name": call["name"], "message": response})
+        return response
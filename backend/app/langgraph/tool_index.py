@@ -0,0 +1,79 @@
+import hashlib
+import json
+import logging
+
+from redisvl.index import SearchIndex
+
+from app.chatstore.connection import redis_manager
+from app.utils.config import EMBEDDING_DIM, TOOL_INDEX_NAME, TOOL_KEY_PREFIX
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------
+# Tool (inventory) index
+# -----------------------------
+# Shared by the upload route, which writes the documents, and the inventory
+# queries. The fingerprint of the schema an index was created with is kept in
+# SCHEMA_KEY, so a changed schema (e.g. a field made SORTABLE) recreates the
+# index instead of leaving queries to fail on the old one.
+
+schema = {
+    "index": {"name": TOOL_INDEX_NAME, "prefix": TOOL_KEY_PREFIX},
+    "fields": [
+        {"name": "id", "type": "tag"},
+        {"name": "name", "type": "text"},
+        {"name": "type", "type": "tag"},
+        {"name": "status", "type": "tag"},
+        {"name": "location", "type": "text"},
+        {"name": "quantity", "type": "numeric", "attrs": {"sortable": True}},
+        {"name": "unit", "type": "tag"},
+        {"name": "weight", "type": "numeric", "attrs": {"sortable": True}},
+        {"name": "dim_length", "type": "numeric"},
+        {"name": "dim_width", "type": "numeric"},
+        {"name": "dim_height", "type": "numeric"},
+        {"name": "created_at", "type": "text"},
+        {"name": "updated_at", "type": "text"},
+        {"name": "tags", "type": "tag"},
+        {"name": "metadata", "type": "text"},
+        {"name": "images", "type": "text"},
+        {
+            "name": "embedding",
+            "type": "vector",
+            "attrs": {
+                "dims": EMBEDDING_DIM,
+                "distance_metric": "cosine",
+                "algorithm": "hnsw",
+                "datatype": "float32"
+            }
+        }
+    ]
+}
+
+SCHEMA_KEY = f"{TOOL_INDEX_NAME}:schema"
+
+index = SearchIndex.from_dict(schema, redis_client=redis_manager.sync(decode=False))
+
+
+def schema_fingerprint(tool_schema: dict = schema) -> str:
+    return hashlib.sha1(json.dumps(tool_schema, sort_keys=True).encode()).hexdigest()
+
+
+def ensure_tool_index():
+    """Create the tool index if missing, or recreate it if its schema changed.
+
+    Called from the app lifespan and before every upload. Recreating drops
+    only the index: RediSearch re-indexes the existing documents in the
+    background. Indexes created before the fingerprint was kept are recreated
+    once.
+    """
+    client = index.client
+    fingerprint = schema_fingerprint()
+    if index.exists():
+        stored = client.get(SCHEMA_KEY)
+        if stored is not None and stored.decode() == fingerprint:
+            return
+        logger.info("Tool index %s has another schema, recreating it", TOOL_INDEX_NAME)
+        index.create(overwrite=True, drop=False)
+    else:
+        index.create(overwrite=False)
+    client.set(SCHEMA_KEY, fingerprint)
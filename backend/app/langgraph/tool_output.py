@@ -0,0 +1,71 @@
+from collections import Counter
+from typing import Optional
+
+from app.utils.config import TOOL_OUTPUT_MAX_ITEMS, TOOL_OUTPUT_MAX_CHARS
+
+# -----------------------------
+# Bounded tool output
+# -----------------------------
+# Every tool message goes back into the follow-up LLM call, so listings are
+# paged (limit + opaque cursor), trimmed to TOOL_OUTPUT_MAX_CHARS and led by
+# an aggregate line that stays correct however little of the list is shown.
+
+
+def fmt_count(n: int) -> str:
+    return f"{n:,}".replace(",", ".")
+
+
+def fmt_number(x: float) -> str:
+    # Vietnamese separators: 1.234,5
+    text = f"{x:,.2f}".rstrip("0").rstrip(".")
+    return text.replace(",", "_").replace(".", ",").replace("_", ".")
+
+
+def page_bounds(cursor: Optional[str], limit: Optional[int]) -> tuple[int, int]:
+    """(offset, page size) for a tool call; bad cursors restart from the top."""
+    try:
+        offset = max(0, int(cursor)) if cursor else 0
+    except ValueError:
+        offset = 0
+    size = TOOL_OUTPUT_MAX_ITEMS if limit is None else max(1, min(limit, TOOL_OUTPUT_MAX_ITEMS))
+    return offset, size
+
+
+def fit_lines(lines: list[str], budget: int = TOOL_OUTPUT_MAX_CHARS) -> int:
+    """How many of ``lines`` fit in ``budget`` characters (at least one)."""
+    used = 0
+    for n, line in enumerate(lines):
+        used += len(line) + 1
+        if used > budget and n:
+            return n
+    return len(lines)
+
+
+SUMMARY_FIELDS = ("type", "status")
+
+
+def summarize(items: list[dict], fields: tuple[str, ...] = SUMMARY_FIELDS) -> str:
+    """Counts per field over all ``items`` (not just the page shown)."""
+    return summarize_counts({field: Counter(item.get(field) or "?" for item in items) for field in fields})
+
+
+def summarize_counts(counts_by_field: dict[str, Counter]) -> str:
+    """One clause of counts per field, most common values first."""
+    parts = []
+    for field, counts in counts_by_field.items():
+        parts.append(f"{field}: " + ", ".join(f"{value} {fmt_count(n)}" for value, n in counts.most_common(8)))
+        if len(counts) > 8:
+            parts[-1] += f", … (+{len(counts) - 8})"
+    return "; ".join(parts)
+
+
+def page_footer(offset: int, shown: int, total: int) -> str:
+    """The "showing X–Y of Z" line plus the cursor of the next page; empty when everything is shown."""
+    if offset == 0 and shown >= total:
+        return ""
+    if not shown:
+        return f"Không còn kết quả sau vị trí {fmt_count(offset)} (tổng {fmt_count(total)})."
+    footer = f"Đang hiển thị {fmt_count(offset + 1)}–{fmt_count(offset + shown)} trên tổng {fmt_count(total)}."
+    if offset + shown < total:
+        footer += f" Gọi lại với cursor=\"{offset + shown}\" để xem tiếp."
+    return footer
@@ -1,9 +1,23 @@
 
 
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Literal, Optional
 from langchain_core.tools import tool
-from app.chatstore.redis_client import load_uploaded_tools_from_redis
+from app.utils.config import TOOL_OUTPUT_MAX_IMAGES
+from . import inventory
+from .inventory_aggregate import aggregate, filter_mask
+from .inventory_query import build_filter, count_by, search_items, semantic_search
+from .tool_cache import memoize_tool
+from .tool_output import (
+    SUMMARY_FIELDS,
+    fit_lines,
+    fmt_count,
+    fmt_number,
+    page_bounds,
+    page_footer,
+    summarize,
+    summarize_counts,
+)
 
 # -----------------------------
 # Helpers
@@ -243,41 +257,28 @@ def parse_iso(iso_str):
 #     }
 # }
 
-data = load_uploaded_tools_from_redis()
-
-
 # -----------------------------
 # Utility Find Functions
 # -----------------------------
 def find_by_id(query: str) -> Optional[dict]:
-    return data.get(query.strip().upper())
+    return inventory.items().get(query.strip().upper())
 
 def find_by_name(query: str) -> Optional[dict]:
-    q = query.lower()
-    return next((item for item in data.values() if q in item.get("name", "").lower()), None)
+    snapshot = inventory.items()
+    return next(iter(snapshot.items_at(snapshot.search("name_lc", query.lower(), limit=1))), None)
 
 def find_all_by_name(query: str) -> list[dict]:
-    q = query.lower()
-    return [item for item in data.values() if q in item.get("name", "").lower()]
+    snapshot = inventory.items()
+    return snapshot.items_at(snapshot.search("name_lc", query.lower()))
 
 def find_by_type(type_query: str) -> list[dict]:
-    t = type_query.lower()
-    return [item for item in data.values() if item.get("type", "").lower() == t]
+    snapshot = inventory.items()
+    return snapshot.items_at(snapshot.rows_where("type", type_query))
 
 def find_by_general_fields(query: str) -> list[dict]:
-    q = query.lower()
-    matched = []
-    for item in data.values():
-        if (
-            q in item["id"].lower()
-            or q in item["name"].lower()
-            or q in item.get("location", "").lower()
-            or q in item.get("type", "").lower()
-            or any(q in tag.lower() for tag in item.get("tags", []))
-            or any(q in str(v).lower() for v in item.get("metadata", {}).values())
-        ):
-            matched.append(item)
-    return matched
+    # id, name, location, type, tags and metadata values, matched in the snapshot's search column
+    snapshot = inventory.items()
+    return snapshot.items_at(snapshot.search("haystack", query.lower()))
 
 # -----------------------------
 # Format Output Functions
@@ -297,13 +298,44 @@ def format_description(item: dict) -> str:
             desc += f"\nCập nhật lần cuối vào ngày {updated.strftime('%d/%m/%Y')}."
     return desc
 
+def format_item_line(item: dict) -> str:
+    return (
+        f"- {item['name']} (Mã: {item['id']}, Loại: {item['type']}, Trạng thái: {item['status']}, "
+        f"Vị trí: {item['location']}, SL: {item['quantity']} {item['unit']}, KL: {item['weight']} kg)"
+    )
+
+def format_matches(total: int, items: list[dict], criteria: str, offset: int = 0, summary: str = "") -> dict:
+    if not total:
+        return {
+            "result": f"Không tìm thấy vật phẩm nào {criteria}.",
+            "content": [{"type": "text", "text": f"❌ Không có vật phẩm nào {criteria}."}]
+        }
+    header = f"Tìm thấy {fmt_count(total)} vật phẩm {criteria}"
+    if summary:
+        header += f" ({summary})"
+    lines = [format_item_line(item) for item in items]
+    shown = fit_lines(lines)
+    lines = [header + ":"] + lines[:shown]
+    if footer := page_footer(offset, shown, total):
+        lines.append(footer)
+    return {"result": f"Tìm thấy {total} vật phẩm.", "content": [{"type": "text", "text": "\n".join(lines)}]}
+
+def image_parts(item: dict, budget: int) -> list[dict]:
+    """Caption + up to ``budget`` image parts of ``item`` (nothing if it has none)."""
+    urls = item.get("images", [])[:max(0, budget)]
+    if not urls:
+        return []
+    return [{"type": "text", "text": f"Hình ảnh của pallet {item['id']}:"}] + [{"type": "image", "data": url} for url in urls]
+
 # -----------------------------
 # Tool: get_pallet_info
 # Output: dict { result: str, content: list[{type, text/data}] }
 # -----------------------------
 @tool
+@memoize_tool
 def get_pallet_info(query: str) -> dict:
     """Tìm và mô tả thông tin một pallet hoặc vật phẩm trong kho."""
+    query = query.strip()
     item = find_by_id(query) or find_by_name(query)
     if not item:
         return {
@@ -312,10 +344,7 @@ def get_pallet_info(query: str) -> dict:
         }
 
     content = [{"type": "text", "text": format_description(item)}]
-
-    if item.get("images"):
-        content.append({"type": "text", "text": f"Hình ảnh của pallet {item['id']}:"})
-        content.extend({"type": "image", "data": url} for url in item["images"])
+    content.extend(image_parts(item, TOOL_OUTPUT_MAX_IMAGES))
 
     return {"result": "OK", "content": content}
 
@@ -324,14 +353,22 @@ def get_pallet_info(query: str) -> dict:
 # Output: string mô tả danh sách item
 # -----------------------------
 @tool(return_direct=True)
-def get_inventory_info(query: str) -> str:
-    """Tìm kiếm thông tin kho theo ID, tên, vị trí, loại, tag hoặc metadata."""
-    matched = find_by_general_fields(query)
+@memoize_tool
+def get_inventory_info(query: str, limit: Optional[int] = None, cursor: Optional[str] = None) -> str:
+    """Tìm kiếm thông tin kho theo ID, tên, vị trí, loại, tag hoặc metadata.
+    Kết quả được chia trang: dùng limit để chọn số dòng và cursor (trả về ở cuối kết quả) để xem trang tiếp."""
+    query = query.strip()
+    matched = sorted(find_by_general_fields(query), key=lambda item: item["id"])
     if not matched:
         return f"Không tìm thấy vật phẩm nào liên quan đến: '{query}'"
 
-    lines = [f"Tìm thấy {len(matched)} vật phẩm liên quan đến '{query}':\n"]
-    for item in matched:
+    offset, size = page_bounds(cursor, limit)
+    header = f"Tìm thấy {fmt_count(len(matched))} vật phẩm liên quan đến '{query}'"
+    if len(matched) > size:
+        header += f" ({summarize(matched)})"
+
+    lines = []
+    for item in matched[offset:offset + size]:
         updated_str = ""
         updated_dt = parse_iso(item.get("updated_at"))
         if updated_dt:
@@ -340,6 +377,10 @@ def get_inventory_info(query: str) -> str:
         lines.append(
             f"- {item['name']} (Mã: {item['id']}, Vị trí: {item['location']}, SL: {item['quantity']} {item['unit']}{updated_str})"
         )
+    shown = fit_lines(lines)
+    lines = [header + ":\n"] + lines[:shown]
+    if footer := page_footer(offset, shown, len(matched)):
+        lines.append(footer)
     return "\n".join(lines)
 
 # -----------------------------
@@ -347,25 +388,208 @@ def get_inventory_info(query: str) -> str:
 # Output: dict content với mô tả + ảnh của tất cả pallet
 # -----------------------------
 @tool
-def get_all_pallets() -> dict:
-    """Trả về toàn bộ các pallet trong kho cùng hình ảnh."""
-    pallets = find_by_type("pallet")
+@memoize_tool
+def get_all_pallets(limit: Optional[int] = None, cursor: Optional[str] = None) -> dict:
+    """Trả về các pallet trong kho cùng hình ảnh, chia trang theo limit/cursor (cursor trả về ở cuối kết quả)."""
+    pallets = sorted(find_by_type("pallet"), key=lambda item: item["id"])
     if not pallets:
         return {
             "result": "Không tìm thấy pallet nào.",
             "content": [{"type": "text", "text": "❌ Không có pallet nào trong kho."}]
         }
 
-    contents = []
-    for pallet in pallets:
-        contents.append({"type": "text", "text": format_description(pallet)})
-        if pallet.get("images"):
-            contents.append({"type": "text", "text": f"Hình ảnh của pallet {pallet['id']}:"})
-            contents.extend({"type": "image", "data": url} for url in pallet["images"])
+    offset, size = page_bounds(cursor, limit)
+    page = pallets[offset:offset + size]
+    descriptions = [format_description(pallet) for pallet in page]
+    shown = fit_lines(descriptions)
+
+    contents = [{"type": "text", "text": f"Có {fmt_count(len(pallets))} pallet ({summarize(pallets, ('status',))})."}]
+    images_left = TOOL_OUTPUT_MAX_IMAGES
+    for pallet, description in zip(page[:shown], descriptions):
+        contents.append({"type": "text", "text": description})
+        images = image_parts(pallet, images_left)
+        images_left -= max(0, len(images) - 1)
+        contents.extend(images)
+    if footer := page_footer(offset, shown, len(pallets)):
+        contents.append({"type": "text", "text": footer})
 
     return {"result": f"Tìm thấy {len(pallets)} pallet.", "content": contents}
 
+# -----------------------------
+# Tool: filter_inventory
+# Output: dict { result: str, content: [text] }, filtered and sorted in Redis
+# -----------------------------
+@tool
+@memoize_tool(version=inventory.version)
+def filter_inventory(
+    status: Optional[str] = None,
+    item_type: Optional[str] = None,
+    location: Optional[str] = None,
+    tags: Optional[list[str]] = None,
+    min_weight: Optional[float] = None,
+    max_weight: Optional[float] = None,
+    min_quantity: Optional[float] = None,
+    max_quantity: Optional[float] = None,
+    sort_by: Optional[Literal["quantity", "weight"]] = None,
+    descending: bool = False,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+) -> dict:
+    """Lọc vật phẩm trong kho theo trạng thái (status, vd: stored, pending), loại (item_type, vd: pallet, box),
+    vị trí (location), tag, khoảng trọng lượng kg (min_weight/max_weight) hoặc số lượng (min_quantity/max_quantity).
+    Có thể sắp xếp theo quantity hoặc weight (descending=True để giảm dần); kết quả chia trang theo limit/cursor."""
+    if (min_weight is not None and max_weight is not None and min_weight > max_weight) or (
+        min_quantity is not None and max_quantity is not None and min_quantity > max_quantity
+    ):
+        return {
+            "result": "Khoảng lọc không hợp lệ: giá trị min lớn hơn max.",
+            "content": [{"type": "text", "text": "❌ Khoảng lọc không hợp lệ: giá trị min lớn hơn max."}]
+        }
+
+    expression = build_filter(
+        status=status,
+        item_type=item_type,
+        location=location,
+        tags=tags,
+        min_weight=min_weight,
+        max_weight=max_weight,
+        min_quantity=min_quantity,
+        max_quantity=max_quantity,
+    )
+    offset, size = page_bounds(cursor, limit)
+    version = inventory.version()
+    total, items = search_items(
+        "filter_inventory",
+        expression,
+        sort_by=sort_by,
+        descending=descending,
+        limit=size,
+        offset=offset,
+        version=version,
+    )
+    summary = ""
+    fields = tuple(f for f, given in zip(SUMMARY_FIELDS, (item_type, status)) if not given)
+    if offset == 0 and total > len(items) and fields:
+        summary = summarize_counts(count_by("filter_inventory", expression, fields, version=version))
+    return format_matches(total, items, "khớp bộ lọc", offset, summary)
+
+# -----------------------------
+# Tool: find_low_stock
+# Output: dict { result: str, content: [text] }, ít hàng nhất trước
+# -----------------------------
+@tool
+@memoize_tool(version=inventory.version)
+def find_low_stock(
+    max_quantity: float,
+    item_type: Optional[str] = None,
+    location: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+) -> dict:
+    """Tìm các vật phẩm sắp hết hàng: số lượng không vượt quá max_quantity, có thể lọc thêm theo loại và vị trí.
+    Ít hàng nhất trước; kết quả chia trang theo limit/cursor."""
+    expression = build_filter(item_type=item_type, location=location, max_quantity=max_quantity)
+    offset, size = page_bounds(cursor, limit)
+    total, items = search_items(
+        "find_low_stock",
+        expression,
+        sort_by="quantity",
+        limit=size,
+        offset=offset,
+        version=inventory.version(),
+    )
+    return format_matches(total, items, f"có số lượng tối đa {max_quantity:g}", offset)
+
+# -----------------------------
+# Tool: search_inventory
+# Output: dict { result: str, content: [text] }, gần nghĩa nhất trước
+# -----------------------------
+@tool
+@memoize_tool(version=inventory.version)
+def search_inventory(
+    query: str,
+    item_type: Optional[str] = None,
+    status: Optional[str] = None,
+    tags: Optional[list[str]] = None,
+    limit: int = 5,
+) -> dict:
+    """Tìm vật phẩm theo ý nghĩa mô tả (tìm kiếm ngữ nghĩa), dùng khi không biết chính xác mã hoặc tên,
+    vd: "nước uống đóng chai", "đồ điện tử dễ vỡ". Có thể lọc thêm theo loại, trạng thái và tag."""
+    query = query.strip()
+    expression = build_filter(status=status, item_type=item_type, tags=tags)
+    _, size = page_bounds(None, limit)
+    hits = semantic_search("search_inventory", query, expression, limit=size, version=inventory.version())
+    if not hits:
+        return {
+            "result": "Không tìm thấy vật phẩm nào gần nghĩa với: " + query,
+            "content": [{"type": "text", "text": f"❌ Không tìm thấy vật phẩm nào gần nghĩa với: {query}"}]
+        }
+
+    lines = [f"{format_item_line(item)}, độ tương đồng: {1 - distance:.2f}" for item, distance in hits]
+    lines = [f"Các vật phẩm gần nghĩa nhất với '{query}':"] + lines[:fit_lines(lines)]
+    return {"result": f"Tìm thấy {len(hits)} vật phẩm.", "content": [{"type": "text", "text": "\n".join(lines)}]}
+
+# -----------------------------
+# Tool: aggregate_inventory
+# Output: dict { result: str, content: [text] }, tính trên các cột của snapshot
+# -----------------------------
+METRIC_LABELS = {"count": "Số vật phẩm", "sum": "Tổng", "avg": "Trung bình", "min": "Nhỏ nhất", "max": "Lớn nhất"}
+FIELD_LABELS = {"quantity": "số lượng", "weight": "trọng lượng (kg)", "volume": "thể tích (m³)"}
+GROUP_LABELS = {"type": "loại", "status": "trạng thái", "location": "vị trí", "unit": "đơn vị"}
+
+@tool
+@memoize_tool
+def aggregate_inventory(
+    metric: Literal["count", "sum", "avg", "min", "max"] = "count",
+    field: Literal["quantity", "weight", "volume"] = "quantity",
+    group_by: Optional[Literal["type", "status", "location", "unit"]] = None,
+    status: Optional[str] = None,
+    item_type: Optional[str] = None,
+    location: Optional[str] = None,
+) -> dict:
+    """Thống kê kho: đếm (count), tổng (sum), trung bình (avg), nhỏ nhất (min), lớn nhất (max) của
+    số lượng (quantity), trọng lượng kg (weight) hoặc thể tích m³ (volume), có thể nhóm theo type/status/location/unit
+    và lọc theo trạng thái, loại, vị trí. Dùng cho các câu hỏi như "tổng trọng lượng ở Zone B2",
+    "bao nhiêu vật phẩm pending theo từng vị trí", "tổng thể tích theo loại"."""
+    snapshot = inventory.items()
+    mask = filter_mask(snapshot, status=status, item_type=item_type, location=location)
+    rows = aggregate(snapshot, metric, field, group_by, mask)
+
+    title = METRIC_LABELS[metric] if metric == "count" else f"{METRIC_LABELS[metric]} {FIELD_LABELS[field]}"
+    filters = ", ".join(f"{name}: {value}" for name, value in
+                        (("trạng thái", status), ("loại", item_type), ("vị trí", location)) if value)
+    if filters:
+        title += f" ({filters})"
+    matched = int(mask.sum())
+    if not matched:
+        return {
+            "result": "Không có vật phẩm nào khớp bộ lọc.",
+            "content": [{"type": "text", "text": f"❌ {title}: không có vật phẩm nào khớp bộ lọc."}]
+        }
+
+    if group_by is None:
+        _, value, _ = rows[0]
+        text = f"{title}: {fmt_number(value)} (trên {fmt_count(matched)} vật phẩm)."
+        return {"result": f"{title}: {fmt_number(value)}", "content": [{"type": "text", "text": text}]}
+
+    _, size = page_bounds(None, None)
+    lines = [f"- {group or '(trống)'}: {fmt_number(value)}" + ("" if metric == "count" else f" ({fmt_count(n)} vật phẩm)")
+             for group, value, n in rows[:size]]
+    shown = fit_lines(lines)
+    lines = [f"{title} theo {GROUP_LABELS[group_by]}, {fmt_count(len(rows))} nhóm trên {fmt_count(matched)} vật phẩm:"] + lines[:shown]
+    if shown < len(rows):
+        lines.append(f"… và {fmt_count(len(rows) - shown)} nhóm khác.")
+    return {"result": f"{fmt_count(len(rows))} nhóm.", "content": [{"type": "text", "text": "\n".join(lines)}]}
+
 # -----------------------------
 # Register tools
 # -----------------------------
-tools = [get_pallet_info, get_inventory_info, get_all_pallets]
+tools = [
+    get_pallet_info,
+    get_inventory_info,
+    get_all_pallets,
+    filter_inventory,
+    find_low_stock,
+    search_inventory,
+    aggregate_inventory,
+]
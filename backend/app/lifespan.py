@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+
+from app.chatstore.archiver import run_archiver
+from app.chatstore.connection import redis_manager
+from app.chatstore.redis_client import ensure_index_exists
+from app.chatstore.replicas import read_router
+from app.langgraph import inventory
+from app.langgraph.llm import aclose_http_client
+from app.langgraph.tool_index import ensure_tool_index
+from app.utils.config import ARCHIVE_AFTER_SECONDS, WARMUP_RETRY_SECONDS
+from app.utils.embedding import embedding_fn
+
+logger = logging.getLogger(__name__)
+
+# ─── Readiness registry ─────────────────────────────────
+# name -> {"status": "pending" | "ready" | "failed", "seconds": float, "error": str}
+readiness: dict[str, dict] = {}
+
+
+def is_ready() -> bool:
+    return bool(readiness) and all(c["status"] == "ready" for c in readiness.values())
+
+
+# ─── Warm-up steps ──────────────────────────────────────
+# Blocking steps run in threads so the whole phase takes as long as the slowest one.
+async def _redis():
+    await redis_manager.ping()
+
+
+async def _chat_index():
+    await ensure_index_exists()
+
+
+async def _tool_index():
+    await asyncio.to_thread(ensure_tool_index)
+
+
+async def _embedding_model():
+    # Through the sidecar when configured, otherwise loads the local model
+    await embedding_fn("warm-up")
+
+
+async def _inventory():
+    await asyncio.to_thread(inventory.refresh, True)
+
+
+WARMUP_STEPS = {
+    "redis": _redis,
+    "chat_index": _chat_index,
+    "tool_index": _tool_index,
+    "embedding_model": _embedding_model,
+    "inventory": _inventory,
+}
+
+
+async def _run_step(name: str, step):
+    # Retry until the dependency comes up; /ready reports the last failure meanwhile
+    while True:
+        start = time.perf_counter()
+        try:
+            await step()
+        except Exception as e:
+            readiness[name] = {"status": "failed", "seconds": time.perf_counter() - start, "error": str(e)}
+            logger.warning("Warm-up step %s failed, retrying in %gs: %s", name, WARMUP_RETRY_SECONDS, e)
+            await asyncio.sleep(WARMUP_RETRY_SECONDS)
+        else:
+            readiness[name] = {"status": "ready", "seconds": time.perf_counter() - start}
+            logger.info("Warm-up step %s ready in %.2fs", name, readiness[name]["seconds"])
+            return
+
+
+async def warm_up():
+    for name in WARMUP_STEPS:
+        readiness[name] = {"status": "pending"}
+    await asyncio.gather(*(_run_step(name, step) for name, step in WARMUP_STEPS.items()))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Serve immediately; the orchestrator gates traffic on /ready
+    tasks = [asyncio.create_task(warm_up())]
+    if ARCHIVE_AFTER_SECONDS > 0:
+        tasks.append(asyncio.create_task(run_archiver()))
+    if read_router.enabled:
+        tasks.append(asyncio.create_task(read_router.run()))
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await aclose_http_client()
+        await read_router.aclose()
+        await redis_manager.aclose()
@@ -8,12 +8,35 @@ from langchain_core.messages import (
     SystemMessage,
     BaseMessage,
 )
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel
 from typing import List, Literal, Union, Optional, Any
-from app.chatstore.redis_client import save_chat_to_vector, async_search_index, load_chat_history
-from redisvl.query import VectorQuery
-import json, re
+from app.chatstore.cursor import CursorConflict, chat_cursor
+from app.chatstore.redis_client import append_chat_to_vector, append_chat_text
+from app.langgraph.memory import session_thread_id
+from app.utils.admission import AdmissionRejected, admission
+from app.utils.config import CHAT_CANCEL_POLICY, CHAT_DISCONNECT_POLL_SECONDS, CHAT_STREAM_TOOLS
+from app.utils.metrics import Counter, Histogram
+from app.utils.tracing import stage
+import asyncio, json, re, logging, time
+
+logger = logging.getLogger(__name__)
+
+CHAT_RUNS = Counter(
+    "chat_runs_total",
+    "Chat runs by outcome (completed, cancelled, error)",
+    ["outcome"],
+)
+CHAT_TTFT = Histogram(
+    "chat_time_to_first_token_seconds",
+    "From an admitted chat request to its first streamed answer token (graph prefetch + LLM TTFT)",
+    buckets=(0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 30.0),
+)
+CHAT_TIME_TO_FIRST_PART = Histogram(
+    "chat_time_to_first_part_seconds",
+    "From an admitted chat request to the first part the client sees (a tool result or an answer token)",
+    buckets=(0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 30.0),
+)
 
 class LanguageModelTextPart(BaseModel):
     type: Literal["text"]
@@ -56,20 +79,24 @@ class LanguageModelToolResultPart(BaseModel):
 
 class LanguageModelSystemMessage(BaseModel):
     role: Literal["system"]
+    id: Optional[str] = None  # stable client id, required in delta mode
     content: str
 
 class LanguageModelUserMessage(BaseModel):
     role: Literal["user"]
+    id: Optional[str] = None
     content: List[
         Union[LanguageModelTextPart, LanguageModelImagePart, LanguageModelFilePart]
     ]
 
 class LanguageModelAssistantMessage(BaseModel):
     role: Literal["assistant"]
+    id: Optional[str] = None
     content: List[Union[LanguageModelTextPart, LanguageModelToolCallPart]]
 
 class LanguageModelToolMessage(BaseModel):
     role: Literal["tool"]
+    id: Optional[str] = None
     content: List[LanguageModelToolResultPart]
 
 LanguageModelV1Message = Union[
@@ -82,11 +109,13 @@ LanguageModelV1Message = Union[
 def convert_to_langchain_messages(
     messages: List[LanguageModelV1Message],
 ) -> List[BaseMessage]:
+    # Client ids become message ids: a turn sent again after a failed run
+    # replaces its copy in the checkpoint instead of being added twice
     result = []
 
     for msg in messages:
         if msg.role == "system":
-            result.append(SystemMessage(content=msg.content))
+            result.append(SystemMessage(content=msg.content, id=msg.id))
 
         elif msg.role == "user":
             content = []
@@ -95,7 +124,7 @@ def convert_to_langchain_messages(
                     content.append({"type": "text", "text": p.text})
                 elif isinstance(p, LanguageModelImagePart):
                     content.append({"type": "image_url", "image_url": p.image})
-            result.append(HumanMessage(content=content))
+            result.append(HumanMessage(content=content, id=msg.id))
 
         elif msg.role == "assistant":
             text_parts = [
@@ -111,7 +140,7 @@ def convert_to_langchain_messages(
                 for p in msg.content
                 if isinstance(p, LanguageModelToolCallPart)
             ]
-            result.append(AIMessage(content=text_content, tool_calls=tool_calls))
+            result.append(AIMessage(content=text_content, tool_calls=tool_calls, id=msg.id))
 
         elif msg.role == "tool":
             for tool_result in msg.content:
@@ -119,11 +148,35 @@ def convert_to_langchain_messages(
                     ToolMessage(
                         content=str(tool_result.result),
                         tool_call_id=tool_result.toolCallId,
+                        id=f"{msg.id}:{tool_result.toolCallId}" if msg.id else None,
                     )
                 )
 
     return result
 
+def delta_inputs(
+    messages: List[LanguageModelV1Message], frontend_tool_names: set[str]
+) -> List[LanguageModelV1Message]:
+    """The accepted messages of a delta request that are new to the graph.
+
+    Assistant replies and server-side tool results were produced by the graph
+    and are already in its checkpoint; the client's copies (under ids of its
+    own) are recorded by the cursor, so versions keep counting every message,
+    but never run again. Results of frontend tools, which only the client has,
+    are kept.
+    """
+    inputs = []
+    for msg in messages:
+        if msg.role == "assistant":
+            continue
+        if msg.role == "tool":
+            parts = [p for p in msg.content if p.toolName in frontend_tool_names]
+            if not parts:
+                continue
+            msg = msg.model_copy(update={"content": parts})
+        inputs.append(msg)
+    return inputs
+
 class FrontendToolCall(BaseModel):
     name: str
     description: Optional[str] = None
@@ -136,6 +189,8 @@ class ChatRequest(BaseModel):
     system: Optional[str] = ""
     tools: Optional[List[FrontendToolCall]] = []
     messages: List[LanguageModelV1Message]
+    # Delta mode: ``messages`` are only those added since this session version
+    base_version: Optional[int] = None
 
 def try_unescape(text: str) -> str:
     """Giải mã các ký tự escape như \\n, \\" nếu tồn tại."""
@@ -145,95 +200,293 @@ def try_unescape(text: str) -> str:
         return text
 
 
-def add_langgraph_route(app: FastAPI, graph, path: str):
-    async def chat_completions(request: ChatRequest):
-        history_json = await load_chat_history(request.agent, request.user_id, request.session_id)
+def tool_result_content(message: ToolMessage) -> dict:
+    """Client-facing result of a tool: its ``result`` plus the text/image parts it returned."""
+    try:
+        data = json.loads(message.content) if isinstance(message.content, str) else message.content
+    except ValueError:
+        data = message.content
+    if isinstance(data, dict) and isinstance(data.get("content"), list):
+        parts = [
+            part for part in data["content"]
+            if isinstance(part, dict) and part.get("type") in ("text", "image")
+        ]
+        return {"result": data.get("result", ""), "content": parts}
+    text = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+    return {"result": text, "content": [{"type": "text", "text": text}]}
+
+
+async def persist_cancelled_turn(request: ChatRequest, turn_messages: List[BaseMessage]) -> bool:
+    """Store what the user saw of a cancelled turn, without re-embedding the transcript.
+
+    Returns whether anything was stored.
+    """
+    if CHAT_CANCEL_POLICY == "skip" or not turn_messages:
+        return False
+    try:
+        with stage("persist_cancelled"):
+            await append_chat_text(
+                request.agent, request.user_id, request.session_id, turn_messages, cancelled=True
+            )
+    except Exception as e:
+        logger.warning("Failed to save cancelled chat: %s", e)
+        return False
+    return True
+
+
+async def settle_cancelled_turn(request: ChatRequest, turn_messages: List[BaseMessage], rewind=None):
+    """Persist a cancelled turn; undo its cursor advance only if nothing was stored.
+
+    A stored turn (user message included) is part of the session: rewinding
+    would have the client send it again and store it twice.
+    """
+    if not await persist_cancelled_turn(request, turn_messages) and rewind is not None:
+        await rewind()
+
+
+async def cancel_on_disconnect(http_request: Request, callback):
+    """``create_run`` whose callback is cancelled as soon as the client goes away.
+
+    create_run drives the callback in its own task, which outlives the response
+    when the client disconnects. We cancel that task when the response stream is
+    abandoned or when polling sees the disconnect (nothing is sent while a tool
+    runs, so a failed write alone would notice too late). The cancellation
+    reaches graph.astream, the tools and the upstream LLM request.
+    """
+    run_task = None
+    cancelled = False
+
+    def cancel():
+        nonlocal cancelled
+        if run_task is not None and not run_task.done() and not cancelled:
+            cancelled = True
+            run_task.cancel()
+
+    async def tracked(controller: RunController):
+        nonlocal run_task
+        run_task = asyncio.current_task()
+        try:
+            await callback(controller)
+        except asyncio.CancelledError:
+            if not cancelled:
+                raise  # not ours (e.g. server shutdown)
+
+    async def watch():
+        while not await http_request.is_disconnected():
+            await asyncio.sleep(CHAT_DISCONNECT_POLL_SECONDS)
+        cancel()
+
+    watcher = asyncio.create_task(watch())
+    completed = False
+    try:
+        async for chunk in create_run(tracked):
+            yield chunk
+        completed = True
+    finally:
+        watcher.cancel()
+        if not completed:
+            cancel()
+
+
+async def release_after(stream, lease):
+    """Hold the admission slot until the response stream is finished or abandoned."""
+    try:
+        async for chunk in stream:
+            yield chunk
+    finally:
+        await lease.release()
+
 
-        history_messages: List[BaseMessage] = []
-        if history_json:
+def add_langgraph_route(app: FastAPI, graph, path: str):
+    async def chat_completions(request: ChatRequest, http_request: Request):
+        if request.base_version is not None and any(m.id is None for m in request.messages):
+            raise HTTPException(status_code=422, detail="delta requests need an id on every message")
+        try:
+            lease = await admission.acquire(request.user_id, request.agent)
+        except AdmissionRejected as e:
+            raise HTTPException(status_code=e.status, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+        version, rewind = None, None
+        try:
+            # Only an admitted request moves the cursor, or its retry would be dropped as a duplicate
+            if request.base_version is not None:
+                version, rewind = await accept_delta(request)
+            response = await start_run(request, http_request, lease, rewind)
+        except BaseException:
+            await lease.release()
+            if rewind is not None:
+                await rewind()
+            raise
+        if version is not None:
+            response.headers["X-Chat-Version"] = str(version)
+        return response
+
+    async def accept_delta(request: ChatRequest):
+        """Narrow ``request.messages`` to those the graph hasn't seen.
+
+        Assistant and server-side tool messages only advance the version, see
+        delta_inputs. Returns the new version and the coroutine function that
+        undoes the advance, for a turn that ends up not persisted.
+        """
+        thread_id = session_thread_id(request.agent, request.user_id, request.session_id)
+        try:
+            with stage("delta_cursor"):
+                version, accepted = await chat_cursor.advance(
+                    thread_id, request.base_version, [m.id for m in request.messages]
+                )
+        except CursorConflict as e:
+            raise HTTPException(
+                status_code=409,
+                detail={"error": "base_version_mismatch", "version": e.version},
+                headers={"X-Chat-Version": str(e.version)},
+            )
+        frontend_tool_names = {tool.name for tool in request.tools or []}
+        inputs = delta_inputs([request.messages[i] for i in accepted], frontend_tool_names)
+        if not inputs:
+            # A retry of a turn that already ran, or only copies of the graph's own replies
+            raise HTTPException(
+                status_code=409,
+                detail={"error": "no_new_messages", "version": version},
+                headers={"X-Chat-Version": str(version)},
+            )
+        accepted_ids = [request.messages[i].id for i in accepted]
+        request.messages = inputs
+
+        async def rewind():
             try:
-                history_raw = json.loads(history_json)
-                for item in history_raw:
-                    if item["role"] == "user":
-                        history_messages.append(HumanMessage(content=item["text"]))
-                    elif item["role"] == "assistant":
-                        text = item["text"]
-                        if isinstance(text, list):
-                            text = "".join(part.get("text", "") for part in text if part.get("type") == "text")
-                        history_messages.append(AIMessage(content=text))
+                await chat_cursor.rewind(thread_id, version, accepted_ids)
             except Exception as e:
-                print(f"[Redis] Failed to load history: {e}")
+                logger.warning("Failed to rewind the chat cursor of %s: %s", thread_id, e)
+
+        return version, rewind
 
+    async def start_run(request: ChatRequest, http_request: Request, lease, rewind=None):
+        started = time.perf_counter()
+        thread_id = session_thread_id(request.agent, request.user_id, request.session_id)
         new_inputs = convert_to_langchain_messages(request.messages)
-        inputs = history_messages + new_inputs
+        # The graph resumes from the session checkpoint; its "history" node replays the
+        # stored transcript (for sessions without one) in parallel with retrieval.
+        inputs = new_inputs
+
+        frontend_tool_names = {tool.name for tool in request.tools or []}
 
         async def run(controller: RunController):
+            # Open tool-call parts by tool call id (only with CHAT_STREAM_TOOLS)
             tool_calls = {}
-            tool_calls_by_idx = {}
-            full_messages: List[BaseMessage] = inputs.copy()
+            turn_messages: List[BaseMessage] = new_inputs.copy()
             ai_response_buffer = ""
+            first_part_seen = False
+
+            async def stream_tool_event(event: dict):
+                nonlocal first_part_seen
+                if event.get("name") in frontend_tool_names:
+                    return  # the client runs these itself
+                if event["event"] == "tool_start":
+                    tool_call = await controller.add_tool_call(event["name"], event["id"])
+                    tool_call.append_args_text(json.dumps(event["args"], ensure_ascii=False))
+                    tool_calls[event["id"]] = tool_call
+                elif event["event"] == "tool_end" and event["id"] in tool_calls:
+                    tool_calls.pop(event["id"]).set_result(tool_result_content(event["message"]))
+                    if not first_part_seen:
+                        first_part_seen = True
+                        CHAT_TIME_TO_FIRST_PART.observe(time.perf_counter() - started)
+
+            async def stream_graph():
+                """(message, metadata) pairs of the run; tool events are streamed on the way."""
+                async for item in graph.astream(
+                    {"messages": inputs},
+                    {
+                        "configurable": {
+                            "thread_id": thread_id,
+                            "system": request.system,
+                            "frontend_tools": request.tools,
+                            "agent": request.agent,
+                            "user_id": request.user_id,
+                            "session_id": request.session_id,
+                            "turn_size": len(inputs),
+                        }
+                    },
+                    stream_mode=["messages", "custom"] if CHAT_STREAM_TOOLS else "messages",
+                ):
+                    if not CHAT_STREAM_TOOLS:
+                        yield item
+                        continue
+                    mode, payload = item
+                    if mode == "custom":
+                        await stream_tool_event(payload)
+                    else:
+                        yield payload
 
-            async for msg, metadata in graph.astream(
-                {"messages": inputs},
-                {
-                    "configurable": {
-                        "system": request.system,
-                        "frontend_tools": request.tools,
-                    }
-                },
-                stream_mode="messages",
-            ):
-                # ✅ Nhận kết quả từ tool, KHÔNG stream về FE
-                if isinstance(msg, ToolMessage):
-                    print("[TOOL] Received ToolMessage:", msg)
-
-                    raw_tool_result = metadata.get("tool_result") if metadata else None
-                    structured_content = None
-
-                    if raw_tool_result:
-                        try:
-                            tool_result_data = json.loads(raw_tool_result) if isinstance(raw_tool_result, str) else raw_tool_result
-                            if isinstance(tool_result_data, dict) and "content" in tool_result_data:
-                                structured_content = tool_result_data["content"]
-                        except Exception as e:
-                            print(f"[Parse ToolResult] Failed to parse tool content: {e}")
-
-                    # ✅ Luôn tạo payload đầy đủ, fallback nếu structured_content = None
-                    tool_result_payload = {
-                        "toolCallId": msg.tool_call_id,
-                        "toolName": getattr(msg, "name", "unknown_tool"),
-                        "type": "tool-result",
-                        "result": try_unescape(msg.content),
-                        "content": structured_content or []  # fallback an toàn
-                    }
-
-                    full_messages.append(
-                        ToolMessage(
-                            content=json.dumps(tool_result_payload, ensure_ascii=False),
-                            tool_call_id=msg.tool_call_id,
+            try:
+                async for msg, metadata in stream_graph():
+                    # ✅ Nhận kết quả từ tool để lưu lại (FE chỉ thấy qua tool events khi bật CHAT_STREAM_TOOLS)
+                    if isinstance(msg, ToolMessage):
+                        logger.debug("Received ToolMessage %s from %s", msg.tool_call_id, msg.name)
+
+                        raw_tool_result = metadata.get("tool_result") if metadata else None
+                        structured_content = None
+
+                        if raw_tool_result:
+                            try:
+                                tool_result_data = json.loads(raw_tool_result) if isinstance(raw_tool_result, str) else raw_tool_result
+                                if isinstance(tool_result_data, dict) and "content" in tool_result_data:
+                                    structured_content = tool_result_data["content"]
+                            except Exception as e:
+                                logger.warning("Failed to parse tool content: %s", e)
+
+                        # ✅ Luôn tạo payload đầy đủ, fallback nếu structured_content = None
+                        tool_result_payload = {
+                            "toolCallId": msg.tool_call_id,
+                            "toolName": getattr(msg, "name", "unknown_tool"),
+                            "type": "tool-result",
+                            "result": try_unescape(msg.content),
+                            "content": structured_content or []  # fallback an toàn
+                        }
+
+                        turn_messages.append(
+                            ToolMessage(
+                                content=json.dumps(tool_result_payload, ensure_ascii=False),
+                                tool_call_id=msg.tool_call_id,
+                            )
                         )
-                    )
-                # ✅ Chỉ stream phản hồi TỰ NHIÊN cuối cùng từ AI
-                if isinstance(msg, AIMessageChunk):
-                    if msg.content:
-                        formatted_content = try_unescape(msg.content)
-                        controller.append_text(formatted_content)
-                        ai_response_buffer += formatted_content
+                    # ✅ Chỉ stream phản hồi TỰ NHIÊN cuối cùng từ AI
+                    if isinstance(msg, AIMessageChunk):
+                        if msg.content:
+                            if not ai_response_buffer:
+                                CHAT_TTFT.observe(time.perf_counter() - started)
+                                if not first_part_seen:
+                                    first_part_seen = True
+                                    CHAT_TIME_TO_FIRST_PART.observe(time.perf_counter() - started)
+                            formatted_content = try_unescape(msg.content)
+                            controller.append_text(formatted_content)
+                            ai_response_buffer += formatted_content
+            except asyncio.CancelledError:
+                CHAT_RUNS.labels(outcome="cancelled").inc()
+                if ai_response_buffer:
+                    turn_messages.append(AIMessage(content=ai_response_buffer))
+                await settle_cancelled_turn(request, turn_messages, rewind)
+                raise
+            except Exception:
+                CHAT_RUNS.labels(outcome="error").inc()
+                if rewind is not None:
+                    await rewind()
+                raise
+            CHAT_RUNS.labels(outcome="completed").inc()
 
             # ✅ Sau khi stream xong mới ghi lại lịch sử
             if ai_response_buffer:
-                full_messages.append(AIMessage(content=ai_response_buffer))
+                turn_messages.append(AIMessage(content=ai_response_buffer))
 
             try:
-                await save_chat_to_vector(
-                    agent=request.agent,
-                    user_id=request.user_id,
-                    session_id=request.session_id,
-                    messages=full_messages,
-                )
+                with stage("persist"):
+                    await append_chat_to_vector(
+                        agent=request.agent,
+                        user_id=request.user_id,
+                        session_id=request.session_id,
+                        messages=turn_messages,
+                    )
             except Exception as e:
-                print(f"[RedisVL] Failed to save chat: {e}")
+                logger.warning("Failed to save chat: %s", e)
 
-        return DataStreamResponse(create_run(run))
+        return DataStreamResponse(release_after(cancel_on_disconnect(http_request, run), lease))
 
     app.add_api_route(path, chat_completions, methods=["POST"])
\ No newline at end of file
@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.lifespan import readiness, is_ready
+
+
+def build_health_router(prefix: str = "") -> APIRouter:
+    router = APIRouter(prefix=prefix)
+
+    @router.get("/ready", summary="Readiness probe (503 until every warm-up step succeeded)")
+    async def ready():
+        return JSONResponse(
+            status_code=200 if is_ready() else 503,
+            content={"ready": is_ready(), "components": readiness},
+        )
+
+    return router
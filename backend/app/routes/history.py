@@ -7,13 +7,19 @@ from typing import Optional, List, Dict, Any
 import redis.asyncio as redis
 from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
-from redisvl.index import AsyncSearchIndex
 from redisvl.query import VectorQuery, FilterQuery
-from sentence_transformers import SentenceTransformer
-from chatstore.redis_client import REDIS_URL, AGENT_NAME, INDEX_NAME, KEY_PREFIX, EMBEDDING_DIM, _model as model, schema
+from app.chatstore.cold_store import forget_sessions, rehydrate
+from app.chatstore.cursor import chat_cursor
+from app.chatstore.codec import TRANSCRIPT_FIELDS, document_transcript, transcript_json
+from app.chatstore.redis_client import fill_transcripts
+from app.chatstore.replicas import read_router
+from app.chatstore.sharding import index_router
+from app.utils.embedding import embedding_fn
+from app.utils.tracing import stage
+from app.chatstore.connection import redis_manager as connection_manager
+from app.langgraph.memory import checkpointer, session_thread_id
 
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def escape_tag_value(val: str) -> str:
@@ -41,27 +47,20 @@ class ChatListResponse(BaseModel):
 class SearchRequest(ChatRequest):
     query_text: str
 
+class ReshardRequest(BaseModel):
+    dry_run: bool = False
+    drop_empty: bool = False
+
 class RedisManager:
     def __init__(self):
         self._client = None
-        self._index = None
 
     async def get_client(self) -> redis.Redis:
         if self._client is None:
-            self._client = redis.Redis.from_url(REDIS_URL, decode_responses=False)
+            self._client = connection_manager.aio(decode=False)
             await self._client.ping()
         return self._client
 
-    async def get_index(self) -> AsyncSearchIndex:
-        if self._index is None:
-            self._index = AsyncSearchIndex.from_dict(schema, redis_client=await self.get_client())
-        return self._index
-
-    async def ensure_index_exists(self):
-        index = await self.get_index()
-        if not await index.exists():
-            await index.create(overwrite=True)
-
 redis_manager = RedisManager()
 
 def safe_parse_result(result: Dict[str, Any]) -> Optional[ChatResponse]:
@@ -79,7 +78,7 @@ def safe_parse_result(result: Dict[str, Any]) -> Optional[ChatResponse]:
         logger.warning(f"Parse failed: {e}")
         return None
 
-async def query_with_filter_only(index: AsyncSearchIndex, agent: str, user_id: str, session_id: str) -> List[Dict[str, Any]]:
+async def query_with_filter_only(agent: str, user_id: str, session_id: str, source=connection_manager) -> List[Dict[str, Any]]:
     filter_expr = (
         f"@agent:{{{escape_tag_value(agent)}}} "
         f"@user_id:{{{escape_tag_value(user_id)}}} "
@@ -90,30 +89,30 @@ async def query_with_filter_only(index: AsyncSearchIndex, agent: str, user_id: s
         filter_expression=filter_expr,
         num_results=1000
     )
-    return await index.query(query)
-
-async def query_by_redis_scan(client: redis.Redis, agent: str, user_id: str, session_id: str) -> List[Dict[str, Any]]:
-    pattern = f"{KEY_PREFIX}:*"
+    return await fill_transcripts(await index_router.search(query, agent, user_id, decode=False, source=source), source)
+
+async def query_by_key(client: redis.Redis, agent: str, user_id: str, session_id: str) -> List[Dict[str, Any]]:
+    """Read the session's document directly; its key follows from the ids in every index layout."""
+    keys = index_router.candidate_keys(agent, user_id, session_id)
+    async with client.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.hgetall(key)
+        docs = await pipe.execute()
     results = []
-    async for key in client.scan_iter(match=pattern, count=100):
-        try:
-            doc = await client.hgetall(key)
-            if doc:
-                doc_decoded = {}
-                for k, v in doc.items():
-                    if k == b"embedding":
-                        continue
-                    try:
-                        doc_decoded[k.decode()] = v.decode()
-                    except Exception:
-                        continue
-                if (doc_decoded.get("agent") == agent and
-                    doc_decoded.get("user_id") == user_id and
-                    doc_decoded.get("session_id") == session_id):
-                    doc_decoded["__redis_key__"] = key.decode()
-                    results.append(doc_decoded)
-        except Exception as e:
-            logger.warning(f"Scan failed for {key}: {e}")
+    for key, doc in zip(keys, docs):
+        if not doc:
+            continue
+        doc_decoded = {}
+        for k, v in doc.items():
+            if k == b"embedding" or k.decode() in TRANSCRIPT_FIELDS:
+                continue
+            try:
+                doc_decoded[k.decode()] = v.decode()
+            except Exception:
+                continue
+        doc_decoded["text"] = transcript_json(document_transcript(doc))
+        doc_decoded["__redis_key__"] = key
+        results.append(doc_decoded)
     return results
 
 def build_history_router(prefix="/api") -> APIRouter:
@@ -121,20 +120,32 @@ def build_history_router(prefix="/api") -> APIRouter:
 
     @router.post("/chat/get", response_model=ChatListResponse)
     async def get_chat_by_session(request: ChatRequest):
-        await redis_manager.ensure_index_exists()
-        index = await redis_manager.get_index()
         client = await redis_manager.get_client()
         debug_info = {"methods_tried": [], "successful_method": None}
+        source = await read_router.source("history", f"{request.agent}:{request.user_id}:{request.session_id}")
 
         try:
             debug_info["methods_tried"].append("FilterQuery")
-            results = await query_with_filter_only(index, request.agent, request.user_id, request.session_id)
+            with stage("history_filter_query"):
+                results = await query_with_filter_only(request.agent, request.user_id, request.session_id, source)
             if not results:
-                debug_info["methods_tried"].append("Redis_SCAN")
-                results = await query_by_redis_scan(client, request.agent, request.user_id, request.session_id)
-                debug_info["successful_method"] = "Redis_SCAN"
+                debug_info["methods_tried"].append("Redis_KEY")
+                with stage("history_key_lookup"):
+                    results = await query_by_key(
+                        source.aio(decode=False), request.agent, request.user_id, request.session_id
+                    )
+                debug_info["successful_method"] = "Redis_KEY"
             else:
                 debug_info["successful_method"] = "FilterQuery"
+            if not results:
+                # Archived for inactivity: bring the session back and read it by key
+                debug_info["methods_tried"].append("cold_store")
+                key = index_router.key(request.agent, request.user_id, request.session_id)
+                with stage("history_rehydrate"):
+                    # Read back from the primary, where it was just restored
+                    if await rehydrate(key) is not None:
+                        results = await query_by_key(client, request.agent, request.user_id, request.session_id)
+                        debug_info["successful_method"] = "cold_store"
 
             chats = [safe_parse_result(r) for r in results if safe_parse_result(r)]
             chats.sort(key=lambda x: x.timestamp, reverse=True)
@@ -144,9 +155,7 @@ def build_history_router(prefix="/api") -> APIRouter:
 
     @router.post("/chat/search", response_model=ChatListResponse)
     async def search_chat(req: SearchRequest):
-        await redis_manager.ensure_index_exists()
-        index = await redis_manager.get_index()
-        query_vector = model.encode(req.query_text).tolist()
+        query_vector = await embedding_fn(req.query_text)
         filter_expr = (
             f"@agent:{{{escape_tag_value(req.agent)}}} "
             f"@user_id:{{{escape_tag_value(req.user_id)}}} "
@@ -161,7 +170,11 @@ def build_history_router(prefix="/api") -> APIRouter:
             return_score=True
         )
         try:
-            results = await index.query(query)
+            source = await read_router.source("search", f"{req.agent}:{req.user_id}:{req.session_id}")
+            with stage("history_vector_search"):
+                results = await fill_transcripts(
+                    await index_router.search(query, req.agent, req.user_id, decode=False, source=source), source
+                )
             chats = [safe_parse_result(r) for r in results if safe_parse_result(r)]
             chats.sort(key=lambda x: x.score)
             return ChatListResponse(results=chats, total=len(chats))
@@ -170,9 +183,9 @@ def build_history_router(prefix="/api") -> APIRouter:
 
     @router.delete("/chat/delete")
     async def delete_chat_session(request: ChatRequest):
-        await redis_manager.ensure_index_exists()
         client = await redis_manager.get_client()
-        results = await query_by_redis_scan(client, request.agent, request.user_id, request.session_id)
+        with stage("history_key_lookup"):
+            results = await query_by_key(client, request.agent, request.user_id, request.session_id)
         deleted_keys = []
 
         for doc in results:
@@ -180,7 +193,27 @@ def build_history_router(prefix="/api") -> APIRouter:
             if redis_key:
                 await client.delete(redis_key)
                 deleted_keys.append(redis_key)
+        # Archived copies count as deleted documents too
+        keys = index_router.candidate_keys(request.agent, request.user_id, request.session_id)
+        deleted_keys += [key for key in await forget_sessions(keys) if key not in deleted_keys]
+        # Otherwise the next turn of this session id resumes the deleted conversation
+        thread_id = session_thread_id(request.agent, request.user_id, request.session_id)
+        await checkpointer.adelete_thread(thread_id)
+        await chat_cursor.delete(thread_id)
+        await read_router.pin(f"{request.agent}:{request.user_id}:{request.session_id}")
 
         return {"success": True, "deleted_count": len(deleted_keys), "deleted_keys": deleted_keys}
 
+    @router.get("/chat/admin/shards")
+    async def list_chat_shards():
+        return await index_router.describe()
+
+    @router.post("/chat/admin/reshard")
+    async def reshard_chat_documents(request: ReshardRequest):
+        """Move chat documents (and archived sessions) to the current CHAT_SHARDING layout."""
+        try:
+            return await index_router.migrate(dry_run=request.dry_run, drop_empty=request.drop_empty)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Reshard failed: {e}")
+
     return router
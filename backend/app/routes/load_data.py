@@ -1,70 +1,45 @@
 import os
 import uuid
+import asyncio
 import json
+import logging
 import shutil
 import datetime
-import numpy as np
 from typing import List
 from fastapi import APIRouter, UploadFile, File, HTTPException
-from redis import Redis
-from redisvl.index import SearchIndex
 from openpyxl import load_workbook
-from sentence_transformers import SentenceTransformer
+from app.utils.config import INVENTORY_VERSION_KEY, TOOL_KEY_PREFIX
+from app.utils.embedding import embedding_fn_sync, embedding_to_bytes
+from app.chatstore.connection import redis_manager, unlink_keys
+from app.chatstore.redis_client import parse_tool_doc
+from app.langgraph.inventory import snapshot_file
+from app.langgraph.tool_index import ensure_tool_index, index
+from app.utils.tracing import stage
+
+logger = logging.getLogger(__name__)
 
 # ─── Config ─────────────────────────────────────────────
 UPLOAD_DIR = "./uploaded_excels"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-VECTOR_DIM = 384
-INDEX_NAME = "core_agent_tool_index"
-REDIS_URL = "redis://localhost:6379"
-KEY_PREFIX = "core_agent:data:tool:"
+KEY_PREFIX = TOOL_KEY_PREFIX
 
 # ─── RedisVL Setup ──────────────────────────────────────
-redis_client = Redis.from_url(REDIS_URL, decode_responses=False)
-
-model = SentenceTransformer("all-MiniLM-L6-v2")
+redis_client = redis_manager.sync(decode=False)
 
 def get_embedding(text: str) -> bytes:
-    vector = model.encode(text)
-    return np.array(vector, dtype=np.float32).tobytes()
-
-# ─── Redis Schema ───────────────────────────────────────
-schema = {
-    "index": {"name": INDEX_NAME, "prefix": KEY_PREFIX},
-    "fields": [
-        {"name": "id", "type": "tag"},
-        {"name": "name", "type": "text"},
-        {"name": "type", "type": "tag"},
-        {"name": "status", "type": "tag"},
-        {"name": "location", "type": "text"},
-        {"name": "quantity", "type": "numeric"},
-        {"name": "unit", "type": "tag"},
-        {"name": "weight", "type": "numeric"},
-        {"name": "dim_length", "type": "numeric"},
-        {"name": "dim_width", "type": "numeric"},
-        {"name": "dim_height", "type": "numeric"},
-        {"name": "created_at", "type": "text"},
-        {"name": "updated_at", "type": "text"},
-        {"name": "tags", "type": "tag"},
-        {"name": "metadata", "type": "text"},
-        {"name": "images", "type": "text"},
-        {
-            "name": "embedding",
-            "type": "vector",
-            "attrs": {
-                "dims": VECTOR_DIM,
-                "distance_metric": "cosine",
-                "algorithm": "hnsw",
-                "datatype": "float32"
-            }
-        }
-    ]
-}
+    return embedding_to_bytes(embedding_fn_sync(text))
 
-index = SearchIndex.from_dict(schema, redis_client=redis_client)
-if not index.exists():
-    index.create(overwrite=False)
+def snapshot_items(documents: list[dict]) -> dict:
+    """Item dicts of uploaded documents, read back the way Redis stores them.
+
+    Redis keeps every field as a string (openpyxl gives ints and floats for
+    numeric cells), so the values are converted the same way before parsing.
+    """
+    items = {}
+    for doc in documents:
+        stored = {k: v if isinstance(v, str) else str(v) for k, v in doc.items() if k != "embedding"}
+        items[stored["id"]] = parse_tool_doc(stored)
+    return items
 
 # ─── Router ─────────────────────────────────────────────
 def build_upload_router(prefix: str = "/api") -> APIRouter:
@@ -74,11 +49,14 @@ def build_upload_router(prefix: str = "/api") -> APIRouter:
     async def upload_excel(file: UploadFile = File(...)):
         try:
             # Save file temporarily
+            os.makedirs(UPLOAD_DIR, exist_ok=True)
             filename = f"{uuid.uuid4().hex}_{file.filename}"
             filepath = os.path.join(UPLOAD_DIR, filename)
             with open(filepath, "wb") as f:
                 shutil.copyfileobj(file.file, f)
 
+            ensure_tool_index()
+
             # Load Excel
             wb = load_workbook(filename=filepath)
             sheet = wb.active
@@ -89,9 +67,11 @@ def build_upload_router(prefix: str = "/api") -> APIRouter:
             keys = []
 
             # Xóa toàn bộ doc key cùng prefix
-            old_keys = redis_client.keys(f"{KEY_PREFIX}*")
-            if old_keys:
-                redis_client.delete(*old_keys)
+            with stage("upload_clear"):
+                # Scans every primary on a cluster; UNLINK is batched per slot
+                client = redis_manager.aio(decode=False)
+                old_keys = [key async for key in client.scan_iter(match=f"{KEY_PREFIX}*", count=500)]
+                await unlink_keys(client, old_keys)
 
             for row in sheet.iter_rows(min_row=2, values_only=True):
                 data = dict(zip(headers, row))
@@ -134,13 +114,25 @@ def build_upload_router(prefix: str = "/api") -> APIRouter:
                 keys.append(redis_key)
                 rows_processed += 1
 
-            index.load(documents, keys=keys)
+            with stage("upload_index"):
+                index.load(documents, keys=keys)
+            # Invalidate cached inventory snapshots and tool results on every worker
+            version = redis_client.incr(INVENTORY_VERSION_KEY)
+            if snapshot_file is not None:
+                # Workers on this host map the new snapshot instead of each reloading from Redis
+                with stage("upload_snapshot"):
+                    # Redis already holds the upload: a failure here must not fail it
+                    try:
+                        await asyncio.to_thread(snapshot_file.publish, version, snapshot_items(documents))
+                    except Exception as e:
+                        logger.warning("Inventory snapshot not published, workers rebuild it from Redis: %s", e)
 
             return {
                 "success": True,
                 "message": f"✅ Uploaded {rows_processed} tools vào RedisVL",
                 "file": filename,
-                "key_prefix": KEY_PREFIX
+                "key_prefix": KEY_PREFIX,
+                "inventory_version": version
             }
 
         except Exception as e:
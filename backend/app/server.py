@@ -3,14 +3,22 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+from .utils.log import configure_logging
+
+configure_logging()
+
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import FastAPI
 from .langgraph.agent import assistant_ui_graph
 from .routes.add_langgraph_route import add_langgraph_route
 from .routes.history import build_history_router
 from .routes.load_data import build_upload_router
+from .routes.health import build_health_router
+from .routes.metrics import build_metrics_router
+from .utils.tracing import HTTPMetricsMiddleware
+from .lifespan import lifespan
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 # cors
 app.add_middleware(
     CORSMiddleware,
@@ -18,12 +26,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Chat-Version"],
 )
+app.add_middleware(HTTPMetricsMiddleware)
 
 # Đăng ký route chat
 add_langgraph_route(app, assistant_ui_graph, "/api/chat")
 app.include_router(build_history_router("/api")) 
 app.include_router(build_upload_router("/api")) 
+app.include_router(build_health_router())
+app.include_router(build_metrics_router())
 # Đăng ký route history
 # register_history_routes(app)
 
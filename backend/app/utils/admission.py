@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import math
+import time
+import uuid
+from typing import Optional
+
+from redis.exceptions import RedisError
+
+from app.chatstore.connection import hash_tag, redis_manager
+from app.utils.config import (
+    ADMISSION_PREFIX,
+    ADMISSION_GLOBAL_LIMIT,
+    ADMISSION_USER_LIMIT,
+    ADMISSION_AGENT_LIMIT,
+    ADMISSION_QUEUE_SIZE,
+    ADMISSION_QUEUE_TIMEOUT,
+    ADMISSION_LEASE_SECONDS,
+    ADMISSION_POLL_SECONDS,
+    ADMISSION_RETRY_AFTER,
+)
+from app.utils.metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_DECISIONS = Counter(
+    "admission_decisions_total",
+    "Chat admission decisions by outcome (admitted, rejected) and limiting scope",
+    ["outcome", "scope"],
+)
+ADMISSION_QUEUE_TIME = Histogram(
+    "admission_queue_seconds",
+    "Time a chat request waited for a run slot",
+    ["outcome"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+ADMISSION_IN_FLIGHT = Gauge("admission_in_flight", "Chat runs holding a slot in this worker")
+
+# ─── Lua ────────────────────────────────────────────────
+# Slots are leases: sorted-set members scored by their expiry (Redis TIME, so
+# every worker uses the same clock). A crashed worker's slots expire on their own.
+
+# KEYS: lease sets; ARGV: lease id, lease ms, one limit per key
+# -> 0 when admitted, else the 1-based index of the first full key
+_ACQUIRE = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local lease_ms = tonumber(ARGV[2])
+for i, key in ipairs(KEYS) do
+  redis.call('ZREMRANGEBYSCORE', key, '-inf', now)
+  if redis.call('ZCARD', key) >= tonumber(ARGV[i + 2]) then
+    return i
+  end
+end
+for _, key in ipairs(KEYS) do
+  redis.call('ZADD', key, now + lease_ms, ARGV[1])
+  redis.call('PEXPIRE', key, lease_ms * 2)
+end
+return 0
+"""
+
+# KEYS: lease sets; ARGV: lease id, lease ms
+_REFRESH = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local lease_ms = tonumber(ARGV[2])
+for _, key in ipairs(KEYS) do
+  redis.call('ZADD', key, 'XX', now + lease_ms, ARGV[1])
+  redis.call('PEXPIRE', key, lease_ms * 2)
+end
+return 1
+"""
+
+# KEYS[1]: wait queue; ARGV: waiter id, wait ms, max waiters -> 1 joined, 0 full
+_JOIN_QUEUE = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then
+  return 0
+end
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), ARGV[1])
+redis.call('PEXPIRE', KEYS[1], tonumber(ARGV[2]) * 2)
+return 1
+"""
+
+
+class AdmissionRejected(Exception):
+    """No slot within the deadline. ``status`` is 429 for a tenant cap, 503 for global overload."""
+
+    def __init__(self, scope: str, retry_after: int):
+        self.scope = scope
+        self.status = 503 if scope in ("global", "queue") else 429
+        self.retry_after = retry_after
+        super().__init__(f"chat admission rejected ({scope} limit)")
+
+
+class Lease:
+    def __init__(self, controller: "AdmissionController", lease_id: str, keys: list[str]):
+        self._controller = controller
+        self.id = lease_id
+        self.keys = keys
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._released = False
+
+    async def _keep_alive(self):
+        # Long streams outlive one lease period
+        while True:
+            await asyncio.sleep(self._controller.lease_seconds / 3)
+            try:
+                _, refresh, _ = self._controller._scripts()
+                await refresh(keys=self.keys, args=[self.id, self._controller.lease_ms])
+            except RedisError as e:
+                logger.warning("Admission lease refresh failed: %s", e)
+
+    async def release(self):
+        if self._released:
+            return
+        self._released = True
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+        ADMISSION_IN_FLIGHT.dec()
+        try:
+            if self.keys:
+                async with self._controller.client.pipeline(transaction=False) as pipe:
+                    for key in self.keys:
+                        pipe.zrem(key, self.id)
+                    await pipe.execute()
+        except RedisError as e:
+            logger.warning("Admission release failed, lease expires in %gs: %s", self._controller.lease_seconds, e)
+        self._controller._wake_waiters()
+
+
+class AdmissionController:
+    """Global / per-user / per-agent caps on concurrent chat runs, shared by all workers.
+
+    A request that finds a cap reached waits (up to ``queue_timeout``) in a wait
+    queue bounded across workers by ``queue_size``; when the queue is full or
+    the deadline passes it is rejected with a Retry-After hint. A limit of 0
+    disables that scope.
+    """
+
+    def __init__(
+        self,
+        *,
+        prefix: str = ADMISSION_PREFIX,
+        global_limit: int = ADMISSION_GLOBAL_LIMIT,
+        user_limit: int = ADMISSION_USER_LIMIT,
+        agent_limit: int = ADMISSION_AGENT_LIMIT,
+        queue_size: int = ADMISSION_QUEUE_SIZE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+        lease_seconds: float = ADMISSION_LEASE_SECONDS,
+        poll_seconds: float = ADMISSION_POLL_SECONDS,
+        retry_after: int = ADMISSION_RETRY_AFTER,
+    ):
+        self.prefix = prefix
+        # The scripts touch the global, user and agent sets together: one slot on a cluster
+        self.key_prefix = hash_tag(prefix)
+        self.global_limit = global_limit
+        self.user_limit = user_limit
+        self.agent_limit = agent_limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.lease_seconds = lease_seconds
+        self.lease_ms = int(lease_seconds * 1000)
+        self.poll_seconds = poll_seconds
+        self.retry_after = retry_after
+        self._released = asyncio.Event()
+        self._registered = None
+
+    @property
+    def enabled(self) -> bool:
+        return any((self.global_limit, self.user_limit, self.agent_limit))
+
+    @property
+    def client(self):
+        return redis_manager.aio()
+
+    def _scripts(self):
+        # (acquire, refresh, join_queue); EVALSHA with a transparent EVAL fallback
+        if self._registered is None:
+            client = self.client
+            self._registered = (
+                client.register_script(_ACQUIRE),
+                client.register_script(_REFRESH),
+                client.register_script(_JOIN_QUEUE),
+            )
+        return self._registered
+
+    def _scopes(self, user_id: Optional[str], agent: Optional[str]) -> list[tuple[str, str, int]]:
+        scopes = [
+            ("global", f"{self.key_prefix}:global", self.global_limit),
+            ("user", f"{self.key_prefix}:user:{user_id or 'anonymous'}", self.user_limit),
+            ("agent", f"{self.key_prefix}:agent:{agent or 'default'}", self.agent_limit),
+        ]
+        return [s for s in scopes if s[2] > 0]
+
+    def _wake_waiters(self):
+        self._released.set()
+        self._released = asyncio.Event()
+
+    def _reject(self, scope: str, waited: float) -> AdmissionRejected:
+        ADMISSION_DECISIONS.labels(outcome="rejected", scope=scope).inc()
+        ADMISSION_QUEUE_TIME.labels(outcome="rejected").observe(waited)
+        return AdmissionRejected(scope, self.retry_after or max(1, math.ceil(self.queue_timeout)))
+
+    def _admit(self, lease: Lease, waited: float, scope: str = "none") -> Lease:
+        ADMISSION_DECISIONS.labels(outcome="admitted", scope=scope).inc()
+        ADMISSION_QUEUE_TIME.labels(outcome="admitted").observe(waited)
+        ADMISSION_IN_FLIGHT.inc()
+        if lease.keys:
+            lease._heartbeat = asyncio.create_task(lease._keep_alive())
+        return lease
+
+    async def acquire(self, user_id: Optional[str], agent: Optional[str]) -> Lease:
+        start = time.perf_counter()
+        lease_id = uuid.uuid4().hex
+        scopes = self._scopes(user_id, agent)
+        if not scopes:
+            return self._admit(Lease(self, lease_id, []), 0.0)
+
+        keys = [key for _, key, _ in scopes]
+        limits = [limit for _, _, limit in scopes]
+        try:
+            acquire, _, join_queue = self._scripts()
+            blocked = await acquire(keys=keys, args=[lease_id, self.lease_ms, *limits])
+            if not blocked:
+                return self._admit(Lease(self, lease_id, keys), time.perf_counter() - start)
+
+            scope = scopes[blocked - 1][0]
+            queue_key = f"{self.key_prefix}:queue"
+            wait_ms = int(self.queue_timeout * 1000)
+            if not self.queue_size or not await join_queue(keys=[queue_key], args=[lease_id, wait_ms, self.queue_size]):
+                raise self._reject("queue" if scope == "global" else scope, time.perf_counter() - start)
+
+            try:
+                deadline = time.monotonic() + self.queue_timeout
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise self._reject(scope, time.perf_counter() - start)
+                    # Woken early by a local release; other workers' releases are seen by polling
+                    try:
+                        await asyncio.wait_for(self._released.wait(), min(self.poll_seconds, remaining))
+                    except asyncio.TimeoutError:
+                        pass
+                    blocked = await acquire(keys=keys, args=[lease_id, self.lease_ms, *limits])
+                    if not blocked:
+                        return self._admit(Lease(self, lease_id, keys), time.perf_counter() - start, scope)
+                    scope = scopes[blocked - 1][0]
+            finally:
+                await self.client.zrem(queue_key, lease_id)
+        except RedisError as e:
+            # Fail open: an unavailable Redis must not take the chat down with it
+            logger.warning("Admission check skipped, Redis unavailable: %s", e)
+            return self._admit(Lease(self, lease_id, []), time.perf_counter() - start, "redis_error")
+
+
+admission = AdmissionController()
@@ -1,17 +1,146 @@
 import os
+import json
+import logging
 from functools import lru_cache
-from sentence_transformers import SentenceTransformer
+
+logger = logging.getLogger(__name__)
 
 # Env Configs
 AGENT_NAME = os.getenv("AGENT_NAME", "core_agent")
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+# Redis Cluster: REDIS_URL is any node; keys of one session share a {hash tag} and so a slot
+REDIS_CLUSTER = os.getenv("REDIS_CLUSTER", "false").lower() in ("1", "true", "yes")
+# Shared Redis pools (per process, see app/chatstore/connection.py)
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))  # max wait for a free connection
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "5"))
+REDIS_SOCKET_CONNECT_TIMEOUT = float(os.getenv("REDIS_SOCKET_CONNECT_TIMEOUT", "2"))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+REDIS_RETRY_ATTEMPTS = int(os.getenv("REDIS_RETRY_ATTEMPTS", "3"))
+REDIS_RETRY_BACKOFF_BASE = float(os.getenv("REDIS_RETRY_BACKOFF_BASE", "0.05"))
+REDIS_RETRY_BACKOFF_CAP = float(os.getenv("REDIS_RETRY_BACKOFF_CAP", "1.0"))
+# Read replicas for hot reads (comma separated URLs; empty = read from the primary)
+REDIS_REPLICA_URLS = [u.strip() for u in os.getenv("REDIS_REPLICA_URLS", "").split(",") if u.strip()]
+REDIS_REPLICA_MAX_STALENESS_SECONDS = float(os.getenv("REDIS_REPLICA_MAX_STALENESS_SECONDS", "1.0"))
+REDIS_REPLICA_PIN_SECONDS = float(os.getenv("REDIS_REPLICA_PIN_SECONDS", "5"))  # a session reads the primary this long after its writes, on every worker
+REDIS_REPLICA_CHECK_SECONDS = float(os.getenv("REDIS_REPLICA_CHECK_SECONDS", "0.25"))  # heartbeat period
 EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "384"))
 INDEX_NAME = os.getenv("INDEX_NAME", f"{AGENT_NAME}_index")
 KEY_PREFIX = os.getenv("KEY_PREFIX", f"{AGENT_NAME}_docs")
+# Chat vector index layout (app/chatstore/sharding.py): none (one INDEX_NAME index) | agent | hash.
+# After changing it (or CHAT_SHARD_COUNT), run POST /api/chat/admin/reshard to move existing documents.
+CHAT_SHARDING = os.getenv("CHAT_SHARDING", "none")
+CHAT_SHARD_COUNT = int(os.getenv("CHAT_SHARD_COUNT", "16"))  # "hash" layout: shards per agent:user hash
+# Sharded documents live under CHAT_SHARD_PREFIX:<shard>:; must not start with KEY_PREFIX
+CHAT_SHARD_PREFIX = os.getenv("CHAT_SHARD_PREFIX", f"{AGENT_NAME}_chat")
+CHAT_SHARD_LIST_TTL_SECONDS = float(os.getenv("CHAT_SHARD_LIST_TTL_SECONDS", "10"))  # cache of existing shards for fan-out
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# Embedding inference on CPU (app/utils/embedding_backends.py): torch | torch-int8 | onnx
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # 0 = library default
+EMBEDDING_CPU_AFFINITY = os.getenv("EMBEDDING_CPU_AFFINITY", "")  # e.g. "0-3", pins the whole process
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "")  # e.g. "onnx/model_qint8_avx512_vnni.onnx"
+# Shared embedding sidecar (app/utils/embedding_sidecar.py); empty = every worker encodes locally
+EMBEDDING_SOCKET = os.getenv("EMBEDDING_SOCKET", "")
+EMBEDDING_SIDECAR_TIMEOUT = float(os.getenv("EMBEDDING_SIDECAR_TIMEOUT", "10"))
+EMBEDDING_SIDECAR_RETRY_SECONDS = float(os.getenv("EMBEDDING_SIDECAR_RETRY_SECONDS", "5"))  # local fallback window
+EMBEDDING_SIDECAR_MAX_BATCH = int(os.getenv("EMBEDDING_SIDECAR_MAX_BATCH", "64"))
+EMBEDDING_SIDECAR_MAX_WAIT_MS = float(os.getenv("EMBEDDING_SIDECAR_MAX_WAIT_MS", "5"))
 TOOL_KEY_PREFIX = os.getenv("TOOL_KEY_PREFIX", "core_agent:data:tool:")
+TOOL_INDEX_NAME = os.getenv("TOOL_INDEX_NAME", "core_agent_tool_index")
+# Bumped on every upload; must not share TOOL_KEY_PREFIX (the upload wipes that prefix)
+INVENTORY_VERSION_KEY = os.getenv("INVENTORY_VERSION_KEY", "core_agent:data:inventory_version")
+INVENTORY_VERSION_CHECK_SECONDS = float(os.getenv("INVENTORY_VERSION_CHECK_SECONDS", "2"))
+# Columnar snapshot file mapped read-only by every worker on the host; "" keeps a private copy per worker
+INVENTORY_SNAPSHOT_PATH = os.getenv("INVENTORY_SNAPSHOT_PATH", "./inventory_snapshot/inventory.snap")
+
+# Stored transcript encoding (app/chatstore/codec.py): compact | json. Readers accept both,
+# so switching is safe; on a rolling upgrade, deploy readers before writing "compact".
+TRANSCRIPT_FORMAT = os.getenv("TRANSCRIPT_FORMAT", "compact")
+TRANSCRIPT_ZSTD_MIN_BYTES = int(os.getenv("TRANSCRIPT_ZSTD_MIN_BYTES", "2048"))  # 0 = never compress
+TRANSCRIPT_ZSTD_LEVEL = int(os.getenv("TRANSCRIPT_ZSTD_LEVEL", "3"))
+
+# Session lifecycle (app/chatstore/cold_store.py, app/chatstore/archiver.py)
+SESSION_ACTIVITY_KEY = os.getenv("SESSION_ACTIVITY_KEY", f"{AGENT_NAME}:sessions:last_active")
+# Idle expiry of chat documents in Redis; 0 = never. Keep it above ARCHIVE_AFTER_SECONDS
+# when archiving, otherwise sessions expire before they are archived.
+SESSION_IDLE_TTL_SECONDS = int(os.getenv("SESSION_IDLE_TTL_SECONDS", "0"))
+ARCHIVE_AFTER_SECONDS = float(os.getenv("ARCHIVE_AFTER_SECONDS", "0"))  # 0 disables the archiver
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "300"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "200"))
+COLD_STORE_PATH = os.getenv("COLD_STORE_PATH", "./cold_store/sessions.sqlite3")
+
+# Graph checkpoints (latest checkpoint per session thread)
+CHECKPOINT_PREFIX = os.getenv("CHECKPOINT_PREFIX", f"{AGENT_NAME}:checkpoint")
+CHECKPOINT_TTL_SECONDS = int(os.getenv("CHECKPOINT_TTL_SECONDS", "0"))  # 0 = keep forever
+CHECKPOINT_MAX_MESSAGES = int(os.getenv("CHECKPOINT_MAX_MESSAGES", "40"))
+
+# Tool execution
+TOOL_MAX_CONCURRENCY = int(os.getenv("TOOL_MAX_CONCURRENCY", "4"))
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "15"))
+# Per-tool overrides, e.g. TOOL_TIMEOUTS='{"get_all_pallets": 30}'
+def _tool_timeouts(raw: str) -> dict[str, float]:
+    try:
+        return {str(k): float(v) for k, v in json.loads(raw).items()}
+    except (ValueError, TypeError, AttributeError) as e:
+        logger.warning("Ignoring TOOL_TIMEOUTS=%r (%s), every tool uses TOOL_TIMEOUT_SECONDS", raw, e)
+        return {}
+
+TOOL_TIMEOUTS = _tool_timeouts(os.getenv("TOOL_TIMEOUTS", "{}"))
+TOOL_CACHE_SIZE = int(os.getenv("TOOL_CACHE_SIZE", "256"))  # 0 disables memoization
+# Filter tools run FT.SEARCH on the tool index; results per call are capped here
+TOOL_QUERY_DEFAULT_LIMIT = int(os.getenv("TOOL_QUERY_DEFAULT_LIMIT", "10"))
+TOOL_QUERY_MAX_RESULTS = int(os.getenv("TOOL_QUERY_MAX_RESULTS", "50"))
+# Listings handed back to the LLM are paged and trimmed to bound its context
+TOOL_OUTPUT_MAX_ITEMS = int(os.getenv("TOOL_OUTPUT_MAX_ITEMS", "20"))  # default and maximum page size
+TOOL_OUTPUT_MAX_CHARS = int(os.getenv("TOOL_OUTPUT_MAX_CHARS", "6000"))  # text budget of one tool result
+TOOL_OUTPUT_MAX_IMAGES = int(os.getenv("TOOL_OUTPUT_MAX_IMAGES", "12"))
+TOOL_SEMANTIC_MAX_DISTANCE = float(os.getenv("TOOL_SEMANTIC_MAX_DISTANCE", "0.6"))  # cosine distance, 0..2
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))  # 0 disables caching
+
+# Chat runs
+CHAT_CANCEL_POLICY = os.getenv("CHAT_CANCEL_POLICY", "partial")  # partial | skip: what to store when the client disconnects
+CHAT_DISCONNECT_POLL_SECONDS = float(os.getenv("CHAT_DISCONNECT_POLL_SECONDS", "0.5"))
+CHAT_STREAM_TOOLS = os.getenv("CHAT_STREAM_TOOLS", "false").lower() in ("1", "true", "yes")  # stream tool-call/tool-result parts as tools finish
+# Delta requests: per-session cursor (version + recent message ids), expiring with the checkpoint
+CHAT_CURSOR_PREFIX = os.getenv("CHAT_CURSOR_PREFIX", f"{AGENT_NAME}:chat:cursor")
+CHAT_CURSOR_RECENT_IDS = int(os.getenv("CHAT_CURSOR_RECENT_IDS", "256"))  # message ids kept for deduplication
+
+# Admission control for /api/chat (limits are shared by all workers through Redis; 0 = unlimited)
+ADMISSION_PREFIX = os.getenv("ADMISSION_PREFIX", f"{AGENT_NAME}:admission")
+ADMISSION_GLOBAL_LIMIT = int(os.getenv("ADMISSION_GLOBAL_LIMIT", "64"))
+ADMISSION_USER_LIMIT = int(os.getenv("ADMISSION_USER_LIMIT", "4"))
+ADMISSION_AGENT_LIMIT = int(os.getenv("ADMISSION_AGENT_LIMIT", "0"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "128"))  # waiting requests across workers
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+ADMISSION_LEASE_SECONDS = float(os.getenv("ADMISSION_LEASE_SECONDS", "30"))  # refreshed while the run streams
+ADMISSION_POLL_SECONDS = float(os.getenv("ADMISSION_POLL_SECONDS", "0.1"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "2"))
+
+# Startup
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "5"))  # retry delay for failed warm-up steps
+
+# Observability
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text | json
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))  # fraction of DEBUG/INFO records kept
+OTEL_ENABLED = os.getenv("OTEL_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# LLM client
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or None  # None -> OPENAI_BASE_URL / api.openai.com
+# Ordered fallbacks tried when the first token misses its deadline: "model" or "model@base_url", comma separated
+LLM_FALLBACKS = os.getenv("LLM_FALLBACKS", "")
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_FIRST_TOKEN_TIMEOUT = float(os.getenv("LLM_FIRST_TOKEN_TIMEOUT", "20"))  # every endpoint, the last included; 0 = none
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "1"))
 
-# Cached model
+# Cached model (the backend pulls in torch / onnxruntime, so it is imported on first use)
 @lru_cache()
 def get_model():
-    return SentenceTransformer(EMBEDDING_MODEL)
+    from .embedding_backends import load_model
+    return load_model(EMBEDDING_BACKEND)
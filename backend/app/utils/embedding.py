@@ -1,13 +1,114 @@
 import numpy as np
 import asyncio
-from .config import get_model
+import logging
+import socket
+import time
+from .config import EMBEDDING_SOCKET, EMBEDDING_SIDECAR_TIMEOUT, EMBEDDING_SIDECAR_RETRY_SECONDS, get_model
+from .embedding_sidecar import RESPONSE_HEADER, encode_request, decode_response
+from .metrics import Counter
+from .tracing import stage
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_REQUESTS = Counter(
+    "embedding_requests_total",
+    "Embedding calls by where they were encoded (sidecar, local)",
+    ["backend"],
+)
+
+# ─── Sidecar client ─────────────────────────────────────
+# With EMBEDDING_SOCKET set, texts are encoded by the shared sidecar
+# (app/utils/embedding_sidecar.py). If it is unreachable we encode locally
+# and leave it alone for EMBEDDING_SIDECAR_RETRY_SECONDS.
+_sidecar_down_until = 0.0
+
+
+def _sidecar_available() -> bool:
+    return bool(EMBEDDING_SOCKET) and time.monotonic() >= _sidecar_down_until
+
+
+def _mark_sidecar_down(error: Exception):
+    global _sidecar_down_until
+    if time.monotonic() >= _sidecar_down_until:
+        logger.warning("Sidecar unavailable (%r), encoding locally for %gs", error, EMBEDDING_SIDECAR_RETRY_SECONDS)
+    _sidecar_down_until = time.monotonic() + EMBEDDING_SIDECAR_RETRY_SECONDS
+
+
+def _recv_exactly(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("embedding sidecar closed the connection")
+        buf += chunk
+    return bytes(buf)
+
+
+def _sidecar_encode_sync(texts: list[str]) -> np.ndarray:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(EMBEDDING_SIDECAR_TIMEOUT)
+        sock.connect(EMBEDDING_SOCKET)
+        sock.sendall(encode_request(texts))
+        status, length = RESPONSE_HEADER.unpack(_recv_exactly(sock, RESPONSE_HEADER.size))
+        return decode_response(status, _recv_exactly(sock, length), len(texts))
+
+
+async def _sidecar_encode(texts: list[str]) -> np.ndarray:
+    async def roundtrip():
+        reader, writer = await asyncio.open_unix_connection(EMBEDDING_SOCKET)
+        try:
+            writer.write(encode_request(texts))
+            await writer.drain()
+            status, length = RESPONSE_HEADER.unpack(await reader.readexactly(RESPONSE_HEADER.size))
+            return decode_response(status, await reader.readexactly(length), len(texts))
+        finally:
+            writer.close()
+
+    return await asyncio.wait_for(roundtrip(), EMBEDDING_SIDECAR_TIMEOUT)
+
+
+# ─── Public API ─────────────────────────────────────────
+def embed_texts_sync(texts: list[str]) -> np.ndarray:
+    """float32 matrix, one row per text."""
+    with stage("embedding"):
+        return _embed_texts_sync(texts)
+
+
+def _embed_texts_sync(texts: list[str]) -> np.ndarray:
+    if _sidecar_available():
+        try:
+            vectors = _sidecar_encode_sync(texts)
+            EMBEDDING_REQUESTS.labels(backend="sidecar").inc()
+            return vectors
+        except (OSError, RuntimeError, ValueError) as e:
+            _mark_sidecar_down(e)
+    EMBEDDING_REQUESTS.labels(backend="local").inc()
+    return np.asarray(get_model().encode(texts), dtype=np.float32)
+
+
+async def embed_texts(texts: list[str]) -> np.ndarray:
+    with stage("embedding"):
+        return await _embed_texts(texts)
+
+
+async def _embed_texts(texts: list[str]) -> np.ndarray:
+    if _sidecar_available():
+        try:
+            vectors = await _sidecar_encode(texts)
+            EMBEDDING_REQUESTS.labels(backend="sidecar").inc()
+            return vectors
+        except (OSError, RuntimeError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+            _mark_sidecar_down(e)
+    EMBEDDING_REQUESTS.labels(backend="local").inc()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, lambda: np.asarray(get_model().encode(texts), dtype=np.float32))
+
 
 def embedding_fn_sync(text: str) -> list[float]:
-    return get_model().encode(text).tolist()
+    return embed_texts_sync([text])[0].tolist()
 
 def embedding_to_bytes(vec: list[float]) -> bytes:
     return np.array(vec, dtype=np.float32).tobytes()
 
 async def embedding_fn(text: str) -> list[float]:
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, embedding_fn_sync, text)
+    return (await embed_texts([text]))[0].tolist()
@@ -0,0 +1,103 @@
+"""CPU inference backends for the embedding model.
+
+Every backend returns a SentenceTransformer-compatible object (``encode``
+accepting a string or a list of strings), so callers never branch on it.
+
+  torch        reference fp32 PyTorch model
+  torch-int8   the same model with its Linear layers dynamically quantized to int8
+  onnx         ONNX Runtime via sentence-transformers' onnx backend
+               (needs ``optimum[onnxruntime]``); EMBEDDING_ONNX_FILE picks a
+               specific export, e.g. ``onnx/model_qint8_avx512_vnni.onnx``
+"""
+import logging
+import os
+from typing import Callable, Optional
+
+from .config import (
+    EMBEDDING_MODEL,
+    EMBEDDING_BACKEND,
+    EMBEDDING_THREADS,
+    EMBEDDING_CPU_AFFINITY,
+    EMBEDDING_ONNX_FILE,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# ─── Threads ────────────────────────────────────────────
+def parse_cpu_list(spec: str) -> set[int]:
+    """``"0-3,6"`` -> {0, 1, 2, 3, 6}"""
+    cpus = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition("-")
+        cpus.update(range(int(start), int(end or start) + 1))
+    return cpus
+
+
+def configure_threads(threads: int = EMBEDDING_THREADS, affinity: str = EMBEDDING_CPU_AFFINITY):
+    """Pin the process and fix intra-op thread counts before the first encode.
+
+    Affinity applies to the whole process, so set it in the sidecar (or a
+    dedicated worker), not in a process that also serves requests on other cores.
+    """
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    if affinity and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, parse_cpu_list(affinity))
+    if threads > 0:
+        os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+        import torch
+
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass  # only settable before torch starts its pool
+
+
+# ─── Backends ───────────────────────────────────────────
+def _torch(model_name: str, threads: int):
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_name, device="cpu")
+
+
+def _torch_int8(model_name: str, threads: int):
+    import torch
+
+    model = _torch(model_name, threads)
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _onnx(model_name: str, threads: int):
+    from sentence_transformers import SentenceTransformer
+
+    model_kwargs = {"provider": "CPUExecutionProvider"}
+    if EMBEDDING_ONNX_FILE:
+        model_kwargs["file_name"] = EMBEDDING_ONNX_FILE
+    if threads > 0:
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        model_kwargs["session_options"] = options
+    return SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+
+
+BACKENDS: dict[str, Callable] = {
+    "torch": _torch,
+    "torch-int8": _torch_int8,
+    "onnx": _onnx,
+}
+
+
+def load_model(backend: str = EMBEDDING_BACKEND, model_name: str = EMBEDDING_MODEL, threads: Optional[int] = None):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND {backend!r}, expected one of {sorted(BACKENDS)}")
+    threads = EMBEDDING_THREADS if threads is None else threads
+    configure_threads(threads)
+    logger.info("Loading %s with backend=%s threads=%s", model_name, backend, threads or "default")
+    return BACKENDS[backend](model_name, threads)
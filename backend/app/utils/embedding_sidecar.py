@@ -0,0 +1,149 @@
+"""Embedding sidecar: one model per host, shared by every uvicorn worker.
+
+    poetry run python -m app.utils.embedding_sidecar
+    EMBEDDING_SOCKET=/tmp/embedding.sock poetry run uvicorn app.server:app --workers 4
+
+Requests from all connected workers go through one queue and are encoded
+together, up to EMBEDDING_SIDECAR_MAX_BATCH texts or
+EMBEDDING_SIDECAR_MAX_WAIT_MS after the first one arrives.
+
+Wire format (both directions are length-prefixed frames):
+  request   ">I" length + JSON ``{"texts": [...]}``
+  response  ">BI" status, length + payload
+            status 0: float32 matrix (len(texts) rows), status 1: utf-8 error
+"""
+import asyncio
+import json
+import logging
+import os
+import struct
+import time
+
+import numpy as np
+
+from .config import (
+    EMBEDDING_SOCKET,
+    EMBEDDING_SIDECAR_MAX_BATCH,
+    EMBEDDING_SIDECAR_MAX_WAIT_MS,
+    get_model,
+)
+from .log import configure_logging
+
+REQUEST_HEADER = struct.Struct(">I")
+RESPONSE_HEADER = struct.Struct(">BI")
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+logger = logging.getLogger("app.utils.embedding_sidecar")  # __name__ is "__main__" under -m
+
+
+# ─── Framing (shared with the client in embedding.py) ───
+def encode_request(texts: list[str]) -> bytes:
+    body = json.dumps({"texts": texts}, ensure_ascii=False).encode()
+    return REQUEST_HEADER.pack(len(body)) + body
+
+
+def decode_response(status: int, payload: bytes, rows: int) -> np.ndarray:
+    if status != STATUS_OK:
+        raise RuntimeError(f"embedding sidecar error: {payload.decode(errors='replace')}")
+    return np.frombuffer(payload, dtype=np.float32).reshape(rows, -1)
+
+
+# ─── Server ─────────────────────────────────────────────
+class EmbeddingSidecar:
+    def __init__(self, socket_path: str, max_batch: int, max_wait: float):
+        self.socket_path = socket_path
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self.batches = 0
+        self.texts = 0
+
+    async def _next_batch(self) -> list:
+        batch = [await self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    async def _batcher(self):
+        loop = asyncio.get_running_loop()
+        model = get_model()
+        while True:
+            batch = await self._next_batch()
+            texts = [t for item_texts, _ in batch for t in item_texts]
+            try:
+                # One encode call for every waiting worker; runs off-loop so new requests keep queueing
+                vectors = await loop.run_in_executor(None, lambda: np.asarray(model.encode(texts), dtype=np.float32))
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            offset = 0
+            for item_texts, future in batch:
+                if not future.done():
+                    future.set_result(vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # A connection may carry any number of requests, one at a time
+        try:
+            while True:
+                try:
+                    (length,) = REQUEST_HEADER.unpack(await reader.readexactly(REQUEST_HEADER.size))
+                    texts = json.loads(await reader.readexactly(length))["texts"]
+                except asyncio.IncompleteReadError:
+                    return
+                try:
+                    future = asyncio.get_running_loop().create_future()
+                    await self._queue.put(([str(t) for t in texts], future))
+                    payload = (await future).tobytes()
+                    writer.write(RESPONSE_HEADER.pack(STATUS_OK, len(payload)) + payload)
+                except Exception as e:
+                    message = str(e).encode()
+                    writer.write(RESPONSE_HEADER.pack(STATUS_ERROR, len(message)) + message)
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # stale socket from a previous run
+        # Load the model before accepting connections so clients never time out on the first batch
+        await asyncio.to_thread(lambda: get_model().encode("warm-up"))
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        batcher = asyncio.create_task(self._batcher())
+        logger.info("Sidecar listening on %s (batch <= %d, wait <= %gms)", self.socket_path, self.max_batch, self.max_wait * 1000)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+def main():
+    configure_logging()
+    socket_path = EMBEDDING_SOCKET or "/tmp/embedding.sock"
+    sidecar = EmbeddingSidecar(socket_path, EMBEDDING_SIDECAR_MAX_BATCH, EMBEDDING_SIDECAR_MAX_WAIT_MS / 1000)
+    try:
+        asyncio.run(sidecar.serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import json
+import logging
+import random
+import sys
+
+from .config import LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_RATE
+
+# ─── Logging ────────────────────────────────────────────
+# Modules log through logging.getLogger(__name__); this only configures the
+# "app" logger once at startup. DEBUG/INFO records are sampled with
+# LOG_SAMPLE_RATE, WARNING and above are always kept.
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, sample_rate: float = LOG_SAMPLE_RATE):
+    logger = logging.getLogger("app")
+    if getattr(logger, "_configured", False):
+        return logger
+
+    handler = logging.StreamHandler(sys.stdout)
+    if fmt == "json":
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s"))
+    handler.addFilter(SamplingFilter(sample_rate))
+
+    logger.addHandler(handler)
+    logger.setLevel(level.upper())
+    logger.propagate = False
+    logger._configured = True
+    return logger
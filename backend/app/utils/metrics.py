@@ -0,0 +1,173 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# ─── Lightweight in-process metrics ─────────────────────
+# Minimal counters/histograms with label support, modelled on the
+# prometheus_client API so call sites read the same way.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry: list = []
+_lock = threading.Lock()
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, object] = {}
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def labels(self, **labels):
+        key = self._key(labels)
+        child = self._children.get(key)
+        if child is None:
+            with _lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def __getattr__(self, name):
+        # Unlabelled metrics are used directly: GAUGE.inc() rather than GAUGE.labels().inc()
+        if name.startswith("_") or self.labelnames:
+            raise AttributeError(name)
+        return getattr(self.labels(), name)
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with _lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0.0
+        self._function = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        with _lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def set_function(self, function):
+        """Compute the value lazily, at collection time."""
+        self._function = function
+
+    def get(self) -> float:
+        return float(self._function()) if self._function else self.value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+
+class _HistogramChild:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        with _lock:
+            self.count += 1
+            self.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+
+def registered_metrics() -> list:
+    return list(_registry)
+
+
+# ─── Prometheus text exposition ─────────────────────────
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: tuple = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(str(v))}"' for n, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def render_prometheus() -> str:
+    """Every registered metric in the Prometheus text format (version 0.0.4)."""
+    lines = []
+    for metric in registered_metrics():
+        lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for key, child in sorted(metric._children.items()):
+            if isinstance(child, _HistogramChild):
+                with _lock:
+                    counts, count, total = list(child.counts), child.count, child.sum
+                # counts are already cumulative: observe() bumps every bucket >= value
+                for bound, bucket_count in zip(child.buckets, counts):
+                    labels = _format_labels(metric.labelnames, key, (("le", _format_value(bound)),))
+                    lines.append(f"{metric.name}_bucket{labels} {bucket_count}")
+                labels = _format_labels(metric.labelnames, key, (("le", "+Inf"),))
+                lines.append(f"{metric.name}_bucket{labels} {count}")
+                labels = _format_labels(metric.labelnames, key)
+                lines.append(f"{metric.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{metric.name}_count{labels} {count}")
+            else:
+                value = child.get() if isinstance(child, _GaugeChild) else child.value
+                lines.append(f"{metric.name}{_format_labels(metric.labelnames, key)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
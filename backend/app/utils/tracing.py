@@ -0,0 +1,115 @@
+import functools
+import logging
+import time
+from contextlib import contextmanager, nullcontext
+
+from .config import OTEL_ENABLED
+from .metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+# ─── Stage timing ───────────────────────────────────────
+# Every stage lands in one histogram keyed by stage name; span attributes
+# (agent, tool, model...) only go to OpenTelemetry, to keep label cardinality low.
+
+STAGE_LATENCY = Histogram(
+    "stage_seconds",
+    "Latency of request stages (graph nodes history, retrieval, join, agent, tools, save; delta_cursor, persist, embedding, ...)",
+    ["stage"],
+)
+STAGE_ERRORS = Counter(
+    "stage_errors_total",
+    "Stages that raised",
+    ["stage"],
+)
+HTTP_LATENCY = Histogram(
+    "http_request_seconds",
+    "HTTP request latency until the last body chunk is sent (streams included)",
+    ["method", "route", "status"],
+)
+
+_tracer = None
+if OTEL_ENABLED:
+    try:
+        # Only the API is required here; exporters come from the SDK / opentelemetry-instrument
+        from opentelemetry import trace
+
+        _tracer = trace.get_tracer("assistant-backend")
+    except ImportError:
+        logger.warning("OTEL_ENABLED is set but opentelemetry-api is not installed, spans disabled")
+
+
+def span(name: str, **attributes):
+    """OpenTelemetry span when tracing is enabled, otherwise a no-op context."""
+    if _tracer is None:
+        return nullcontext()
+    return _tracer.start_as_current_span(name, attributes={k: str(v) for k, v in attributes.items() if v is not None})
+
+
+@contextmanager
+def stage(name: str, **attributes):
+    start = time.perf_counter()
+    with span(name, **attributes):
+        try:
+            yield
+        except Exception:
+            STAGE_ERRORS.labels(stage=name).inc()
+            raise
+        finally:
+            STAGE_LATENCY.labels(stage=name).observe(time.perf_counter() - start)
+
+
+def traced_stage(name: str):
+    """Decorator form of ``stage`` for async functions (graph nodes, handlers)."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with stage(name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# ─── HTTP middleware ────────────────────────────────────
+class HTTPMetricsMiddleware:
+    """Pure ASGI middleware, so streamed responses are timed to their last chunk."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = {"code": 500}
+        observed = False
+
+        def observe():
+            nonlocal observed
+            if observed:
+                return
+            observed = True
+            route = scope.get("route")
+            # Route templates, never raw paths, so ids do not explode the label set
+            HTTP_LATENCY.labels(
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status["code"],
+            ).observe(time.perf_counter() - start)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                observe()
+
+        try:
+            with span(f"{scope['method']} {scope['path']}"):
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            observe()
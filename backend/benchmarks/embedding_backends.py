@@ -0,0 +1,134 @@
+"""Compare embedding backends on this host's CPU.
+
+For every backend it reports encode throughput (sentences/s) and how closely
+its vectors agree with the fp32 ``torch`` reference (cosine similarity per
+sentence: mean, p5 and min). Pick the fastest backend whose agreement is
+acceptable for retrieval, then set EMBEDDING_BACKEND for the deployment.
+
+    poetry run python -m benchmarks.embedding_backends --backends torch,torch-int8,onnx --threads 4
+
+Sentences are read one per line from ``--corpus`` if given, otherwise a
+synthetic warehouse/chat corpus is generated.
+"""
+import argparse
+import json
+import random
+import time
+
+import numpy as np
+
+from app.utils.config import EMBEDDING_MODEL
+from app.utils.embedding_backends import BACKENDS, load_model
+
+SUBJECTS = ["pallet", "thùng hàng", "kệ", "lô hàng", "container", "vật tư"]
+ACTIONS = ["đang ở vị trí", "cần chuyển tới", "đã xuất khỏi", "chờ kiểm tra tại", "được nhập vào"]
+PLACES = ["kho A", "kho B", "khu lạnh", "bãi xe", "dock 3", "tầng 2"]
+QUESTIONS = [
+    "How many pallets are in warehouse {n}?",
+    "Show me the status of object OBJ-{n:03d}",
+    "Tổng trọng lượng hàng trong kho là bao nhiêu?",
+    "Which items were updated after {n} March?",
+]
+
+
+def synthetic_corpus(size: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    sentences = []
+    for i in range(size):
+        if i % 3 == 0:
+            sentences.append(rng.choice(QUESTIONS).format(n=rng.randint(1, 200)))
+        else:
+            sentences.append(
+                f"{rng.choice(SUBJECTS)} OBJ-{rng.randint(1, 999):03d} {rng.choice(ACTIONS)} {rng.choice(PLACES)}, "
+                f"số lượng {rng.randint(1, 500)}, nặng {rng.uniform(1, 900):.1f} kg"
+            )
+    return sentences
+
+
+def encode(model, sentences: list[str], batch_size: int) -> np.ndarray:
+    return np.asarray(model.encode(sentences, batch_size=batch_size), dtype=np.float32)
+
+
+def cosine_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return np.sum(a * b, axis=1)
+
+
+def bench_backend(backend: str, sentences: list[str], batch_size: int, threads: int, repeats: int):
+    start = time.perf_counter()
+    model = load_model(backend, EMBEDDING_MODEL, threads)
+    load_seconds = time.perf_counter() - start
+    encode(model, sentences[:batch_size], batch_size)  # warm-up
+
+    best = float("inf")
+    vectors = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        vectors = encode(model, sentences, batch_size)
+        best = min(best, time.perf_counter() - start)
+
+    single_start = time.perf_counter()
+    for sentence in sentences[:50]:
+        model.encode(sentence)
+    single_ms = (time.perf_counter() - single_start) / min(50, len(sentences)) * 1000
+
+    result = {
+        "backend": backend,
+        "load_seconds": round(load_seconds, 3),
+        "sentences_per_second": round(len(sentences) / best, 1),
+        "single_sentence_ms": round(single_ms, 2),
+    }
+    return result, vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="comma separated, torch is always the reference")
+    parser.add_argument("--corpus", help="text file, one sentence per line")
+    parser.add_argument("--sentences", type=int, default=1000, help="synthetic corpus size")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=0, help="0 = library default")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as f:
+            sentences = [line.strip() for line in f if line.strip()]
+    else:
+        sentences = synthetic_corpus(args.sentences)
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    if "torch" in backends:
+        backends.remove("torch")
+    backends.insert(0, "torch")
+
+    results = []
+    reference = None
+    for backend in backends:
+        try:
+            result, vectors = bench_backend(backend, sentences, args.batch_size, args.threads, args.repeats)
+        except ImportError as e:
+            results.append({"backend": backend, "error": f"missing dependency: {e}"})
+            continue
+        if reference is None:
+            reference = vectors
+        cosines = cosine_rows(vectors, reference)
+        result["cosine_vs_torch"] = {
+            "mean": round(float(cosines.mean()), 5),
+            "p5": round(float(np.percentile(cosines, 5)), 5),
+            "min": round(float(cosines.min()), 5),
+        }
+        results.append(result)
+
+    print(json.dumps({
+        "model": EMBEDDING_MODEL,
+        "sentences": len(sentences),
+        "batch_size": args.batch_size,
+        "threads": args.threads,
+        "results": results,
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+"""End-to-end load test of the FastAPI service against a stub LLM.
+
+Starts (unless --app-url is given) the OpenAI-compatible stub from
+benchmarks/stub_openai.py and the app itself under uvicorn, pointed at the
+stub and at a local Redis Stack, waits for /ready, then runs these phases:
+
+  upload   POST /api/upload_tools_excel with a generated inventory sheet
+  chat     concurrent /api/chat sessions; each session is seeded with a stored
+           transcript of N turns (--history-lengths) and then sends --turns turns
+  get      POST /api/chat/get for the seeded sessions
+  search   POST /api/chat/search for the seeded sessions
+
+    poetry run python -m benchmarks.load_test --sessions 50 --concurrency 10 --output results.json
+
+Each phase reports throughput, p50/p99 of total latency (plus time to first
+text token for chat) and Redis commands per request (INFO delta, so run it
+against a Redis nobody else is using). The JSON document also carries the
+app's own stage means from /metrics and the git revision, so runs can be
+diffed across releases.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+import numpy as np
+from redis import Redis
+
+from app.chatstore.codec import transcript_fields
+from app.chatstore.sharding import index_router
+from app.utils.config import EMBEDDING_DIM
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AGENT = "loadtest"
+QUESTIONS = [
+    "Trạng thái của pallet OBJ-{n:03d} là gì?",
+    "Cho tôi thông tin sản phẩm OBJ-{n:03d}",
+    "Quy trình nhập kho hướng dẫn thế nào?",
+    "Liệt kê tất cả pallet trong kho",
+    "Hello, how many items are in stock?",
+]
+
+
+# ─── Process management ─────────────────────────────────
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn(args: list[str], env: dict) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, *args],
+        cwd=BACKEND_DIR,
+        env={**os.environ, **env},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_for(url: str, timeout: float, ok_status: int = 200):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.perf_counter() < deadline:
+            try:
+                if (await client.get(url, timeout=1)).status_code == ok_status:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# ─── Measurements ───────────────────────────────────────
+def percentile(values: list[float], q: float):
+    return round(float(np.percentile(values, q)), 4) if values else None
+
+
+def summarize(name: str, latencies: list[float], wall: float, errors: int, redis_ops: int, ttfts: list[float] = None) -> dict:
+    requests = len(latencies) + errors
+    result = {
+        "phase": name,
+        "requests": requests,
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else None,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p99": percentile(latencies, 99),
+        "redis_ops_per_request": round(redis_ops / requests, 2) if requests else None,
+    }
+    if ttfts is not None:
+        result["ttft_p50"] = percentile(ttfts, 50)
+        result["ttft_p99"] = percentile(ttfts, 99)
+    return result
+
+
+def redis_commands(redis: Redis) -> int:
+    return int(redis.info("stats")["total_commands_processed"])
+
+
+def stage_means(metrics_text: str) -> dict:
+    sums, counts = {}, {}
+    for line in metrics_text.splitlines():
+        if line.startswith("stage_seconds_sum") or line.startswith("stage_seconds_count"):
+            series, value = line.rsplit(" ", 1)
+            stage = series.split('stage="', 1)[1].split('"', 1)[0]
+            (sums if series.startswith("stage_seconds_sum") else counts)[stage] = float(value)
+    return {s: round(sums[s] / counts[s], 4) for s in sorted(counts) if counts[s]}
+
+
+# ─── Fixtures ───────────────────────────────────────────
+def inventory_workbook(rows: int) -> bytes:
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    sheet = wb.active
+    sheet.append([
+        "id", "name", "type", "status", "location", "quantity", "unit", "weight",
+        "dimensions.length", "dimensions.width", "dimensions.height", "tags", "metadata", "images",
+    ])
+    rng = random.Random(0)
+    for i in range(rows):
+        sheet.append([
+            f"OBJ-{i:03d}", f"Pallet {i}", rng.choice(["pallet", "box", "crate"]),
+            rng.choice(["in_stock", "reserved", "shipped"]), f"Kho {rng.choice('ABC')}-{rng.randint(1, 20)}",
+            rng.randint(1, 500), "pcs", round(rng.uniform(5, 900), 1),
+            120, 100, rng.randint(50, 200), "demo,load", json.dumps({"batch": i // 10}), "[]",
+        ])
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def seed_history(redis: Redis, user_id: str, session_id: str, turns: int):
+    """Write a stored transcript the way save_chat_to_vector does (zero vector, no model needed)."""
+    entries = []
+    for t in range(turns):
+        entries.append({"role": "user", "type": "text", "text": QUESTIONS[t % len(QUESTIONS)].format(n=t)})
+        entries.append({"role": "assistant", "type": "text", "text": [{"type": "text", "text": f"Trả lời số {t}"}]})
+    doc_id = f"{AGENT}:{user_id}:{session_id}"
+    redis.hset(index_router.key(AGENT, user_id, session_id), mapping={
+        "id": doc_id,
+        **transcript_fields(entries),
+        "agent": AGENT,
+        "user_id": user_id,
+        "session_id": session_id,
+        "embedding": np.zeros(EMBEDDING_DIM, dtype=np.float32).tobytes(),
+    })
+
+
+# ─── Phases ─────────────────────────────────────────────
+async def timed_calls(redis: Redis, concurrency: int, calls: list, name: str) -> dict:
+    """Run ``calls`` (coroutine factories returning their latency) with bounded concurrency."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(factory):
+        nonlocal errors
+        async with semaphore:
+            try:
+                result = await factory()
+            except Exception:
+                errors += 1
+                return
+        latencies.append(result)
+
+    ops_before = redis_commands(redis)
+    start = time.perf_counter()
+    await asyncio.gather(*(one(c) for c in calls))
+    wall = time.perf_counter() - start
+    ops = redis_commands(redis) - ops_before - 1  # minus the INFO call itself
+    return summarize(name, latencies, wall, errors, ops)
+
+
+async def chat_turn(client: httpx.AsyncClient, user_id: str, session_id: str, text: str):
+    body = {
+        "session_id": session_id,
+        "user_id": user_id,
+        "agent": AGENT,
+        "system": "",
+        "tools": [],
+        "messages": [{"role": "user", "content": [{"type": "text", "text": text}]}],
+    }
+    start = time.perf_counter()
+    ttft = None
+    async with client.stream("POST", "/api/chat", json=body) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            # DataStream text parts are "0:<json string>"
+            if ttft is None and line.startswith("0:"):
+                ttft = time.perf_counter() - start
+    return time.perf_counter() - start, ttft
+
+
+async def run_session(client, user_id, session_id, turns, rng):
+    results = []
+    for _ in range(turns):
+        results.append(await chat_turn(client, user_id, session_id, rng.choice(QUESTIONS).format(n=rng.randint(0, 99))))
+    return results
+
+
+async def run(args) -> dict:
+    redis = Redis.from_url(args.redis_url)
+    processes = []
+    app_url = args.app_url
+    try:
+        if not app_url:
+            stub_port, app_port = free_port(), free_port()
+            processes.append(spawn([
+                "-m", "benchmarks.stub_openai", "--port", str(stub_port),
+                "--first-token-delay", str(args.first_token_delay),
+                "--tokens-per-second", str(args.tokens_per_second),
+                "--reply-tokens", str(args.reply_tokens),
+            ], {}))
+            processes.append(spawn(
+                ["-m", "uvicorn", "app.server:app", "--port", str(app_port), "--workers", str(args.workers), "--log-level", "warning"],
+                {
+                    "LLM_BASE_URL": f"http://127.0.0.1:{stub_port}/v1",
+                    "OPENAI_API_KEY": "stub",
+                    "REDIS_URL": args.redis_url,
+                    "LLM_FALLBACKS": "",
+                },
+            ))
+            app_url = f"http://127.0.0.1:{app_port}"
+            await wait_for(f"http://127.0.0.1:{stub_port}/v1/models", 30)
+        await wait_for(f"{app_url}/ready", args.ready_timeout)
+
+        phases = []
+        limits = httpx.Limits(max_connections=args.concurrency * 2)
+        async with httpx.AsyncClient(base_url=app_url, timeout=args.request_timeout, limits=limits) as client:
+            if args.upload_rows:
+                workbook = inventory_workbook(args.upload_rows)
+
+                async def upload():
+                    start = time.perf_counter()
+                    files = {"file": ("inventory.xlsx", workbook, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+                    (await client.post("/api/upload_tools_excel", files=files)).raise_for_status()
+                    return time.perf_counter() - start
+
+                phases.append(await timed_calls(redis, 1, [upload] * args.uploads, "upload"))
+
+            run_id = uuid.uuid4().hex[:8]
+            history_lengths = [int(h) for h in args.history_lengths.split(",")]
+            sessions = []
+            for i in range(args.sessions):
+                user_id, session_id = f"user-{run_id}-{i % 10}", f"s-{run_id}-{i}"
+                history = history_lengths[i % len(history_lengths)]
+                seed_history(redis, user_id, session_id, history)
+                sessions.append((user_id, session_id, history, args.seed + i))
+
+            # Chat: one call per session (its turns run in order), results split per turn below
+            per_history: dict[int, list] = {h: [] for h in history_lengths}
+            ops_before = redis_commands(redis)
+            start = time.perf_counter()
+            semaphore = asyncio.Semaphore(args.concurrency)
+            errors = 0
+
+            async def session_task(user_id, session_id, history, seed):
+                nonlocal errors
+                async with semaphore:
+                    try:
+                        per_history[history].extend(await run_session(client, user_id, session_id, args.turns, random.Random(seed)))
+                    except Exception:
+                        errors += 1
+
+            await asyncio.gather(*(session_task(*s) for s in sessions))
+            wall = time.perf_counter() - start
+            ops = redis_commands(redis) - ops_before - 1
+            all_turns = [r for results in per_history.values() for r in results]
+            chat = summarize("chat", [r[0] for r in all_turns], wall, errors, ops, [r[1] for r in all_turns if r[1] is not None])
+            chat["turns_per_session"] = args.turns
+            chat["by_history_length"] = {
+                str(h): {
+                    "latency_p50": percentile([r[0] for r in results], 50),
+                    "latency_p99": percentile([r[0] for r in results], 99),
+                    "ttft_p50": percentile([r[1] for r in results if r[1] is not None], 50),
+                }
+                for h, results in per_history.items()
+            }
+            phases.append(chat)
+
+            def post(path, body):
+                async def call():
+                    start = time.perf_counter()
+                    (await client.post(path, json=body)).raise_for_status()
+                    return time.perf_counter() - start
+                return call
+
+            ids = [{"agent": AGENT, "user_id": u, "session_id": s} for u, s, _, _ in sessions]
+            phases.append(await timed_calls(redis, args.concurrency, [post("/api/chat/get", b) for b in ids], "get"))
+            phases.append(await timed_calls(
+                redis, args.concurrency, [post("/api/chat/search", {**b, "query_text": "trạng thái pallet"}) for b in ids], "search"
+            ))
+
+            metrics = await client.get("/metrics")
+            stages = stage_means(metrics.text) if metrics.status_code == 200 else {}
+
+        return {
+            "revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "config": {k: v for k, v in vars(args).items() if k != "output"},
+            "phases": phases,
+            "stage_mean_seconds": stages,
+        }
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+        redis.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app-url", help="use a running app instead of starting one (its LLM must be the stub)")
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL", "redis://localhost:6379"))
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--sessions", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=2, help="chat turns sent per session")
+    parser.add_argument("--history-lengths", default="0,5,20", help="stored turns seeded per session, cycled")
+    parser.add_argument("--upload-rows", type=int, default=200, help="0 skips the upload phase")
+    parser.add_argument("--uploads", type=int, default=1)
+    parser.add_argument("--first-token-delay", type=float, default=0.1)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--reply-tokens", type=int, default=40)
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--ready-timeout", type=float, default=180.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON here as well as to stdout")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
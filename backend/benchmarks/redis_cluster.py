@@ -0,0 +1,133 @@
+"""Check the cluster key layout and measure session writes against REDIS_URL.
+
+Uses the app's own clients and key builders, so REDIS_CLUSTER picks the mode.
+A local multi-process cluster (3 primaries, 3 replicas) for trying it out:
+
+    for port in 7000 7001 7002 7003 7004 7005; do
+      mkdir -p /tmp/rc/$port && redis-stack-server --port $port --dir /tmp/rc/$port \\
+        --cluster-enabled yes --cluster-config-file nodes.conf --daemonize yes
+    done
+    redis-cli --cluster create 127.0.0.1:7000 127.0.0.1:7001 127.0.0.1:7002 \\
+      127.0.0.1:7003 127.0.0.1:7004 127.0.0.1:7005 --cluster-replicas 1 --cluster-yes
+
+    REDIS_CLUSTER=true REDIS_URL=redis://127.0.0.1:7000 \\
+      poetry run python -m benchmarks.redis_cluster --sessions 5000
+
+Phases:
+
+  slots    every key of a session (chat document in each shard layout,
+           checkpoint and its writes, delta cursor) and the admission keys
+           must hash to one slot; reports violations
+  write    pipelined transcript + activity writes of --sessions sessions,
+           the way save_chat_to_vector stores them (no index, no model)
+  scan     SCAN of the written documents across every primary
+  unlink   slot-grouped UNLINK of everything written
+
+Prints one JSON document, including how many documents each primary holds.
+Run it against a Redis nobody else is using: it deletes what it wrote.
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from collections import Counter
+
+from redis.crc import key_slot
+
+from app.chatstore.codec import write_transcript
+from app.chatstore.cold_store import touch_session
+from app.chatstore.connection import redis_manager, unlink_keys
+from app.chatstore.cursor import chat_cursor
+from app.chatstore.sharding import LAYOUTS, index_router
+from app.langgraph.memory import checkpointer, session_thread_id
+from app.utils.admission import admission
+from app.utils.config import SESSION_ACTIVITY_KEY
+
+AGENT = "clustercheck"
+
+
+def session_keys(user_id: str, session_id: str) -> list[str]:
+    thread_id = session_thread_id(AGENT, user_id, session_id)
+    checkpoint = checkpointer._key(thread_id)
+    return [
+        *(index_router.shard_for(AGENT, user_id, layout).key(AGENT, user_id, session_id) for layout in LAYOUTS),
+        checkpoint,
+        f"{checkpoint}:writes",
+        *chat_cursor._keys(thread_id),
+    ]
+
+
+def check_slots(sessions: list[tuple[str, str]]) -> dict:
+    split = [s for s in sessions if len({key_slot(k.encode()) for k in session_keys(*s)}) > 1]
+    admission_keys = [key for _, key, _ in admission._scopes("u", "a")] + [f"{admission.key_prefix}:queue"]
+    slots = Counter(key_slot(index_router.key(AGENT, *s).encode()) for s in sessions)
+    return {
+        "sessions_split_across_slots": len(split),
+        "admission_single_slot": len({key_slot(k.encode()) for k in admission_keys}) == 1,
+        "distinct_document_slots": len(slots),
+    }
+
+
+async def write_sessions(client, sessions: list[tuple[str, str]], batch: int) -> dict:
+    entries = [
+        {"role": "user", "type": "text", "text": "Pallet OBJ-001 đang ở đâu?"},
+        {"role": "assistant", "type": "text", "text": [{"type": "text", "text": "Pallet OBJ-001 ở kho A."}]},
+    ]
+    start = time.perf_counter()
+    for i in range(0, len(sessions), batch):
+        async with client.pipeline(transaction=False) as pipe:
+            for user_id, session_id in sessions[i:i + batch]:
+                key = index_router.key(AGENT, user_id, session_id)
+                pipe.hset(key, mapping={"agent": AGENT, "user_id": user_id, "session_id": session_id})
+                write_transcript(pipe, key, entries)
+                touch_session(pipe, key)
+            await pipe.execute()
+    elapsed = time.perf_counter() - start
+    return {"seconds": round(elapsed, 3), "sessions_per_s": round(len(sessions) / elapsed, 1)}
+
+
+async def primaries_load(client, pattern: str) -> dict:
+    if not redis_manager.cluster:
+        return {}
+    per_node = {}
+    for node in client.get_primaries():
+        keys = [k async for k in client.scan_iter(match=pattern, count=1000, target_nodes=node)]
+        per_node[node.name] = len(keys)
+    return per_node
+
+
+async def run(args) -> dict:
+    client = redis_manager.aio(decode=False)
+    run_id = uuid.uuid4().hex[:8]
+    sessions = [(f"{run_id}-u{i % args.users}", f"s{i}") for i in range(args.sessions)]
+    result = {"cluster": redis_manager.cluster, "sessions": args.sessions, "slots": check_slots(sessions)}
+
+    result["write"] = await write_sessions(client, sessions, args.batch)
+
+    pattern = f"*{AGENT}:{run_id}-*"
+    start = time.perf_counter()
+    found = [k async for k in client.scan_iter(match=pattern, count=1000)]
+    result["scan"] = {"found": len(found), "seconds": round(time.perf_counter() - start, 3)}
+    result["primaries"] = await primaries_load(client, pattern)
+
+    start = time.perf_counter()
+    removed = await unlink_keys(client, found)
+    if found:
+        await client.zrem(SESSION_ACTIVITY_KEY, *found)
+    result["unlink"] = {"removed": removed, "seconds": round(time.perf_counter() - start, 3)}
+    await redis_manager.aclose()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=200, help="sessions are spread over this many users")
+    parser.add_argument("--batch", type=int, default=200, help="sessions per pipeline")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
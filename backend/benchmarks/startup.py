@@ -0,0 +1,105 @@
+"""Startup benchmark: import cost of ``app.server`` and time until /ready.
+
+Each run uses a fresh interpreter, so module caches, the embedding model and
+Redis pools are all cold, the way a new worker starts.
+
+    poetry run python -m benchmarks.startup --runs 5
+
+Prints one JSON document with per-run samples and medians:
+``import_seconds`` (``import app.server`` alone), ``first_response_seconds``
+(process spawn until the server answers anything) and ``ready_seconds``
+(process spawn until /ready returns 200).
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import app.server; print(time.perf_counter() - t)"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_import() -> float:
+    out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def probe(url: str):
+    """HTTP status of ``url``, or None while nothing is listening."""
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except (urllib.error.URLError, ConnectionError, TimeoutError):
+        return None
+
+
+def measure_ready(timeout: float, interval: float) -> dict:
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/ready"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.server:app", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    result = {"first_response_seconds": None, "ready_seconds": None}
+    try:
+        while time.perf_counter() - start < timeout:
+            status = probe(url)
+            elapsed = time.perf_counter() - start
+            if status is not None and result["first_response_seconds"] is None:
+                result["first_response_seconds"] = elapsed
+            if status == 200:
+                result["ready_seconds"] = elapsed
+                break
+            if server.poll() is not None:
+                raise RuntimeError(f"server exited with code {server.returncode}")
+            time.sleep(interval)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+    return result
+
+
+def median(values: list):
+    values = [v for v in values if v is not None]
+    return statistics.median(values) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=120.0, help="give up on /ready after this many seconds")
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between /ready polls")
+    parser.add_argument("--skip-ready", action="store_true", help="only measure import time")
+    args = parser.parse_args()
+
+    # Children must resolve the "app" package from the backend directory
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    runs = []
+    for _ in range(args.runs):
+        run = {"import_seconds": measure_import()}
+        if not args.skip_ready:
+            run.update(measure_ready(args.timeout, args.interval))
+        runs.append(run)
+
+    summary = {key: median([r.get(key) for r in runs]) for key in ("import_seconds", "first_response_seconds", "ready_seconds")}
+    print(json.dumps({"runs": runs, "median": summary}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Deterministic OpenAI-compatible chat completions stub.
+
+Streams a fixed reply at a configurable token rate after a configurable
+first-token delay, so the LLM client (pooling, TTFT deadline, fallbacks)
+and the whole service can be exercised without a real upstream.
+
+    poetry run python -m benchmarks.stub_openai --port 8900 --first-token-delay 0.2 --tokens-per-second 50
+    LLM_BASE_URL=http://127.0.0.1:8900/v1 OPENAI_API_KEY=stub poetry run python -m app.server
+
+Per-model delays (e.g. to force a fallback) are set with
+``--model-delays '{"slow-model": 30}'``.
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = (
+    "Kho hiện có đủ hàng theo yêu cầu của bạn và thông tin chi tiết được tóm tắt như sau "
+    "vui lòng kiểm tra lại mã pallet vị trí lưu trữ số lượng và trọng lượng trước khi xuất kho"
+).split()
+
+
+def build_app(first_token_delay: float, tokens_per_second: float, reply_tokens: int, model_delays: dict) -> FastAPI:
+    app = FastAPI()
+    stats = {"requests": 0, "streamed_tokens": 0}
+
+    def reply_words(n: int) -> list[str]:
+        return [WORDS[i % len(WORDS)] for i in range(n)]
+
+    def chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> str:
+        body = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(body, ensure_ascii=False)}\n\n"
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "stub", "object": "model"}]}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "stub")
+        stats["requests"] += 1
+        delay = model_delays.get(model, first_token_delay)
+        words = reply_words(int(body.get("max_tokens") or reply_tokens))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        interval = 1.0 / tokens_per_second if tokens_per_second > 0 else 0.0
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay + interval * len(words))
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": " ".join(words)},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(words), "total_tokens": len(words)},
+            })
+
+        async def events():
+            # Like the real API, the role-only delta comes at once and the delay precedes the first token
+            yield chunk(completion_id, model, {"role": "assistant", "content": ""})
+            await asyncio.sleep(delay)
+            for i, word in enumerate(words):
+                if i and interval:
+                    await asyncio.sleep(interval)
+                stats["streamed_tokens"] += 1
+                yield chunk(completion_id, model, {"content": word if i == 0 else f" {word}"})
+            yield chunk(completion_id, model, {}, finish_reason="stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--first-token-delay", type=float, default=0.1, help="seconds before the first content chunk")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0, help="0 streams as fast as possible")
+    parser.add_argument("--reply-tokens", type=int, default=40)
+    parser.add_argument("--model-delays", default="{}", help='JSON map of model -> first-token delay')
+    args = parser.parse_args()
+
+    import uvicorn
+
+    app = build_app(args.first_token_delay, args.tokens_per_second, args.reply_tokens, json.loads(args.model_delays))
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
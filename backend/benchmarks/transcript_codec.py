@@ -0,0 +1,103 @@
+"""Compare stored transcript encodings: bytes kept in Redis and codec time per turn.
+
+Formats: ``json`` (the legacy ``text`` field), ``compact`` (msgpack rows, no
+compression) and ``compact+zstd`` (compressed regardless of size, to show the
+gain TRANSCRIPT_ZSTD_MIN_BYTES trades against CPU). A turn is one user and one
+assistant entry; times are per turn of the transcript, because a save
+re-encodes and a load decodes the whole transcript.
+
+    poetry run python -m benchmarks.transcript_codec --turns 1,10,50,200
+
+Prints one JSON document. No Redis or model needed.
+"""
+import argparse
+import json
+import random
+import time
+
+from app.chatstore.codec import decode_transcript, encode_transcript, zstandard
+
+QUESTIONS = [
+    "Pallet OBJ-{n:03d} đang ở đâu?",
+    "How many pallets are stored in warehouse {n}?",
+    "Tổng trọng lượng hàng trong kho là bao nhiêu?",
+    "Liệt kê các pallet có trạng thái 'Đang chờ xuất' ở kho B",
+]
+ANSWERS = [
+    "Pallet OBJ-{n:03d} đang ở kho A, kệ {n}, trạng thái: Đã nhập kho. Trọng lượng {w} kg, kích thước 120x100x{h} cm.",
+    "There are {n} pallets in warehouse {n}: {w} kg in total, most of them waiting for dispatch.",
+    "Tổng trọng lượng hiện tại là {w} kg trên {n} pallet. Pallet nặng nhất là OBJ-{n:03d}.",
+]
+
+
+def synthetic_transcript(turns: int, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    entries = []
+    for _ in range(turns):
+        fields = {"n": rng.randint(1, 300), "w": rng.randint(50, 2000), "h": rng.randint(50, 200)}
+        answer = " ".join(rng.choice(ANSWERS).format(**fields) for _ in range(rng.randint(1, 4)))
+        entries.append({"role": "user", "type": "text", "text": rng.choice(QUESTIONS).format(**fields)})
+        entries.append({"role": "assistant", "type": "text", "text": [{"type": "text", "text": answer}]})
+    return entries
+
+
+FORMATS = {
+    "json": (
+        lambda entries: json.dumps(entries, ensure_ascii=False).encode(),
+        lambda value: json.loads(value),
+    ),
+    "compact": (
+        lambda entries: encode_transcript(entries, zstd_min_bytes=0),
+        decode_transcript,
+    ),
+    "compact+zstd": (
+        lambda entries: encode_transcript(entries, zstd_min_bytes=1),
+        decode_transcript,
+    ),
+}
+
+
+def best_of(fn, arg, repeats: int) -> float:
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(arg)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench(entries: list[dict], turns: int, repeats: int) -> dict:
+    result = {"turns": turns}
+    for name, (encode, decode) in FORMATS.items():
+        if name == "compact+zstd" and zstandard is None:
+            result[name] = {"error": "zstandard not installed"}
+            continue
+        value = encode(entries)
+        assert decode(value) == entries, f"{name} does not round-trip"
+        result[name] = {
+            "bytes": len(value),
+            "bytes_per_turn": round(len(value) / turns, 1),
+            "encode_us_per_turn": round(best_of(encode, entries, repeats) / turns * 1e6, 2),
+            "decode_us_per_turn": round(best_of(decode, value, repeats) / turns * 1e6, 2),
+        }
+    result["compact_ratio"] = round(result["compact"]["bytes"] / result["json"]["bytes"], 3)
+    if "bytes" in result["compact+zstd"]:
+        result["compact+zstd_ratio"] = round(result["compact+zstd"]["bytes"] / result["json"]["bytes"], 3)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", default="1,10,50,200", help="comma separated transcript lengths")
+    parser.add_argument("--repeats", type=int, default=50, help="timing repeats (best is kept)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = []
+    for turns in (int(t) for t in args.turns.split(",")):
+        results.append(bench(synthetic_transcript(turns, args.seed), turns, args.repeats))
+    print(json.dumps({"repeats": args.repeats, "results": results}, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.graph.message import add_messages
+
+from app.langgraph.agent import join_prefetch
+
+QUESTION = "chính sách đổi trả thế nào?"
+
+
+def join(messages, history=None, context=None) -> list:
+    state = {"messages": messages, "prefetched_history": history, "retrieved_context": context}
+    update = asyncio.run(join_prefetch(state, {"configurable": {}}))
+    assert update["prefetched_history"] is None and update["retrieved_context"] is None
+    return [(type(m).__name__, m.content) for m in add_messages(messages, update["messages"])]
+
+
+def checkpointed() -> list:
+    return add_messages([], [HumanMessage(content="xin chào"), AIMessage(content="chào bạn")])
+
+
+def test_context_goes_before_the_latest_question():
+    messages = add_messages(checkpointed(), [HumanMessage(content=QUESTION)])
+    assert join(messages, context="đổi trong 7 ngày") == [
+        ("HumanMessage", "xin chào"),
+        ("AIMessage", "chào bạn"),
+        ("SystemMessage", "Ngữ cảnh: đổi trong 7 ngày"),
+        ("HumanMessage", QUESTION),
+    ]
+
+
+def test_replayed_history_and_context():
+    messages = add_messages([], [HumanMessage(content=QUESTION)])
+    history = [HumanMessage(content="xin chào"), AIMessage(content="chào bạn")]
+    assert join(messages, history=history, context="đổi trong 7 ngày") == [
+        ("HumanMessage", "xin chào"),
+        ("AIMessage", "chào bạn"),
+        ("SystemMessage", "Ngữ cảnh: đổi trong 7 ngày"),
+        ("HumanMessage", QUESTION),
+    ]
+
+
+def test_unneeded_context_is_discarded():
+    messages = add_messages(checkpointed(), [HumanMessage(content="mã đơn 42 ở đâu?")])
+    assert join(messages, context="đổi trong 7 ngày") == [
+        ("HumanMessage", "xin chào"),
+        ("AIMessage", "chào bạn"),
+        ("HumanMessage", "mã đơn 42 ở đâu?"),
+    ]
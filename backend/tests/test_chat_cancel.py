@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")  # fakeredis runs EVAL through lupa
+pytest.importorskip("assistant_stream")
+
+from app.chatstore import cursor as cursor_module
+from app.chatstore.cursor import ChatCursor
+from app.routes import add_langgraph_route as route
+
+
+class FakeManager:
+    cluster = False
+
+    def __init__(self):
+        self.client = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    def aio(self, decode: bool = True):
+        return self.client
+
+
+@pytest.fixture
+def cursor(monkeypatch):
+    monkeypatch.setattr(cursor_module, "redis_manager", FakeManager())
+    return ChatCursor(prefix="test:cursor", ttl=0)
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    turns = []
+
+    async def append_chat_text(agent, user_id, session_id, messages, **fields):
+        turns.append([m.content for m in messages])
+
+    monkeypatch.setattr(route, "append_chat_text", append_chat_text)
+    return turns
+
+
+REQUEST = route.ChatRequest(
+    session_id="s",
+    messages=[{"role": "user", "id": "u1", "content": [{"type": "text", "text": "hi"}]}],
+    base_version=0,
+)
+
+
+def cancel_then_retry(cursor: ChatCursor) -> list[int]:
+    async def scenario():
+        version, accepted = await cursor.advance("s", 0, ["u1"])
+
+        async def rewind():
+            await cursor.rewind("s", version, ["u1"])
+
+        await route.settle_cancelled_turn(REQUEST, [HumanMessage(content="hi")], rewind)
+        # The client sends the turn again on the same base version
+        return (await cursor.advance("s", 0, ["u1"]))[1]
+
+    return asyncio.run(scenario())
+
+
+def test_persisted_cancelled_turn_is_not_sent_again(cursor, stored, monkeypatch):
+    monkeypatch.setattr(route, "CHAT_CANCEL_POLICY", "partial")
+    # Nothing to run: the route answers 409 no_new_messages
+    assert cancel_then_retry(cursor) == []
+    assert stored == [["hi"]]
+
+
+def test_skipped_cancelled_turn_is_accepted_again(cursor, stored, monkeypatch):
+    monkeypatch.setattr(route, "CHAT_CANCEL_POLICY", "skip")
+    assert cancel_then_retry(cursor) == [0]
+    assert stored == []
+
+
+def test_failed_persist_rewinds(cursor, monkeypatch):
+    async def append_chat_text(*args, **kwargs):
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(route, "append_chat_text", append_chat_text)
+    monkeypatch.setattr(route, "CHAT_CANCEL_POLICY", "partial")
+    assert cancel_then_retry(cursor) == [0]
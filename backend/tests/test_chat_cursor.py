@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")  # fakeredis runs EVAL through lupa
+
+from app.chatstore import cursor as cursor_module
+from app.chatstore.cursor import ChatCursor, CursorConflict
+
+
+class FakeManager:
+    cluster = False
+
+    def __init__(self):
+        self.client = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    def aio(self, decode: bool = True):
+        return self.client
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    manager = FakeManager()
+    monkeypatch.setattr(cursor_module, "redis_manager", manager)
+    return manager.client
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_advance_accepts_new_messages(redis):
+    cursor = ChatCursor(prefix="test:cursor", ttl=0)
+    assert run(cursor.advance("s", 0, ["u1"])) == (1, [0])
+    assert run(cursor.advance("s", 1, ["a1", "u2"])) == (3, [0, 1])
+
+
+def test_advance_rejects_a_stale_base_version(redis):
+    cursor = ChatCursor(prefix="test:cursor", ttl=0)
+    run(cursor.advance("s", 0, ["u1", "a1"]))
+    with pytest.raises(CursorConflict) as conflict:
+        run(cursor.advance("s", 1, ["u2"]))
+    assert conflict.value.version == 2
+    # Nothing was recorded by the rejected request
+    assert run(cursor.advance("s", 2, ["u2"])) == (3, [0])
+
+
+def test_advance_drops_duplicates(redis):
+    cursor = ChatCursor(prefix="test:cursor", ttl=0)
+    run(cursor.advance("s", 0, ["u1"]))
+    # A retried request: its base is behind by the ids the session already holds
+    assert run(cursor.advance("s", 0, ["u1", "u2"])) == (2, [1])
+    # The same id twice in one request counts once
+    assert run(cursor.advance("s", 2, ["u3", "u3"])) == (3, [0])
+
+
+def test_retry_of_a_finished_turn_accepts_nothing(redis):
+    cursor = ChatCursor(prefix="test:cursor", ttl=0)
+    run(cursor.advance("s", 0, ["u1"]))
+    assert run(cursor.advance("s", 0, ["u1"])) == (1, [])
+
+
+def test_rewind_lets_the_retry_through(redis):
+    cursor = ChatCursor(prefix="test:cursor", ttl=0)
+    run(cursor.advance("s", 0, ["u1"]))
+    version, accepted = run(cursor.advance("s", 1, ["u2"]))
+    assert run(cursor.rewind("s", version, ["u2"]))
+    assert run(cursor.advance("s", 1, ["u2"])) == (2, [0])
+
+
+def test_rewind_keeps_a_version_built_upon(redis):
+    cursor = ChatCursor(prefix="test:cursor", ttl=0)
+    run(cursor.advance("s", 0, ["u1"]))
+    run(cursor.advance("s", 1, ["u2"]))
+    assert not run(cursor.rewind("s", 1, ["u1"]))
+    assert run(cursor.advance("s", 2, ["u3"])) == (3, [0])
+
+
+def test_recent_ids_are_trimmed(redis):
+    cursor = ChatCursor(prefix="test:cursor", recent_ids=2, ttl=0)
+    run(cursor.advance("s", 0, ["m1", "m2", "m3"]))
+    _, ids_key = cursor._keys("s")
+    assert run(redis.zrange(ids_key, 0, -1)) == ["m2", "m3"]
+    # A trimmed id is no longer recognised: it counts as a new message
+    assert run(cursor.advance("s", 3, ["m1"])) == (4, [0])
+
+
+def test_ttl_and_delete(redis):
+    cursor = ChatCursor(prefix="test:cursor", ttl=60)
+    run(cursor.advance("s", 0, ["u1"]))
+    assert all(0 < run(redis.ttl(key)) <= 60 for key in cursor._keys("s"))
+    run(cursor.delete("s"))
+    assert run(redis.exists(*cursor._keys("s"))) == 0
+    assert run(cursor.advance("s", 0, ["u1"])) == (1, [0])
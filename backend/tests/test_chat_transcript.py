@@ -0,0 +1,90 @@
+import asyncio
+
+import numpy as np
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")  # fakeredis runs EVAL through lupa
+
+from app.chatstore import redis_client
+from app.chatstore.codec import TRANSCRIPT_FIELD, decode_transcript, encode_transcript
+from app.chatstore.sharding import index_router
+
+TOPICS = ["kho", "pallet", "xe nâng", "hóa đơn"]
+
+
+def topic_vector(topic: str) -> np.ndarray:
+    vector = np.zeros(8, dtype=np.float32)
+    vector[TOPICS.index(topic)] = 1.0
+    return vector
+
+
+async def fake_embedding(text: str) -> list[float]:
+    # One axis per topic mentioned in the text
+    vector = sum((topic_vector(t) for t in TOPICS if t in text), np.zeros(8, dtype=np.float32))
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def cosine(a: bytes, b: np.ndarray) -> float:
+    a = np.frombuffer(a, dtype=np.float32)
+    return float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+class FakeManager:
+    cluster = False
+
+    def __init__(self):
+        self.client = fakeredis.FakeAsyncRedis()
+
+    def aio(self, decode: bool = True):
+        return self.client
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    manager = FakeManager()
+    monkeypatch.setattr(redis_client, "redis_manager", manager)
+    monkeypatch.setattr(redis_client, "_append_script", None)
+    return manager.client
+
+
+def turn(question: str, answer: str) -> list:
+    return [HumanMessage(content=question), AIMessage(content=answer)]
+
+
+def test_early_turn_stays_searchable(redis):
+    key = index_router.key("agent", "u", "s")
+    first = redis_client.messages_to_entries(turn("kho nào còn trống?", "kho B"))
+
+    async def scenario():
+        # The session as its first save left it
+        await redis.hset(key, mapping={
+            TRANSCRIPT_FIELD: encode_transcript(first),
+            "embedding": topic_vector("kho").tobytes(),
+            redis_client.EMBEDDING_TURNS_FIELD: 1,
+        })
+        for question in ("pallet loại nào?", "xe nâng ở đâu?"):
+            await redis_client.append_chat_to_vector(
+                "agent", "u", "s", turn(question, "ok"), embedding_fn=fake_embedding
+            )
+        return await redis.hgetall(key)
+
+    doc = asyncio.run(scenario())
+    assert len(decode_transcript(doc[TRANSCRIPT_FIELD.encode()])) == 6
+    assert doc[redis_client.EMBEDDING_TURNS_FIELD.encode()] == b"3"
+    session = doc[b"embedding"]
+    # Every turn pulls the vector towards its topic, the first one included
+    for topic in ("kho", "pallet", "xe nâng"):
+        assert cosine(session, topic_vector(topic)) == pytest.approx(1 / np.sqrt(3), rel=1e-5)
+    assert cosine(session, topic_vector("hóa đơn")) == 0.0
+
+
+def test_mean_embedding_of_a_vector_saved_before_the_mean():
+    old = topic_vector("kho").tobytes()
+    new = topic_vector("pallet").tobytes()
+    mean = np.frombuffer(redis_client.mean_embedding(old, 1, new), dtype=np.float32)
+    assert mean[:2].tolist() == [0.5, 0.5]
+    # No usable vector yet: the turn's own
+    assert redis_client.mean_embedding(None, 0, new) == new
+    assert redis_client.mean_embedding(np.zeros(4, dtype=np.float32).tobytes(), 2, new) == new
@@ -0,0 +1,105 @@
+import pytest
+
+from app.langgraph.inventory_snapshot import InventorySnapshot, SnapshotFile, encode_snapshot
+
+
+def make_item(item_id: str, name: str, **fields) -> dict:
+    item = {
+        "id": item_id,
+        "name": name,
+        "type": "box",
+        "status": "available",
+        "location": "Kho A",
+        "quantity": 1.0,
+        "unit": "cái",
+        "weight": 2.5,
+        "dimensions": {"length": 10.0, "width": 20.0, "height": 30.0},
+        "created_at": "2024-01-01",
+        "updated_at": "2024-01-02",
+        "tags": ["a", "b"],
+        "metadata": {"màu": "đỏ"},
+        "images": ["x.png"],
+    }
+    item.update(fields)
+    return item
+
+
+ITEMS = {
+    "id-2": make_item("id-2", "Thùng gỗ", status="reserved", quantity=5.0),
+    "id-1": make_item("id-1", "abc", tags=[], metadata={}, images=[]),
+    "id-3": make_item("id-3", "cde", location="Kho B"),
+}
+
+
+@pytest.fixture
+def snapshot() -> InventorySnapshot:
+    return InventorySnapshot(encode_snapshot(7, ITEMS))
+
+
+def test_round_trip(snapshot):
+    assert snapshot.version == 7
+    assert len(snapshot) == 3
+    assert list(snapshot) == ["id-1", "id-2", "id-3"]
+    assert dict(snapshot) == ITEMS
+
+
+def test_row_of(snapshot):
+    assert [snapshot.row_of(item_id) for item_id in ("id-1", "id-2", "id-3")] == [0, 1, 2]
+    assert snapshot.row_of("id-0") is None
+    assert snapshot.row_of("id-4") is None
+    assert snapshot.row_of("id-15") is None
+    with pytest.raises(KeyError):
+        snapshot["missing"]
+
+
+def test_columns(snapshot):
+    assert snapshot.column("quantity").tolist() == [1.0, 5.0, 1.0]
+    assert snapshot.volume().tolist() == pytest.approx([0.006] * 3)
+    assert snapshot.rows_where("status", "RESERVED").tolist() == [1]
+
+
+def test_search_at_row_boundaries(snapshot):
+    # name_lc rows are "abc" | "thùng gỗ" | "cde" back to back in the blob
+    assert snapshot.search("name_lc", "abc") == [0]  # the first bytes of the blob
+    assert snapshot.search("name_lc", "cde") == [2]  # the last bytes of the blob
+    assert snapshot.search("name_lc", "gỗ") == [1]  # multi-byte, ends its row
+    # A match may not run across two rows
+    assert snapshot.search("name_lc", "cth") == []
+    assert snapshot.search("name_lc", "gỗc") == []
+    assert snapshot.search("name_lc", "c") == [0, 2]
+    assert snapshot.search("name_lc", "c", limit=1) == [0]
+
+
+def test_empty_inventory():
+    snapshot = InventorySnapshot(encode_snapshot(0, {}))
+    assert len(snapshot) == 0
+    assert list(snapshot.values()) == []
+    assert snapshot.row_of("id-1") is None
+    assert snapshot.search("haystack", "a") == []
+    assert snapshot.rows_where("status", "available").tolist() == []
+    assert snapshot.volume().tolist() == []
+
+
+def test_rejects_other_buffers():
+    with pytest.raises(ValueError):
+        InventorySnapshot(b"\0" * 64)
+
+
+def test_snapshot_file_rebuilds_on_version_mismatch(tmp_path):
+    snapshots = SnapshotFile(str(tmp_path / "inventory.snap"))
+    fetched = []
+
+    def fetch():
+        fetched.append(True)
+        return ITEMS
+
+    assert snapshots.load(3, fetch).version == 3
+    assert snapshots.load(3, fetch).version == 3
+    assert len(fetched) == 1
+
+    # A file from another version is rebuilt, newer versions included
+    snapshots.publish(5, {"id-9": make_item("id-9", "khác")})
+    loaded = snapshots.load(4, fetch)
+    assert loaded.version == 4
+    assert list(loaded) == ["id-1", "id-2", "id-3"]
+    assert len(fetched) == 2
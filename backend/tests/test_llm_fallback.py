@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessageChunk
+
+from app.langgraph import llm
+from app.langgraph.llm import FirstTokenTimeout, LLMEndpoint
+
+
+class FakeModel:
+    """Streams a role-only chunk at once, then its reply after ``delay`` seconds."""
+
+    def __init__(self, reply: str, delay: float):
+        self.reply = reply
+        self.delay = delay
+
+    def bind_tools(self, tools):
+        return self
+
+    async def astream(self, messages, config):
+        yield AIMessageChunk(content="")
+        await asyncio.sleep(self.delay)
+        yield AIMessageChunk(content=self.reply)
+
+
+def use_models(monkeypatch, *models: FakeModel):
+    endpoints = [(LLMEndpoint(f"m{i}"), model) for i, model in enumerate(models)]
+    monkeypatch.setattr(llm, "get_chat_models", lambda: endpoints)
+
+
+def test_falls_back_when_the_first_token_is_late(monkeypatch):
+    use_models(monkeypatch, FakeModel("slow", 1.0), FakeModel("fast", 0.0))
+    response = asyncio.run(llm.ainvoke_with_fallback([], first_token_timeout=0.05))
+    assert response.content == "fast"
+
+
+def test_deadline_applies_to_the_only_endpoint(monkeypatch):
+    use_models(monkeypatch, FakeModel("slow", 1.0))
+    with pytest.raises(FirstTokenTimeout):
+        asyncio.run(llm.ainvoke_with_fallback([], first_token_timeout=0.05))
+
+
+def test_zero_disables_the_deadline(monkeypatch):
+    use_models(monkeypatch, FakeModel("slow", 0.1))
+    assert asyncio.run(llm.ainvoke_with_fallback([], first_token_timeout=0)).content == "slow"
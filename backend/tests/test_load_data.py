@@ -0,0 +1,38 @@
+from app.langgraph.inventory_snapshot import InventorySnapshot, encode_snapshot
+from app.routes.load_data import snapshot_items
+
+
+def uploaded_doc(**fields) -> dict:
+    # Values as upload_excel builds them from openpyxl cells
+    doc = {
+        "id": "OBJ-1",
+        "name": "Thùng",
+        "type": "box",
+        "status": "available",
+        "location": "Kho A",
+        "quantity": 3.0,
+        "unit": "cái",
+        "weight": 1.5,
+        "dim_length": 10.0,
+        "dim_width": 20.0,
+        "dim_height": 30.0,
+        "created_at": "2024-01-01",
+        "updated_at": "2024-01-02",
+        "tags": "a,b",
+        "metadata": "{}",
+        "images": "[]",
+        "embedding": b"\0" * 8,
+    }
+    doc.update(fields)
+    return doc
+
+
+def test_numeric_ids_are_stored_as_strings():
+    items = snapshot_items([uploaded_doc(id=101), uploaded_doc(id=7.5, quantity=2)])
+    assert sorted(items) == ["101", "7.5"]
+    assert items["101"]["id"] == "101"
+    assert items["7.5"]["quantity"] == 2.0
+
+    snapshot = InventorySnapshot(encode_snapshot(1, items))
+    assert snapshot["101"]["dimensions"] == {"length": 10.0, "width": 20.0, "height": 30.0}
+    assert snapshot.row_of("7.5") == 1